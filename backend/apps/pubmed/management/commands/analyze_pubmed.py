@@ -5,6 +5,7 @@ from django.core.management.base import BaseCommand
 from django.db import connection
 
 from pubmed.models import PubmedArticle
+from pubmed.utils import vector_index
 
 
 class Command(BaseCommand):
@@ -13,7 +14,8 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('-o', '--option', help='analyze or index', default='analyze', choices=['analyze', 'index'])
         parser.add_argument('--field', help='field name', default='title_abstract_vec')
-        parser.add_argument('--lists', help='lists', default=200, type=int)
+        parser.add_argument('--method', help='vector index method, default from settings.VECTOR_INDEXES', choices=vector_index.METHODS)
+        parser.add_argument('--lists', help='IVFFlat lists, default: rows / 1000', type=int)
 
 
     def handle(self, *args, **kwargs):
@@ -21,25 +23,20 @@ class Command(BaseCommand):
         option = kwargs['option']
         field = kwargs['field']
         lists = kwargs['lists']
+        method = kwargs['method'] or ('ivfflat' if lists else None)
 
         table = PubmedArticle._meta.db_table
 
-        analyze_sql = f'ANALYZE {table}'
+        if option == 'index':
+            # 索引参数见 settings.VECTOR_INDEXES，更多选项使用 vector_index 命令
+            config = vector_index.get_config(field, method=method, lists=lists)
+            vector_index.build_index(field, config, log=loguru.logger.info)
+            loguru.logger.info('Done')
+            return
 
-        index_sql = f'''
-            CREATE INDEX CONCURRENTLY {field}_hnsw_idx
-            ON {table}
-            USING hnsw ({field} vector_cosine_ops)
-            WITH (m = 16, ef_construction = 200);
-        '''
-        
+        sql = f'ANALYZE {table}'
         with connection.cursor() as cursor:
-            if option == 'analyze':
-                sql = analyze_sql
-            else:
-                sql = index_sql
             loguru.logger.debug(f'>>> run sql: {sql}')
-
             cursor.execute(sql)
 
         loguru.logger.info('Done')
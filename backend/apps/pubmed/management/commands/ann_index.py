@@ -0,0 +1,61 @@
+import time
+
+import loguru
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from pubmed.utils import ann_index
+from pubmed.utils.pool import SEARCH_DB
+from pubmed.utils.search import get_query_vector, vector_queryset
+from pubmed.utils.vector_index import cosine_distance
+
+
+class Command(BaseCommand):
+    help = 'Export vectors to the memory-mapped ANN index used by VECTOR_BACKEND=mmap'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-o', '--operation', help='operation', default='status', choices=['export', 'status', 'test'])
+        parser.add_argument('--field', help='vector field', default='title_abstract_vec')
+        parser.add_argument('--dtype', help='dtype of the exported matrix', default='float16', choices=['float16', 'float32'])
+        parser.add_argument('--nlist', help='number of IVF lists, default: 4 * sqrt(rows)', type=int)
+        parser.add_argument('-b', '--batch-size', help='rows fetched per batch', type=int, default=10000)
+        parser.add_argument('-q', '--query', help='query for the test operation', action='append')
+        parser.add_argument('-k', '--top-k', help='top k for the test operation', type=int, default=10)
+        parser.add_argument('--year-start', help='year_start for the test operation')
+        parser.add_argument('--factor-min', help='factor_min for the test operation')
+
+    def handle(self, *args, **kwargs):
+        operation = kwargs['operation']
+        field = kwargs['field']
+        log = loguru.logger.info
+
+        if operation == 'export':
+            ann_index.export(field, dtype=kwargs['dtype'], nlist=kwargs['nlist'], batch_size=kwargs['batch_size'], log=log)
+        elif operation == 'status':
+            log(ann_index.status(field) or f'no snapshot for {field} in {ann_index.INDEX_DIR}')
+        elif operation == 'test':
+            index = ann_index.get_index(field)
+            if index is None:
+                raise CommandError(f'no snapshot for {field}, run with -o export first')
+            filters = {key: kwargs[key] for key in ('year_start', 'factor_min') if kwargs[key]}
+            k = kwargs['top_k']
+            for query in kwargs['query'] or ['cancer immunotherapy']:
+                vector = get_query_vector(query)
+
+                start = time.perf_counter()
+                mmap_pmids = index.search(vector, k, filters=filters)
+                mmap_ms = (time.perf_counter() - start) * 1000
+
+                start = time.perf_counter()
+                pg_pmids = list(
+                    vector_queryset(SEARCH_DB, filters)
+                    .annotate(distance=cosine_distance(field, np.array(vector)))
+                    .order_by('distance')
+                    .values_list('pk', flat=True)[:k]
+                )
+                pg_ms = (time.perf_counter() - start) * 1000
+
+                overlap = len(set(mmap_pmids) & set(pg_pmids)) / max(len(pg_pmids), 1)
+                log(f'{query!r}: mmap {mmap_ms:.1f}ms, pgvector {pg_ms:.1f}ms, overlap@{k} {overlap:.2f}')
+
+        log('Done')
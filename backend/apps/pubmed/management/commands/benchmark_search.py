@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import asyncio
+import datetime
+import concurrent.futures
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F
+from pgvector.django import CosineDistance
+
+from pubmed.models import PubmedArticle
+from pubmed.utils import benchmark
+from pubmed.utils.pool import SEARCH_DB
+from pubmed.utils.search import hybrid_search, hydrate, apply_filters, get_query_vector, vector_queryset
+
+
+def base_queryset(filters):
+    return apply_filters(PubmedArticle.objects.using(SEARCH_DB), **filters)
+
+
+def engine_hybrid(item, top_k):
+    results = hybrid_search(item['q'], base_queryset(item['filters']), top_k=top_k, filters=item['filters'])
+    return [row['pmid'] for row in results]
+
+
+def engine_vector(item, top_k):
+    vector = np.array(get_query_vector(item['q']))
+    pmids = list(
+        vector_queryset(SEARCH_DB, item['filters'])
+        .annotate(distance=CosineDistance('title_abstract_vec', vector))
+        .order_by('distance')
+        .values_list('pk', flat=True)[:top_k]
+    )
+    return [row['pmid'] for row in hydrate(base_queryset(item['filters']), pmids)]
+
+
+def engine_lexical(item, top_k):
+    qs = base_queryset(item['filters'])
+    rank = SearchRank(F('ts_en'), SearchQuery(item['q'], config='english'))
+    pmids = list(
+        qs.annotate(rank=rank)
+        .extra(where=["ts_en @@ plainto_tsquery('english', %s)"], params=[item['q']])
+        .order_by('-rank')
+        .values_list('pmid', flat=True)[:top_k]
+    )
+    return [row['pmid'] for row in hydrate(qs, pmids)]
+
+
+class AsyncEngine(object):
+    """异步检索：在同一个事件循环中并发执行，连接池绑定在该事件循环上
+
+    不能逐条调用，由 run 自行完成预热和并发执行
+    """
+    is_async = True
+
+    def run(self, workload, top_k, concurrency, warmup):
+        from pubmed.utils.async_search import hybrid_search_async
+
+        async def search(item):
+            results = await hybrid_search_async(item['q'], item['filters'], top_k=top_k)
+            return [row['pmid'] for row in results]
+
+        async def main():
+            for item in workload[:warmup]:
+                await search(item)
+
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def timed(item):
+                async with semaphore:
+                    start = time.perf_counter()
+                    try:
+                        pmids = await search(item)
+                        return time.perf_counter() - start, pmids, None
+                    except Exception as e:
+                        return time.perf_counter() - start, [], str(e)
+
+            start_time = time.perf_counter()
+            outputs = await asyncio.gather(*[timed(item) for item in workload])
+            return outputs, time.perf_counter() - start_time
+
+        return asyncio.run(main())
+
+
+ENGINES = {
+    'hybrid': engine_hybrid,
+    'vector': engine_vector,
+    'lexical': engine_lexical,
+    'hybrid_async': AsyncEngine(),
+}
+
+
+def exact_search(item, top_k):
+    """精确 kNN：关闭索引扫描，得到 recall 计算的 ground truth
+    """
+    vector = np.array(get_query_vector(item['q']))
+    with transaction.atomic(using=SEARCH_DB):
+        with connections[SEARCH_DB].cursor() as cursor:
+            cursor.execute('SET LOCAL enable_indexscan = off')
+            cursor.execute('SET LOCAL enable_bitmapscan = off')
+            return list(
+                vector_queryset(SEARCH_DB, item['filters'])
+                .annotate(distance=CosineDistance('title_abstract_vec', vector))
+                .order_by('distance')
+                .values_list('pk', flat=True)[:top_k]
+            )
+
+
+def run_engine(engine, workload, top_k, concurrency, warmup):
+    if getattr(engine, 'is_async', False):
+        return engine.run(workload, top_k, concurrency, warmup)
+
+    for item in workload[:warmup]:
+        engine(item, top_k)
+
+    def timed(item):
+        start = time.perf_counter()
+        try:
+            pmids = engine(item, top_k)
+            return time.perf_counter() - start, pmids, None
+        except Exception as e:
+            return time.perf_counter() - start, [], str(e)
+
+    start_time = time.perf_counter()
+    if concurrency > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outputs = list(executor.map(timed, workload))
+    else:
+        outputs = [timed(item) for item in workload]
+    total_time = time.perf_counter() - start_time
+
+    return outputs, total_time
+
+
+class Command(BaseCommand):
+    help = 'Offline search benchmark with a synthetic corpus and fake embeddings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schema', help='schema for the synthetic corpus', default='bench')
+        parser.add_argument('--generate', help='generate a synthetic corpus of N articles', type=int, default=0)
+        parser.add_argument('--seed', help='random seed', type=int, default=42)
+        parser.add_argument('--m', help='HNSW m', type=int, default=16)
+        parser.add_argument('--ef-construction', help='HNSW ef_construction', type=int, default=200)
+        parser.add_argument('-e', '--engines', help='engines to run', nargs='*', default=list(ENGINES), choices=list(ENGINES))
+        parser.add_argument('-n', '--queries', help='number of queries', type=int, default=200)
+        parser.add_argument('-k', '--top-k', help='top_k', type=int, default=10)
+        parser.add_argument('-c', '--concurrency', help='concurrent clients', type=int, default=1)
+        parser.add_argument('--warmup', help='warmup queries per engine', type=int, default=10)
+        parser.add_argument('--ef-search', help='hnsw.ef_search for this run', type=int)
+        parser.add_argument('-o', '--output', help='output json file', default=None)
+        parser.add_argument('--compare', help='compare result json files', nargs='+')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['compare']:
+            return self.compare(kwargs['compare'])
+
+        schema = kwargs['schema']
+        if schema == 'public':
+            raise CommandError('refuse to run benchmark in the public schema')
+
+        # 离线运行：假 embedding、不采样慢查询、不使用文章缓存
+        os.environ['EMBEDDING_PROVIDER'] = 'fake'
+        settings.SLOW_QUERY_THRESHOLD_MS = 0
+        # 合成语料的 pmid 会与正式数据冲突，不能读写文章缓存
+        settings.ARTICLE_CACHE_ENABLED = False
+        if kwargs['ef_search']:
+            settings.SEARCH_SESSION_PARAMS['hnsw.ef_search'] = kwargs['ef_search']
+            options = connections[SEARCH_DB].settings_dict.setdefault('OPTIONS', {})
+            options['options'] = ' '.join(f'-c {k}={v}' for k, v in settings.SEARCH_SESSION_PARAMS.items())
+
+        if kwargs['generate']:
+            benchmark.create_corpus(
+                schema,
+                kwargs['generate'],
+                seed=kwargs['seed'],
+                m=kwargs['m'],
+                ef_construction=kwargs['ef_construction'],
+                log=logger.info,
+            )
+
+        benchmark.set_search_path(schema, aliases=[SEARCH_DB])
+
+        total = PubmedArticle.objects.using(SEARCH_DB).count()
+        logger.info(f'>>> corpus: {schema}.pubmed_articles, {total} articles')
+
+        workload = benchmark.build_workload(kwargs['queries'], seed=kwargs['seed'])
+        top_k = kwargs['top_k']
+
+        logger.info('>>> computing exact ground truth ...')
+        truth = [exact_search(item, top_k) for item in workload]
+
+        report = {
+            'created_at': datetime.datetime.now().isoformat(),
+            'config': {key: kwargs[key] for key in ('schema', 'seed', 'queries', 'top_k', 'concurrency', 'engines')},
+            'session': dict(settings.SEARCH_SESSION_PARAMS),
+            'corpus': {'articles': total},
+            'results': {},
+        }
+
+        for name in kwargs['engines']:
+            engine = ENGINES[name]
+            logger.info(f'>>> running engine: {name}')
+            outputs, total_time = run_engine(engine, workload, top_k, kwargs['concurrency'], kwargs['warmup'])
+
+            latencies = [latency for latency, _, error in outputs if error is None]
+            recalls = [
+                benchmark.recall_at_k(pmids, gt, top_k)
+                for (_, pmids, error), gt in zip(outputs, truth) if error is None
+            ]
+            recalls = [r for r in recalls if r is not None]
+            errors = [error for _, _, error in outputs if error is not None]
+
+            result = benchmark.summarize_latencies(latencies, total_time)
+            result['recall_at_k'] = round(float(np.mean(recalls)), 4) if recalls else None
+            result['errors'] = len(errors)
+            if errors:
+                result['first_error'] = errors[0]
+            report['results'][name] = result
+            logger.info(f'{name}: {result}')
+
+        output = kwargs['output'] or f'bench_results/benchmark_{datetime.datetime.now():%Y%m%d_%H%M%S}.json'
+        Path(output).parent.mkdir(parents=True, exist_ok=True)
+        with open(output, 'w') as out:
+            json.dump(report, out, indent=2)
+        logger.info(f'>>> save result to: {output}')
+
+    def compare(self, files):
+        reports = [json.load(open(f)) for f in files]
+        engines = sorted(set(e for r in reports for e in r['results']))
+        columns = ['p50_ms', 'p95_ms', 'p99_ms', 'qps', 'recall_at_k']
+        print('engine\tfile\t' + '\t'.join(columns))
+        for engine in engines:
+            for f, report in zip(files, reports):
+                result = report['results'].get(engine)
+                if result:
+                    print(f'{engine}\t{Path(f).name}\t' + '\t'.join(str(result.get(c)) for c in columns))
@@ -5,6 +5,7 @@ from django.core.management.base import BaseCommand
 from django.db import transaction, connection
 
 from pubmed.models import PubmedArticle
+from pubmed.utils.articles import save_vectors
 import utils
 
 
@@ -19,7 +20,12 @@ class Command(BaseCommand):
 
         start_time = time.time()
 
-        qs = PubmedArticle.objects.filter(title_abstract_vector__isnull=True).values('pmid', 'title', 'abstract')
+        qs = (
+            PubmedArticle.objects
+            .exclude(vectors__title_abstract_vector__isnull=False)
+            .order_by('pmid')
+            .values('pmid', 'title', 'abstract')
+        )
 
         total = qs.count()
         logger.info(f"Total articles to process: {total}")
@@ -37,17 +43,10 @@ class Command(BaseCommand):
             vectors = embeddings.embed_documents(texts)
 
             # --- ⭐ 批量更新数据库 (第二关键优化点) ---
-            objs = []
-            for row, vec in zip(batch, vectors):
-                objs.append(
-                    PubmedArticle(pmid=row['pmid'], title_abstract_vector=vec)
-                )
-
-            with transaction.atomic():
-                PubmedArticle.objects.bulk_update(
-                    objs,
-                    ['title_abstract_vector'],
-                    batch_size=2000,   # PostgreSQL 一般没问题
-                )
+            save_vectors(
+                [(row['pmid'], vec) for row, vec in zip(batch, vectors)],
+                'title_abstract_vector',
+                batch_size=2000,   # PostgreSQL 一般没问题
+            )
 
         logger.info(f"Finished in {time.time() - start_time:.2f} seconds")
\ No newline at end of file
@@ -8,7 +8,7 @@ import concurrent.futures
 from django.core.management.base import BaseCommand
 from django.db import transaction, connection
 
-from pubmed.models import PubmedArticle
+from pubmed.utils.articles import save_vectors
 import utils
 
 
@@ -36,13 +36,7 @@ class Command(BaseCommand):
 
         complete_count = 0
         for batch_data in read_jsonl_batches(input_file, batch_size):
-            objs = [PubmedArticle(pmid=row['pmid'], title_abstract_vec=row['vec']) for row in batch_data]
-            with transaction.atomic():
-                PubmedArticle.objects.bulk_update(
-                    objs,
-                    ['title_abstract_vec'],
-                    batch_size=2000,
-                )
+            save_vectors([(row['pmid'], row['vec']) for row in batch_data], 'title_abstract_vec', batch_size=2000)
             complete_count += len(batch_data)
             logger.debug(f'Processed {complete_count} articles')
 
@@ -0,0 +1,31 @@
+import loguru
+from django.core.management.base import BaseCommand
+
+from pubmed.utils import facets
+
+
+class Command(BaseCommand):
+    help = 'Manage the materialized view used by the facets endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-o', '--operation', help='operation', default='refresh', choices=['refresh', 'drop', 'test'])
+        parser.add_argument('-q', '--query', help='query for the test operation', default='')
+        parser.add_argument('--year-start', help='year_start for the test operation')
+        parser.add_argument('--year-end', help='year_end for the test operation')
+
+    def handle(self, *args, **kwargs):
+        operation = kwargs['operation']
+        log = loguru.logger.info
+
+        if operation == 'refresh':
+            facets.refresh_rollup(log=log)
+        elif operation == 'drop':
+            facets.drop_rollup()
+        elif operation == 'test':
+            filters = {'year_start': kwargs['year_start'], 'year_end': kwargs['year_end']}
+            result = facets.compute(kwargs['query'], filters, top=10)
+            log(f'total: {result["total"]}, mode: {result["mode"]}, approximate: {result["approximate"]}')
+            for facet, values in result['facets'].items():
+                print(facet, ', '.join(f'{item["value"]}: {item["count"]}' for item in values))
+
+        log('Done')
@@ -5,6 +5,7 @@ from django.core.management.base import BaseCommand
 from django.db import connection
 
 from pubmed.models import PubmedArticle
+from pubmed.utils.query_parser import FIELD_INDEXES
 
 
 all_index_fields = [
@@ -12,10 +13,12 @@ all_index_fields = [
     # 'abstract',
     'year',
     # 'pubmed_pubdate',
-    # 'authors',
     # 'affiliations',
-    'factor',
-    # 'pub_types',
+    # 字段查询（author:、journal:、keyword:、type:）使用的 GIN 索引
+    'authors',
+    'journal',
+    'keywords',
+    'pub_types',
 ]
 
 
@@ -51,7 +54,7 @@ class Command(BaseCommand):
         
         with connection.cursor() as cursor:
             for field in fields:
-                index_name = f'{table}_{field}_idx'
+                index_name = f'{table}_{field}_gin_idx' if field in FIELD_INDEXES else f'{table}_{field}_idx'
                 if field not in available_fields:
                     loguru.logger.warning(f'Field {field} not available')
                     continue
@@ -66,6 +69,9 @@ class Command(BaseCommand):
                             ) STORED;
                             CREATE INDEX {table}_ts_en_idx ON {table} USING GIN (ts_en);
                         '''
+                    elif field in FIELD_INDEXES:
+                        # gin_trgm_ops 由 pg_trgm 扩展提供，扩展在 0013 迁移中创建
+                        sql = f'CREATE INDEX IF NOT EXISTS {index_name} ON {table} {FIELD_INDEXES[field]}'
                     else:
                         sql = f'CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({field})'
                 elif operation == 'remove':
@@ -9,7 +9,8 @@ import loguru
 from django.core.management.base import BaseCommand
 from django.db import transaction, connection
 
-from pubmed.models import PubmedArticle
+from pubmed.models import PubmedArticle, PubmedArticleKey
+from pubmed.utils import articles
 import utils
 
 
@@ -25,8 +26,7 @@ def load_json_data(json_file):
 def get_bulk_articles(json_file, batch_size):
     bulk_articles = []
     for data in load_json_data(json_file):
-        article = PubmedArticle(**data)
-        bulk_articles.append(article)
+        bulk_articles.append(data)
         if len(bulk_articles) == batch_size:
             yield bulk_articles
             bulk_articles = []
@@ -42,7 +42,7 @@ def bulk_create_articles(data_path, batch_size):
         with transaction.atomic():
             count = 0
             for bulk_articles in get_bulk_articles(json_file, batch_size):
-                PubmedArticle.objects.bulk_create(bulk_articles)
+                articles.bulk_create_articles(bulk_articles)
                 count += len(bulk_articles)
                 sys.stderr.write(f'\r>>> {count} articles loaded')
                 sys.stderr.flush()
@@ -60,9 +60,9 @@ def create_article(data_path, mode):
                 pmid = data['pmid']
                 try:
                     if mode == 'insert':
-                        PubmedArticle.objects.create(**data)
+                        articles.create_article(data)
                     elif mode == 'update':
-                        PubmedArticle.objects.update_or_create(pmid=pmid, defaults=data)
+                        articles.save_article(data)
                     if n % 1000 == 0:
                         sys.stderr.write(f'\r>>> {n} articles loaded')
                         sys.stderr.flush()
@@ -90,6 +90,7 @@ class Command(BaseCommand):
 
         if kwargs['drop']:
             PubmedArticle.objects.all().delete()
+            PubmedArticleKey.objects.all().delete()
             loguru.logger.debug('deleted all existing PubmedArticle data')
 
         if batch_size > 1:
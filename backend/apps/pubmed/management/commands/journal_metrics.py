@@ -0,0 +1,38 @@
+import loguru
+from django.core.management.base import BaseCommand
+
+from pubmed.models import Journal
+from pubmed.utils import journals, facets
+
+
+class Command(BaseCommand):
+    help = 'Refresh journal metrics (factor, jcr, zky) in the journal dimension table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-o', '--operation', help='operation', default='refresh', choices=['refresh', 'counts', 'stats'])
+        parser.add_argument('-f', '--file', help='metrics file (csv/tsv/jsonl), default to query impact_factor')
+        parser.add_argument('-b', '--batch-size', help='batch size of bulk update', type=int, default=2000)
+        parser.add_argument('--skip-rollup', help='do not refresh the facet rollup', action='store_true')
+
+    def handle(self, *args, **kwargs):
+        operation = kwargs['operation']
+        log = loguru.logger.info
+
+        if operation == 'refresh':
+            if kwargs['file']:
+                log(f'>>> reading metrics from {kwargs["file"]}')
+                metrics = journals.read_metrics(kwargs['file'])
+            else:
+                log('>>> querying metrics with impact_factor')
+                metrics = journals.lookup_impact_factor(Journal.objects.values('issn', 'e_issn').iterator())
+            updated = journals.update_metrics(metrics, batch_size=kwargs['batch_size'], log=log)
+            journals.update_counts(log=log)
+            if updated and not kwargs['skip_rollup'] and facets.rollup_exists():
+                # 物化视图中的 jcr 分布随指标变化
+                facets.refresh_rollup(log=log)
+        elif operation == 'counts':
+            journals.update_counts(log=log)
+        elif operation == 'stats':
+            log(journals.stats())
+
+        log('Done')
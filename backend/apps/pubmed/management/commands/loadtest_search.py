@@ -0,0 +1,240 @@
+import json
+import time
+import random
+import asyncio
+import datetime
+from pathlib import Path
+
+import httpx
+from loguru import logger
+from django.core.management.base import BaseCommand, CommandError
+
+from pubmed.utils.benchmark import summarize_latencies, CURRENT_YEAR
+
+
+DEFAULT_QUERIES = [
+    'breast cancer immunotherapy',
+    'alzheimer disease amyloid',
+    'covid-19 vaccine efficacy',
+    'crispr gene editing',
+    'gut microbiome obesity',
+    'type 2 diabetes metformin',
+    'single cell rna sequencing',
+    'sepsis mortality biomarkers',
+    'deep learning medical imaging',
+    'hypertension randomized trial',
+    'lung cancer egfr mutation',
+    'depression cognitive behavioral therapy',
+    'antibiotic resistance klebsiella',
+    'stroke thrombectomy outcome',
+    'parkinson disease alpha synuclein',
+]
+
+# endpoint: 权重
+DEFAULT_ENDPOINTS = {
+    'hybrid_search': 0.7,
+    'search': 0.2,
+    'similar': 0.1,
+}
+
+PAGE_DEPTHS = [(0, 0.7), (10, 0.15), (50, 0.1), (90, 0.05)]
+
+
+def weighted_choice(rng, items):
+    """items: [(value, weight), ...]
+    """
+    r = rng.random() * sum(w for _, w in items)
+    for value, weight in items:
+        r -= weight
+        if r <= 0:
+            return value
+    return items[-1][0]
+
+
+class Workload(object):
+    """可复现的请求生成器：查询、过滤条件、翻页深度按固定分布组合
+    """
+
+    def __init__(self, queries=None, endpoints=None, pmids=None, seed=42):
+        self.rng = random.Random(seed)
+        self.queries = queries or DEFAULT_QUERIES
+        self.endpoints = list((endpoints or DEFAULT_ENDPOINTS).items())
+        self.pmids = pmids or []
+
+    def next(self):
+        endpoint = weighted_choice(self.rng, self.endpoints)
+        params = {
+            'top_k': self.rng.choice([10, 10, 10, 20, 50]),
+            'start': weighted_choice(self.rng, PAGE_DEPTHS),
+        }
+        r = self.rng.random()
+        if r < 0.3:
+            params['year_start'] = CURRENT_YEAR - self.rng.randint(0, 3)
+        elif r < 0.5:
+            params['factor_min'] = self.rng.choice([3, 5, 10])
+
+        if endpoint == 'similar':
+            if not self.pmids:
+                endpoint = 'hybrid_search'
+            else:
+                params['id'] = ','.join(map(str, self.rng.sample(self.pmids, self.rng.randint(1, 3))))
+        if endpoint == 'search':
+            params = {'top_k': params['top_k'], 'start': params['start'], 'year': params.get('year_start')}
+        if 'id' not in params:
+            params['q'] = self.rng.choice(self.queries)
+
+        return endpoint, {k: v for k, v in params.items() if v is not None}
+
+
+async def run_stage(client, base_url, workload, rate, duration, max_inflight, timeout):
+    """开环压测：按泊松过程以固定速率发请求，不等待上一个请求返回
+    """
+    results = []
+    dropped = 0
+    inflight = set()
+
+    async def send(endpoint, params):
+        start = time.perf_counter()
+        try:
+            response = await client.get(f'{base_url}/{endpoint}/', params=params, timeout=timeout)
+            ok = response.status_code == 200 and response.json().get('success', False)
+            error = None if ok else f'status={response.status_code}'
+        except Exception as e:
+            error = type(e).__name__
+        results.append((endpoint, time.perf_counter() - start, error))
+
+    loop = asyncio.get_running_loop()
+    start_time = loop.time()
+    next_time = start_time
+    while next_time - start_time < duration:
+        await asyncio.sleep(max(0, next_time - loop.time()))
+        if len(inflight) >= max_inflight:
+            dropped += 1
+        else:
+            task = asyncio.create_task(send(*workload.next()))
+            inflight.add(task)
+            task.add_done_callback(inflight.discard)
+        next_time += random.expovariate(rate)
+
+    if inflight:
+        await asyncio.wait(inflight)
+    elapsed = loop.time() - start_time
+
+    latencies = [latency for _, latency, error in results if error is None]
+    errors = [error for _, _, error in results if error is not None]
+    summary = summarize_latencies(latencies)
+    summary.update({
+        'offered_rps': rate,
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+        'requests': len(results),
+        'errors': len(errors),
+        'error_rate': round(len(errors) / len(results), 4) if results else 0,
+        'dropped': dropped,
+    })
+    if errors:
+        summary['error_types'] = {e: errors.count(e) for e in set(errors)}
+    summary['endpoints'] = {
+        endpoint: summarize_latencies([l for e, l, err in results if e == endpoint and err is None])
+        for endpoint in set(e for e, _, _ in results)
+    }
+    return summary
+
+
+def is_saturated(summary, slo_ms, max_error_rate):
+    """p99 超过 SLO、错误率过高或吞吐明显低于发送速率时认为已饱和
+    """
+    if summary['error_rate'] > max_error_rate or summary['dropped'] > 0:
+        return True
+    if summary.get('p99_ms', float('inf')) > slo_ms:
+        return True
+    return summary['throughput_rps'] < summary['offered_rps'] * 0.9
+
+
+class Command(BaseCommand):
+    help = 'HTTP load test for the search API with open-loop arrivals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-u', '--base-url', help='API base url', default='http://127.0.0.1:8000/pubmed_api')
+        parser.add_argument('--api-key', help='X-API-KEY header')
+        parser.add_argument('-r', '--rates', help='arrival rates (req/s) to step through', type=float, nargs='+', default=[5, 10, 20, 50, 100])
+        parser.add_argument('-d', '--duration', help='seconds per rate step', type=float, default=30)
+        parser.add_argument('--endpoints', help='endpoint weights as json, e.g. {"hybrid_search": 1}')
+        parser.add_argument('--queries-file', help='file with one query per line')
+        parser.add_argument('--pmids', help='comma separated pmids for the similar endpoint')
+        parser.add_argument('--max-inflight', help='max concurrent requests on the client side', type=int, default=1000)
+        parser.add_argument('--timeout', help='request timeout in seconds', type=float, default=30)
+        parser.add_argument('--slo-ms', help='p99 latency SLO used to detect saturation', type=float, default=1000)
+        parser.add_argument('--max-error-rate', help='error rate used to detect saturation', type=float, default=0.01)
+        parser.add_argument('--seed', help='random seed', type=int, default=42)
+        parser.add_argument('--label', help='deployment label stored in the report')
+        parser.add_argument('--keep-going', help='continue after saturation', action='store_true')
+        parser.add_argument('-o', '--output', help='output json file')
+
+    def handle(self, *args, **kwargs):
+        queries = None
+        if kwargs['queries_file']:
+            queries = [line.strip() for line in open(kwargs['queries_file']) if line.strip()]
+        endpoints = json.loads(kwargs['endpoints']) if kwargs['endpoints'] else None
+        pmids = [int(p) for p in kwargs['pmids'].split(',')] if kwargs['pmids'] else None
+
+        report = asyncio.run(self.run(kwargs, Workload(queries, endpoints, pmids, seed=kwargs['seed'])))
+
+        output = kwargs['output'] or f'bench_results/loadtest_{datetime.datetime.now():%Y%m%d_%H%M%S}.json'
+        Path(output).parent.mkdir(parents=True, exist_ok=True)
+        with open(output, 'w') as out:
+            json.dump(report, out, indent=2)
+        logger.info(f'>>> save result to: {output}')
+
+    async def run(self, kwargs, workload):
+        headers = {'X-API-KEY': kwargs['api_key']} if kwargs['api_key'] else {}
+        limits = httpx.Limits(max_connections=kwargs['max_inflight'], max_keepalive_connections=kwargs['max_inflight'])
+        random.seed(kwargs['seed'])
+
+        report = {
+            'created_at': datetime.datetime.now().isoformat(),
+            'label': kwargs['label'],
+            'base_url': kwargs['base_url'],
+            'config': {key: kwargs[key] for key in ('rates', 'duration', 'slo_ms', 'max_error_rate', 'seed', 'max_inflight')},
+            'stages': [],
+            'saturation_rps': None,
+        }
+
+        async with httpx.AsyncClient(headers=headers, limits=limits) as client:
+            # 确认服务使用的是假 embedding，避免把 Azure 的延迟计入压测结果
+            try:
+                response = await client.get(f'{kwargs["base_url"]}/hybrid_search/', params={'q': 'warmup', 'debug': 1})
+                debug = response.json().get('debug', {})
+                report['embed_ms_warmup'] = debug.get('timings_ms', {}).get('embed')
+            except Exception as e:
+                raise CommandError(f'cannot reach {kwargs["base_url"]}: {e}')
+
+            best = 0
+            for rate in kwargs['rates']:
+                logger.info(f'>>> rate {rate} req/s for {kwargs["duration"]}s ...')
+                summary = await run_stage(
+                    client,
+                    kwargs['base_url'],
+                    workload,
+                    rate,
+                    kwargs['duration'],
+                    kwargs['max_inflight'],
+                    kwargs['timeout'],
+                )
+                saturated = is_saturated(summary, kwargs['slo_ms'], kwargs['max_error_rate'])
+                summary['saturated'] = saturated
+                report['stages'].append(summary)
+                logger.info(
+                    f"rate={rate} throughput={summary['throughput_rps']} p50={summary.get('p50_ms')} "
+                    f"p99={summary.get('p99_ms')} errors={summary['error_rate']:.2%} saturated={saturated}"
+                )
+                if saturated:
+                    # --keep-going 时后续阶段也会饱和，只记录第一次饱和的速率
+                    if report['saturation_rps'] is None:
+                        report['saturation_rps'] = rate
+                    if not kwargs['keep_going']:
+                        break
+                else:
+                    best = max(best, summary['throughput_rps'])
+
+        report['max_sustained_rps'] = best
+        return report
@@ -0,0 +1,47 @@
+import datetime
+
+import loguru
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from pubmed.utils import partition
+from pubmed.utils.vector_index import format_size
+
+
+class Command(BaseCommand):
+    help = 'Partition pubmed_articles and pubmed_article_vectors by year and manage partitions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-o', '--operation', help='operation', default='status', choices=['status', 'migrate', 'create', 'detach', 'maintain'])
+        parser.add_argument('--years', help='years for the create operation', type=int, nargs='+')
+        parser.add_argument('--before', help='detach partitions with year < BEFORE, default: keep PUBMED_RETENTION_YEARS', type=int)
+        parser.add_argument('--keep', help='keep detached partitions as standalone tables', action='store_true')
+
+    def handle(self, *args, **kwargs):
+        operation = kwargs['operation']
+        log = loguru.logger.info
+
+        if operation == 'migrate':
+            # 迁移 0016_partition 只更新模型状态，建分区表和复制数据在这里执行，期间需暂停入库
+            partition.migrate(log=log)
+            log('Done')
+            return
+
+        if not partition.is_partitioned():
+            raise CommandError(f'{partition.TABLE} is not partitioned, run with -o migrate first')
+
+        if operation == 'status':
+            for table in partition.TABLES:
+                for name, bounds, rows, size in partition.list_partitions(table):
+                    print(f'{name}\t{bounds}\t{rows}\t{format_size(size)}')
+        elif operation == 'create':
+            if not kwargs['years']:
+                raise CommandError('--years is required')
+            partition.ensure_partitions(kwargs['years'], log=log)
+        elif operation == 'detach':
+            before = kwargs['before'] or datetime.date.today().year - settings.PUBMED_RETENTION_YEARS + 1
+            partition.detach_partitions(before, drop=not kwargs['keep'], log=log)
+        elif operation == 'maintain':
+            partition.maintain(log=log)
+
+        log('Done')
@@ -50,7 +50,7 @@ class Command(BaseCommand):
                 SELECT
                     pmid,
                     1 - (title_abstract_vec <=> %s::vector) AS vec_score
-                FROM pubmed_articles
+                FROM pubmed_article_vectors
                 ORDER BY title_abstract_vec <=> %s::vector
                 LIMIT %s
             ),
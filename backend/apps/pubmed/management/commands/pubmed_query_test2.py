@@ -14,7 +14,7 @@ from django.core.cache import cache
 from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
 from pgvector.django import CosineDistance
 
-from pubmed.models import PubmedArticle
+from pubmed.models import PubmedArticle, PubmedArticleVector
 from pubmed.serializers import PubmedArticleSerializer
 import utils
 
@@ -69,11 +69,11 @@ class Command(BaseCommand):
             
                 # --- 2：向量召回 (仅取 ID 和 排名) ---
                 vector_qs = (
-                    PubmedArticle.objects.annotate(
+                    PubmedArticleVector.objects.annotate(
                         distance=CosineDistance('title_abstract_vec', vector_array)
                     )
                     .order_by('distance')
-                    .only('pmid')[:vector_topn]
+                    .only('article')[:vector_topn]
                 )
 
                 # 触发查询并转换为列表
@@ -92,7 +92,7 @@ class Command(BaseCommand):
 
                 # 处理向量排名
                 for rank, obj in enumerate(vector_list, start=1):
-                    rrf_scores[obj.pmid] = rrf_scores.get(obj.pmid, 0) + 1.0 / (K + rank)
+                    rrf_scores[obj.pk] = rrf_scores.get(obj.pk, 0) + 1.0 / (K + rank)
 
                 # 按 RRF 分数从高到低排序，取最终 top_k 个 PMID
                 final_pmids = sorted(rrf_scores.keys(), key=lambda x: rrf_scores[x], reverse=True)[start:start+top_k]
@@ -106,8 +106,6 @@ class Command(BaseCommand):
                     'abstract',
                     'year',
                     'pubmed_pubdate',
-                    'factor',
-                    'jcr',
                     'journal',
                     'pagination',
                     'volume',
@@ -0,0 +1,57 @@
+import datetime
+
+import loguru
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Avg, Max, Min
+
+from pubmed.models import SlowQuery
+
+
+class Command(BaseCommand):
+    help = 'List slow search queries grouped by plan shape'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--top', help='number of plan shapes to show', type=int, default=10)
+        parser.add_argument('-d', '--days', help='only include queries from the last N days', type=int, default=7)
+        parser.add_argument('--leg', help='recall leg, e.g. lexical/vector')
+        parser.add_argument('--show-sql', help='print a sample SQL for each plan shape', action='store_true')
+        parser.add_argument('--clear', help='delete all recorded slow queries', action='store_true')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['clear']:
+            count, _ = SlowQuery.objects.all().delete()
+            loguru.logger.info(f'deleted {count} slow queries')
+            return
+
+        qs = SlowQuery.objects.all()
+        if kwargs['days']:
+            qs = qs.filter(created_at__gte=datetime.datetime.now() - datetime.timedelta(days=kwargs['days']))
+        if kwargs['leg']:
+            qs = qs.filter(leg=kwargs['leg'])
+
+        groups = (
+            qs.values('plan_shape', 'leg')
+            .annotate(
+                count=Count('id'),
+                avg_elapsed=Avg('elapsed_ms'),
+                max_elapsed=Max('elapsed_ms'),
+                avg_execution=Avg('execution_ms'),
+                avg_read=Avg('shared_read_blocks'),
+                first_id=Min('id'),
+            )
+            .order_by('-count', '-avg_elapsed')[:kwargs['top']]
+        )
+
+        for n, group in enumerate(groups, 1):
+            sample = SlowQuery.objects.get(id=group['first_id'])
+            seq_scan = 'Seq Scan' in (sample.plan_summary or '')
+            print(f"#{n} [{group['leg']}] shape={group['plan_shape']} count={group['count']}")
+            print(f"    request avg={group['avg_elapsed']:.1f}ms max={group['max_elapsed']:.1f}ms, "
+                  f"sql avg={group['avg_execution'] or 0:.1f}ms, shared read blocks avg={group['avg_read'] or 0:.0f}"
+                  + (' !!! SEQ SCAN' if seq_scan else ''))
+            for line in (sample.plan_summary or '').splitlines():
+                print(f'    | {line}')
+            if kwargs['show_sql']:
+                print(f'    sql: {" ".join(sample.sql.split())}')
+                print(f'    params: {sample.params}')
+            print()
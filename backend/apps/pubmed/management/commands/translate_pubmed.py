@@ -0,0 +1,29 @@
+import loguru
+from django.core.management.base import BaseCommand
+
+from pubmed.utils import translation
+
+
+class Command(BaseCommand):
+    help = 'Translate abstracts into abstract_cn with token-budgeted batches and a content-hash cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--limit', help='max articles to process', type=int)
+        parser.add_argument('-b', '--chunk-size', help='articles selected and written per round', type=int, default=500)
+        parser.add_argument('-c', '--concurrency', help='concurrent LLM requests', type=int, default=translation.CONCURRENCY)
+        parser.add_argument('--max-tokens', help='estimated input tokens per LLM request', type=int, default=translation.MAX_BATCH_TOKENS)
+        parser.add_argument('--max-items', help='max abstracts per LLM request', type=int, default=translation.MAX_BATCH_ITEMS)
+        parser.add_argument('--start-pmid', help='only translate articles with pmid > START_PMID', type=int, default=0)
+
+    def handle(self, *args, **kwargs):
+        log = loguru.logger.info
+        written = translation.run(
+            limit=kwargs['limit'],
+            chunk_size=kwargs['chunk_size'],
+            start_pmid=kwargs['start_pmid'],
+            concurrency=kwargs['concurrency'],
+            max_tokens=kwargs['max_tokens'],
+            max_items=kwargs['max_items'],
+            log=log,
+        )
+        log(f'Done, {written} articles translated')
@@ -0,0 +1,129 @@
+import time
+
+import numpy as np
+from loguru import logger
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Min, Max
+
+from pubmed.models import PubmedArticleVector, EfSearchProfile
+from pubmed.utils import benchmark
+from pubmed.utils.pool import SEARCH_DB
+from pubmed.utils.search import vector_queryset
+from pubmed.utils.ef_tuning import reset_cache
+from pubmed.utils.vector_index import cosine_distance
+from pubmed.utils.partition import is_partitioned
+
+
+# 不同选择度的过滤条件，实际选择度在运行时测量
+FILTER_SETS = [
+    {},
+    {'year_start': benchmark.CURRENT_YEAR - 4},
+    {'year_start': benchmark.CURRENT_YEAR - 2},
+    {'year_start': benchmark.CURRENT_YEAR},
+    {'factor_min': 3},
+    {'factor_min': 10},
+    {'year_start': benchmark.CURRENT_YEAR - 1, 'factor_min': 5},
+]
+
+
+def sample_vectors(field, n, seed, max_rounds=8):
+    """从库中抽样已有文章的向量作为查询向量
+
+    按 seed 在 pmid 范围内生成候选 pmid，取其中有向量的文章，相同 seed 和数据得到相同的样本；
+    不使用 ORDER BY random()，不需要对整张向量表排序
+    """
+    qs = PubmedArticleVector.objects.using(SEARCH_DB).filter(**{f'{field}__isnull': False})
+    bounds = qs.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return []
+
+    rng = np.random.default_rng(seed)
+    sampled, vectors = [], {}
+    for i in range(max_rounds):
+        # pmid 不连续，命中率低时逐轮加倍候选数
+        candidates = [int(pmid) for pmid in rng.integers(bounds['low'], bounds['high'] + 1, size=n * 4 * 2 ** i)]
+        found = dict(qs.filter(pk__in=set(candidates) - set(vectors)).values_list('pk', field))
+        for pmid in candidates:
+            if pmid in found and pmid not in vectors:
+                vectors[pmid] = found[pmid]
+                sampled.append(pmid)
+        if len(sampled) >= n:
+            break
+    return [np.array(vectors[pmid]) for pmid in sampled[:n]]
+
+
+def knn(queryset, field, vector, k, ef_search=None, exact=False):
+    with transaction.atomic(using=SEARCH_DB):
+        with connections[SEARCH_DB].cursor() as cursor:
+            if exact:
+                cursor.execute('SET LOCAL enable_indexscan = off')
+                cursor.execute('SET LOCAL enable_bitmapscan = off')
+            else:
+                cursor.execute("SELECT set_config('hnsw.ef_search', %s, true)", [str(ef_search)])
+        start = time.perf_counter()
+        pmids = list(
+            queryset.annotate(distance=cosine_distance(field, vector))
+            .order_by('distance')
+            .values_list('pk', flat=True)[:k]
+        )
+        return pmids, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = 'Measure recall/latency of hnsw.ef_search and store the table used for runtime selection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--field', help='vector column', default='title_abstract_vec')
+        parser.add_argument('-k', '--k', help='k values to measure', type=int, nargs='+', default=[10, 50, 100, 200])
+        parser.add_argument('--ef', help='ef_search values to measure', type=int, nargs='+', default=[40, 64, 100, 200, 400, 800])
+        parser.add_argument('-n', '--queries', help='sampled query vectors per filter set', type=int, default=50)
+        parser.add_argument('--seed', help='random seed', type=int, default=42)
+        parser.add_argument('--dry-run', help='print results without saving', action='store_true')
+
+    def handle(self, *args, **kwargs):
+        field = kwargs['field']
+        ks = sorted(kwargs['k'])
+        efs = sorted(kwargs['ef'])
+        vectors = sample_vectors(field, kwargs['queries'], kwargs['seed'])
+        logger.info(f'>>> sampled {len(vectors)} query vectors')
+
+        partitioned = is_partitioned(PubmedArticleVector._meta.db_table, using=SEARCH_DB)
+        profiles = []
+        for filters in FILTER_SETS:
+            queryset = vector_queryset(SEARCH_DB, filters)
+            # 分区表上 year 条件由分区裁剪完成，选择度只按被扫描分区内的行数计算，与 ef_tuning 的估算一致
+            scanned = {k: v for k, v in filters.items() if k.startswith('year')} if partitioned else {}
+            total = vector_queryset(SEARCH_DB, scanned).count()
+            selectivity = queryset.count() / total if total else 1.0
+            logger.info(f'>>> filters={filters} selectivity={selectivity:.4f}')
+
+            truth = [knn(queryset, field, vector, ks[-1], exact=True)[0] for vector in vectors]
+            for ef_search in efs:
+                results = [knn(queryset, field, vector, ks[-1], ef_search=ef_search) for vector in vectors]
+                latencies = [latency for _, latency in results]
+                summary = benchmark.summarize_latencies(latencies)
+                for k in ks:
+                    recalls = [benchmark.recall_at_k(pmids, gt, k) for (pmids, _), gt in zip(results, truth)]
+                    recalls = [r for r in recalls if r is not None]
+                    recall = float(np.mean(recalls)) if recalls else 0.0
+                    profiles.append(EfSearchProfile(
+                        field=field,
+                        k=k,
+                        selectivity=round(selectivity, 6),
+                        ef_search=ef_search,
+                        recall=round(recall, 4),
+                        p50_ms=summary.get('p50_ms', 0),
+                        p95_ms=summary.get('p95_ms', 0),
+                        samples=len(recalls),
+                    ))
+                    logger.info(f'k={k} ef_search={ef_search} recall={recall:.4f} p50={summary.get("p50_ms")}ms')
+
+        if kwargs['dry_run']:
+            return
+
+        with transaction.atomic(using='default'):
+            EfSearchProfile.objects.filter(field=field).delete()
+            EfSearchProfile.objects.bulk_create(profiles)
+        reset_cache()
+        logger.info(f'>>> saved {len(profiles)} profiles')
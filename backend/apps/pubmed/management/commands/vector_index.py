@@ -0,0 +1,79 @@
+import loguru
+from django.core.management.base import BaseCommand, CommandError
+
+from pubmed.utils import vector_index
+from pubmed.utils.vector_index import format_size
+
+
+class Command(BaseCommand):
+    help = 'Build/rebuild/drop vector indexes (HNSW or IVFFlat) with progress and zero-downtime swap'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-o', '--operation', help='operation', default='status', choices=['build', 'estimate', 'status', 'drop'])
+        parser.add_argument('--field', help='vector field', default='title_abstract_vec')
+        parser.add_argument('--method', help='index method, default from settings.VECTOR_INDEXES', choices=vector_index.METHODS)
+        parser.add_argument('--m', help='HNSW m', type=int)
+        parser.add_argument('--ef-construction', help='HNSW ef_construction', type=int)
+        parser.add_argument('--lists', help='IVFFlat lists, default: rows / 1000 (sqrt(rows) above 1M rows)', type=int)
+        parser.add_argument('--maintenance-work-mem', help='maintenance_work_mem for the build, e.g. 8GB')
+        parser.add_argument('--workers', help='max_parallel_maintenance_workers for the build', type=int)
+        parser.add_argument('--progress-interval', help='seconds between progress reports', type=int, default=10)
+        parser.add_argument('--force', help='build even if the estimated memory exceeds maintenance_work_mem', action='store_true')
+
+    def handle(self, *args, **kwargs):
+        field = kwargs['field']
+        log = loguru.logger.info
+
+        if kwargs['operation'] == 'status':
+            for name, method, valid, size in vector_index.list_vector_indexes(field):
+                print(f'{name}\t{method}\t{"valid" if valid else "INVALID"}\t{format_size(size)}')
+            return
+
+        if kwargs['operation'] == 'drop':
+            vector_index.drop_indexes(field, log=log)
+            return
+
+        try:
+            config = vector_index.get_config(
+                field,
+                method=kwargs['method'],
+                m=kwargs['m'],
+                ef_construction=kwargs['ef_construction'],
+                lists=kwargs['lists'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        estimate = vector_index.estimate_memory(field, config)
+        if kwargs['maintenance_work_mem']:
+            estimate['maintenance_work_mem'] = vector_index.parse_size(kwargs['maintenance_work_mem'])
+            estimate['fits'] = estimate['memory'] <= estimate['maintenance_work_mem']
+        log(
+            f"{field}: {estimate['rows']} rows, method={config['method']}"
+            f"{', lists=' + str(estimate['lists']) if estimate['lists'] else ''}, "
+            f"build memory ~{format_size(estimate['memory'])}, index size ~{format_size(estimate['index_size'])}, "
+            f"maintenance_work_mem={format_size(estimate['maintenance_work_mem'])}"
+        )
+        for partition, partition_estimate in estimate['partitions']:
+            log(
+                f"  {partition}: {partition_estimate['rows']} rows"
+                f"{', lists=' + str(partition_estimate['lists']) if partition_estimate['lists'] else ''}, "
+                f"build memory ~{format_size(partition_estimate['memory'])}"
+            )
+        if not estimate['fits']:
+            loguru.logger.warning('estimated build memory exceeds maintenance_work_mem, the build will be much slower')
+
+        if kwargs['operation'] == 'estimate':
+            return
+        if not estimate['fits'] and not kwargs['force']:
+            raise CommandError('increase --maintenance-work-mem or pass --force')
+
+        vector_index.build_index(
+            field,
+            config,
+            maintenance_work_mem=kwargs['maintenance_work_mem'],
+            workers=kwargs['workers'],
+            progress_interval=kwargs['progress_interval'],
+            log=log,
+        )
+        log('Done')
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pubmed', '0005_pubmedarticle_ts_en'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Created At')),
+                ('endpoint', models.CharField(max_length=100, verbose_name='Endpoint')),
+                ('elapsed_ms', models.FloatField(verbose_name='Elapsed (ms)')),
+                ('timings', models.JSONField(blank=True, null=True, verbose_name='Stage Timings')),
+                ('leg', models.CharField(max_length=50, verbose_name='Recall Leg')),
+                ('sql', models.TextField(verbose_name='SQL')),
+                ('params', models.JSONField(blank=True, null=True, verbose_name='Params')),
+                ('plan', models.JSONField(blank=True, null=True, verbose_name='Plan')),
+                ('plan_shape', models.CharField(db_index=True, max_length=32, verbose_name='Plan Shape')),
+                ('plan_summary', models.TextField(blank=True, null=True, verbose_name='Plan Summary')),
+                ('execution_ms', models.FloatField(blank=True, null=True, verbose_name='Execution (ms)')),
+                ('shared_hit_blocks', models.BigIntegerField(blank=True, null=True, verbose_name='Shared Hit Blocks')),
+                ('shared_read_blocks', models.BigIntegerField(blank=True, null=True, verbose_name='Shared Read Blocks')),
+            ],
+            options={
+                'verbose_name': 'Slow Query',
+                'verbose_name_plural': 'Slow Queries',
+                'db_table': 'pubmed_slow_queries',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pubmed', '0006_slowquery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EfSearchProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('k', models.IntegerField(verbose_name='K')),
+                ('selectivity', models.FloatField(verbose_name='Filter Selectivity')),
+                ('ef_search', models.IntegerField(verbose_name='ef_search')),
+                ('recall', models.FloatField(verbose_name='Recall')),
+                ('p50_ms', models.FloatField(verbose_name='P50 (ms)')),
+                ('p95_ms', models.FloatField(verbose_name='P95 (ms)')),
+                ('samples', models.IntegerField(verbose_name='Samples')),
+                ('field', models.CharField(default='title_abstract_vec', max_length=100, verbose_name='Vector Field')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+            ],
+            options={
+                'verbose_name': 'ef_search Profile',
+                'verbose_name_plural': 'ef_search Profiles',
+                'db_table': 'pubmed_ef_search_profiles',
+                'ordering': ['field', 'k', 'selectivity', 'ef_search'],
+            },
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:10
+
+import django.db.models.deletion
+import pgvector.django.vector
+from django.db import migrations, models
+
+
+def copy_columns(apps, schema_editor):
+    """将已有的向量、中文摘要、作者单位复制到附表
+
+    title_abstract_vec 由 embedding_update 直接加在表上，不在迁移记录中，按实际存在的列复制
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('''
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = 'pubmed_articles' AND table_schema = current_schema()
+        ''')
+        columns = {row[0] for row in cursor.fetchall()}
+
+        vector_columns = [c for c in ['title_abstract_vector', 'title_abstract_vec'] if c in columns]
+        if vector_columns:
+            cursor.execute(f'''
+                INSERT INTO pubmed_article_vectors (pmid, year, factor, {', '.join(vector_columns)})
+                SELECT pmid, year, factor, {', '.join(vector_columns)}
+                FROM pubmed_articles
+                WHERE {' OR '.join(f'{c} IS NOT NULL' for c in vector_columns)}
+            ''')
+
+        cursor.execute('''
+            INSERT INTO pubmed_article_texts (pmid, abstract_cn, affiliations)
+            SELECT pmid, abstract_cn, affiliations
+            FROM pubmed_articles
+            WHERE abstract_cn IS NOT NULL OR affiliations IS NOT NULL
+        ''')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pubmed', '0007_efsearchprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PubmedArticleVector',
+            fields=[
+                ('article', models.OneToOneField(db_column='pmid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='vectors', serialize=False, to='pubmed.pubmedarticle', verbose_name='PMID')),
+                ('year', models.IntegerField(blank=True, null=True, verbose_name='Year')),
+                ('factor', models.FloatField(blank=True, null=True, verbose_name='Factor')),
+                ('title_abstract_vector', pgvector.django.vector.VectorField(blank=True, dimensions=3072, null=True, verbose_name='Title Abstract Vector')),
+                ('title_abstract_vec', pgvector.django.vector.VectorField(blank=True, dimensions=1536, null=True, verbose_name='Title Abstract Vec')),
+            ],
+            options={
+                'verbose_name': 'Pubmed Article Vector',
+                'verbose_name_plural': 'Pubmed Article Vectors',
+                'db_table': 'pubmed_article_vectors',
+            },
+        ),
+        migrations.CreateModel(
+            name='PubmedArticleText',
+            fields=[
+                ('article', models.OneToOneField(db_column='pmid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='text', serialize=False, to='pubmed.pubmedarticle', verbose_name='PMID')),
+                ('abstract_cn', models.TextField(blank=True, null=True, verbose_name='Abstract CN')),
+                ('affiliations', models.JSONField(blank=True, null=True, verbose_name='Affiliations')),
+            ],
+            options={
+                'verbose_name': 'Pubmed Article Text',
+                'verbose_name_plural': 'Pubmed Article Texts',
+                'db_table': 'pubmed_article_texts',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='pubmedarticlevector',
+            index=models.Index(fields=['year'], name='pubmed_vec_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pubmedarticlevector',
+            index=models.Index(fields=['factor'], name='pubmed_vec_factor_idx'),
+        ),
+        migrations.RunPython(copy_columns, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='pubmedarticle',
+            name='abstract_cn',
+        ),
+        migrations.RemoveField(
+            model_name='pubmedarticle',
+            name='affiliations',
+        ),
+        migrations.RemoveField(
+            model_name='pubmedarticle',
+            name='title_abstract_vector',
+        ),
+        migrations.RunSQL(
+            'ALTER TABLE pubmed_articles DROP COLUMN IF EXISTS title_abstract_vec',
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pubmed', '0008_vertical_split'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pubmedarticletext',
+            name='source_hash',
+            field=models.CharField(blank=True, max_length=32, null=True, verbose_name='Source Hash'),
+        ),
+        migrations.CreateModel(
+            name='TranslationCache',
+            fields=[
+                ('content_hash', models.CharField(max_length=32, primary_key=True, serialize=False, verbose_name='Content Hash')),
+                ('translation', models.TextField(verbose_name='Translation')),
+                ('model', models.CharField(max_length=100, verbose_name='Model')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+            ],
+            options={
+                'verbose_name': 'Translation Cache',
+                'verbose_name_plural': 'Translation Cache',
+                'db_table': 'pubmed_translation_cache',
+            },
+        ),
+    ]
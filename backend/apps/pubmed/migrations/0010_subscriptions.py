@@ -0,0 +1,57 @@
+# Generated by Django 5.2.8 on 2026-10-19 19:20
+
+import django.db.models.deletion
+import pgvector.django.vector
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pubmed', '0009_translationcache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Subscription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Name')),
+                ('email', models.EmailField(blank=True, max_length=254, null=True, verbose_name='Email')),
+                ('query', models.CharField(max_length=1000, verbose_name='Query')),
+                ('filters', models.JSONField(blank=True, default=dict, verbose_name='Filters')),
+                ('threshold', models.FloatField(default=0.5, verbose_name='Similarity Threshold')),
+                ('require_lexical', models.BooleanField(default=True, verbose_name='Require Lexical Match')),
+                ('vector', pgvector.django.vector.VectorField(blank=True, dimensions=1536, null=True, verbose_name='Query Vector')),
+                ('active', models.BooleanField(default=True, verbose_name='Active')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+            ],
+            options={
+                'verbose_name': 'Subscription',
+                'verbose_name_plural': 'Subscriptions',
+                'db_table': 'pubmed_subscriptions',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SubscriptionMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pmid', models.IntegerField(verbose_name='PMID')),
+                ('score', models.FloatField(verbose_name='Score')),
+                ('lexical', models.BooleanField(default=False, verbose_name='Lexical Match')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('delivered_at', models.DateTimeField(blank=True, null=True, verbose_name='Delivered At')),
+                ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matches', to='pubmed.subscription', verbose_name='Subscription')),
+            ],
+            options={
+                'verbose_name': 'Subscription Match',
+                'verbose_name_plural': 'Subscription Matches',
+                'db_table': 'pubmed_subscription_matches',
+                'ordering': ['-score'],
+                'indexes': [models.Index(fields=['subscription', 'delivered_at'], name='pubmed_sub_match_pending_idx')],
+                'constraints': [models.UniqueConstraint(fields=('subscription', 'pmid'), name='pubmed_sub_match_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pubmed', '0010_subscriptions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500, unique=True, verbose_name='Path')),
+                ('size', models.BigIntegerField(verbose_name='Size')),
+                ('mtime', models.FloatField(verbose_name='Modified Time')),
+                ('articles', models.IntegerField(default=0, verbose_name='Articles')),
+                ('created', models.IntegerField(default=0, verbose_name='Created')),
+                ('updated', models.IntegerField(default=0, verbose_name='Updated')),
+                ('elapsed', models.FloatField(default=0, verbose_name='Elapsed (s)')),
+                ('finished_at', models.DateTimeField(auto_now=True, verbose_name='Finished At')),
+            ],
+            options={
+                'verbose_name': 'Ingested File',
+                'verbose_name_plural': 'Ingested Files',
+                'db_table': 'pubmed_ingested_files',
+                'ordering': ['-finished_at'],
+            },
+        ),
+    ]
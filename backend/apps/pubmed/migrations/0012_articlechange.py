@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-19 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pubmed', '0011_ingestedfile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pmid', models.IntegerField(verbose_name='PMID')),
+                ('created', models.BooleanField(default=False, verbose_name='Created')),
+                ('text_changed', models.BooleanField(default=True, verbose_name='Text Changed')),
+                ('changed_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Changed At')),
+                ('embedded_at', models.DateTimeField(blank=True, null=True, verbose_name='Embedded At')),
+                ('warmed_at', models.DateTimeField(blank=True, null=True, verbose_name='Cache Warmed At')),
+            ],
+            options={
+                'verbose_name': 'Article Change',
+                'verbose_name_plural': 'Article Changes',
+                'db_table': 'pubmed_article_changes',
+                'indexes': [models.Index(fields=['embedded_at', 'id'], name='pubmed_change_pending_idx')],
+            },
+        ),
+    ]
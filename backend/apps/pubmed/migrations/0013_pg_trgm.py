@@ -0,0 +1,15 @@
+# Generated by Django 5.2.8 on 2026-10-19 21:40
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pubmed', '0012_articlechange'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+    ]
@@ -0,0 +1,159 @@
+# Generated by Django 5.2.8 on 2026-10-19 22:30
+
+from collections import Counter, defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def normalize_issn(value):
+    """与 pubmed.utils.journals.normalize_issn 一致，迁移中不引用应用代码
+    """
+    value = (value or '').strip().upper().replace(' ', '')
+    if not value:
+        return None
+    if len(value) == 8 and '-' not in value:
+        value = f'{value[:4]}-{value[4:]}'
+    return value
+
+
+def group_keys(issn, e_issn):
+    keys = []
+    if normalize_issn(e_issn):
+        keys.append(('e_issn', normalize_issn(e_issn)))
+    if normalize_issn(issn):
+        keys.append(('issn', normalize_issn(issn)))
+    return keys
+
+
+def backfill_journals(apps, schema_editor):
+    """由文章表中的 issn/e_issn 生成期刊表，并回填文章表、向量表的 journal_id
+
+    共用同一个 ISSN 或 eISSN 的组合视为同一期刊，名称和指标取文章数最多的组合
+    """
+    Journal = apps.get_model('pubmed', 'Journal')
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('''
+            SELECT coalesce(issn, ''), coalesce(e_issn, ''), journal, factor, jcr, zky, count(*)
+            FROM pubmed_articles
+            WHERE coalesce(issn, '') <> '' OR coalesce(e_issn, '') <> ''
+            GROUP BY 1, 2, 3, 4, 5, 6
+        ''')
+        groups = [group for group in cursor.fetchall() if group_keys(group[0], group[1])]
+
+    # 按 ISSN、eISSN 合并（并查集）
+    parent = {}
+
+    def find(key):
+        while parent.setdefault(key, key) != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    for issn, e_issn, *_ in groups:
+        keys = group_keys(issn, e_issn)
+        for key in keys[1:]:
+            parent[find(key)] = find(keys[0])
+
+    components = defaultdict(list)
+    for group in groups:
+        components[find(group_keys(group[0], group[1])[0])].append(group)
+
+    journals, raw_keys = [], []
+    for members in components.values():
+        counts = {'issn': Counter(), 'e_issn': Counter()}
+        for issn, e_issn, *_, n in members:
+            for kind, value in group_keys(issn, e_issn):
+                counts[kind][value] += n
+        _, _, name, factor, jcr, zky, _ = max(members, key=lambda member: member[-1])
+        journals.append(Journal(
+            issn=counts['issn'].most_common(1)[0][0] if counts['issn'] else None,
+            e_issn=counts['e_issn'].most_common(1)[0][0] if counts['e_issn'] else None,
+            name=name,
+            factor=factor,
+            jcr=jcr,
+            zky=zky,
+            articles=sum(member[-1] for member in members),
+        ))
+        raw_keys.append({(issn, e_issn) for issn, e_issn, *_ in members})
+
+    Journal.objects.using(schema_editor.connection.alias).bulk_create(journals, batch_size=2000)
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('CREATE TEMP TABLE journal_keys (issn text, e_issn text, journal_id bigint) ON COMMIT DROP')
+        with cursor.copy('COPY journal_keys (issn, e_issn, journal_id) FROM STDIN') as copy:
+            for journal, keys in zip(journals, raw_keys):
+                for issn, e_issn in keys:
+                    copy.write_row([issn, e_issn, journal.pk])
+        cursor.execute('ANALYZE journal_keys')
+        cursor.execute('''
+            UPDATE pubmed_articles a SET journal_id = k.journal_id
+            FROM journal_keys k
+            WHERE coalesce(a.issn, '') = k.issn AND coalesce(a.e_issn, '') = k.e_issn
+        ''')
+        cursor.execute('''
+            UPDATE pubmed_article_vectors v SET journal_id = a.journal_id
+            FROM pubmed_articles a
+            WHERE a.pmid = v.pmid AND a.journal_id IS NOT NULL
+        ''')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pubmed', '0013_pg_trgm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Journal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('issn', models.CharField(blank=True, max_length=20, null=True, unique=True, verbose_name='ISSN')),
+                ('e_issn', models.CharField(blank=True, max_length=20, null=True, unique=True, verbose_name='E-ISSN')),
+                ('name', models.CharField(blank=True, max_length=500, null=True, verbose_name='Name')),
+                ('factor', models.FloatField(blank=True, db_index=True, null=True, verbose_name='Factor')),
+                ('jcr', models.CharField(blank=True, max_length=10, null=True, verbose_name='JCR')),
+                ('zky', models.CharField(blank=True, max_length=10, null=True, verbose_name='ZKY')),
+                ('articles', models.IntegerField(default=0, verbose_name='Articles')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+            ],
+            options={
+                'verbose_name': 'Journal',
+                'verbose_name_plural': 'Journals',
+                'db_table': 'pubmed_journals',
+            },
+        ),
+        migrations.AddField(
+            model_name='pubmedarticle',
+            name='journal_ref',
+            field=models.ForeignKey(blank=True, db_column='journal_id', db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='pubmed.journal', verbose_name='Journal'),
+        ),
+        migrations.AddField(
+            model_name='pubmedarticlevector',
+            name='journal_ref',
+            field=models.ForeignKey(blank=True, db_column='journal_id', db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='pubmed.journal', verbose_name='Journal'),
+        ),
+        migrations.RunPython(backfill_journals, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='pubmedarticlevector',
+            name='pubmed_vec_factor_idx',
+        ),
+        migrations.RemoveField(
+            model_name='pubmedarticlevector',
+            name='factor',
+        ),
+        migrations.RemoveField(
+            model_name='pubmedarticle',
+            name='factor',
+        ),
+        migrations.RemoveField(
+            model_name='pubmedarticle',
+            name='jcr',
+        ),
+        migrations.RemoveField(
+            model_name='pubmedarticle',
+            name='zky',
+        ),
+    ]
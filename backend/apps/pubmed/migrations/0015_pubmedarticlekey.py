@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-20 10:20
+
+from django.db import migrations, models
+
+
+def backfill_keys(apps, schema_editor):
+    """登记已有文章的 pmid；分区后并发入库可能已产生重复行，每个 pmid 只登记一次
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('''
+            INSERT INTO pubmed_article_keys (pmid, year)
+            SELECT DISTINCT ON (pmid) pmid, year FROM pubmed_articles ORDER BY pmid
+            ON CONFLICT (pmid) DO NOTHING
+        ''')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pubmed', '0014_journal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PubmedArticleKey',
+            fields=[
+                ('pmid', models.IntegerField(primary_key=True, serialize=False, verbose_name='PMID')),
+                ('year', models.IntegerField(blank=True, db_index=True, null=True, verbose_name='Year')),
+            ],
+            options={
+                'verbose_name': 'Pubmed Article Key',
+                'verbose_name_plural': 'Pubmed Article Keys',
+                'db_table': 'pubmed_article_keys',
+            },
+        ),
+        migrations.RunPython(backfill_keys, migrations.RunPython.noop),
+    ]
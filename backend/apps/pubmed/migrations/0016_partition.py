@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-20 10:30
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pubmed', '0015_pubmedarticlekey'),
+    ]
+
+    operations = [
+        # 按年份分区（建分区表、逐年复制、建索引、交换表名）由 partition_pubmed -o migrate 执行，
+        # 迁移中只记录模型状态：模型中 pmid 仍为主键（ORM 需要），数据库中由 pubmed_article_keys 的主键保证唯一；
+        # 分区表不再建 year 索引，按分区裁剪，未分区的旧表上的 year 索引随表一起保留为 *_unpartitioned
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='pubmedarticlevector',
+                    name='pubmed_vec_year_idx',
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.8 on 2026-10-20 14:10
+
+from django.db import migrations
+
+
+# jsonb 数组各元素以 \x1f 连接：lower(authors::text) 会匹配到引号、逗号等 JSON 标点，
+# 子串还能跨过相邻两个作者；索引和 query_parser 的 WHERE 使用同一个表达式
+CREATE_FUNCTION = r'''
+CREATE OR REPLACE FUNCTION pubmed_array_text(value jsonb) RETURNS text
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE
+AS $$
+    SELECT string_agg(item, chr(31))
+    FROM jsonb_array_elements_text(CASE WHEN jsonb_typeof(value) = 'array' THEN value ELSE '[]'::jsonb END) AS item
+$$
+'''
+
+# 索引由 index_pubmed / partition_pubmed 建立，名称不固定；只重建已存在的旧表达式索引，
+# 分区表上删除父表索引时各分区上的索引一并删除
+REPLACE_INDEXES = r'''
+DO $$
+DECLARE
+    idx record;
+    field text;
+BEGIN
+    FOREACH field IN ARRAY ARRAY['authors', 'keywords'] LOOP
+        FOR idx IN
+            SELECT c.relname
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = 'pubmed_articles'::regclass
+              AND pg_get_indexdef(c.oid) LIKE format('%%lower((%s)::text)%%', field)
+        LOOP
+            EXECUTE format('DROP INDEX %I', idx.relname);
+            EXECUTE format(
+                'CREATE INDEX IF NOT EXISTS %I ON pubmed_articles USING GIN (lower(pubmed_array_text(%I)) gin_trgm_ops)',
+                'pubmed_articles_' || field || '_gin_idx', field
+            );
+        END LOOP;
+    END LOOP;
+END $$
+'''
+
+RESTORE_INDEXES = r'''
+DO $$
+DECLARE
+    idx record;
+    field text;
+BEGIN
+    FOREACH field IN ARRAY ARRAY['authors', 'keywords'] LOOP
+        FOR idx IN
+            SELECT c.relname
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = 'pubmed_articles'::regclass
+              AND pg_get_indexdef(c.oid) LIKE format('%%pubmed_array_text(%s)%%', field)
+        LOOP
+            EXECUTE format('DROP INDEX %I', idx.relname);
+            EXECUTE format(
+                'CREATE INDEX IF NOT EXISTS %I ON pubmed_articles USING GIN (lower(%I::text) gin_trgm_ops)',
+                'pubmed_articles_' || field || '_gin_idx', field
+            );
+        END LOOP;
+    END LOOP;
+END $$
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pubmed', '0016_partition'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_FUNCTION, 'DROP FUNCTION IF EXISTS pubmed_array_text(jsonb)'),
+        migrations.RunSQL(REPLACE_INDEXES, RESTORE_INDEXES),
+    ]
@@ -4,6 +4,31 @@ from pgvector.django import VectorField
 
 
 
+class Journal(models.Model):
+    """期刊维表：影响因子、JCR 分区、中科院分区按期刊只存一份
+
+    按 eISSN/ISSN 识别期刊，文章表和向量表通过 journal_id 引用
+    每年发布新指标时只需更新这张表（约 3 万行），不需要改写文章和向量
+    """
+    issn = models.CharField(max_length=20, verbose_name='ISSN', unique=True, null=True, blank=True)
+    e_issn = models.CharField(max_length=20, verbose_name='E-ISSN', unique=True, null=True, blank=True)
+    name = models.CharField(max_length=500, verbose_name='Name', null=True, blank=True)
+    factor = models.FloatField(verbose_name='Factor', null=True, blank=True, db_index=True)
+    jcr = models.CharField(max_length=10, verbose_name='JCR', null=True, blank=True)
+    zky = models.CharField(max_length=10, verbose_name='ZKY', null=True, blank=True)
+    # 该期刊的文章数，用于估算 factor 条件的选择度，由 journal_metrics 命令更新
+    articles = models.IntegerField(verbose_name='Articles', default=0)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Updated At')
+
+    class Meta:
+        verbose_name = 'Journal'
+        verbose_name_plural = 'Journals'
+        db_table = 'pubmed_journals'
+
+    def __str__(self):
+        return f'{self.name} ({self.e_issn or self.issn})'
+
+
 class PubmedArticle(models.Model):
     pmid = models.IntegerField(primary_key=True, verbose_name='PMID')
     title = models.CharField(max_length=2000, verbose_name='Title', null=True, blank=True)
@@ -28,18 +53,19 @@ class PubmedArticle(models.Model):
     author_mail = models.JSONField(verbose_name='Author Mails', null=True, blank=True)
     author_first = models.CharField(max_length=500, verbose_name='Author First', null=True, blank=True)
     author_last = models.CharField(max_length=500, verbose_name='Author Last', null=True, blank=True)
-    affiliations = models.JSONField(verbose_name='Affiliations', null=True, blank=True)
-
-    abstract_cn = models.TextField(verbose_name='Abstract CN', null=True, blank=True)
-
     ts_en = SearchVectorField(editable=False, null=True, blank=True)  # 对应 GENERATED ALWAYS 列
 
-    factor = models.FloatField(verbose_name='Factor', null=True, blank=True)
-    jcr = models.CharField(max_length=10, verbose_name='JCR', null=True, blank=True)
-    zky = models.CharField(max_length=10, verbose_name='ZKY', null=True, blank=True)
-
-    title_abstract_vector = VectorField(dimensions=3072, verbose_name='Title Abstract Vector', null=True, blank=True)
-    title_abstract_vec = VectorField(dimensions=1536, verbose_name='Title Abstract Vec', null=True, blank=True)
+    # factor、jcr、zky 存放在期刊维表中
+    journal_ref = models.ForeignKey(
+        Journal,
+        db_column='journal_id',
+        related_name='+',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        verbose_name='Journal',
+    )
 
     class Meta:
         verbose_name = 'Pubmed Article'
@@ -49,3 +75,262 @@ class PubmedArticle(models.Model):
 
     def __str__(self):
         return f'{self.pmid} - {self.title}'
+
+
+class PubmedArticleKey(models.Model):
+    """pmid 登记表，不分区，pmid 为主键
+
+    文章表、向量表按 year 分区后 pmid 上不能建唯一约束（唯一约束必须包含分区键），
+    写入文章和向量前先在这里登记并锁定该行，由主键保证同一 pmid 只有一篇文章
+    year 与文章表一致，删除分区时按年份清理
+    """
+    pmid = models.IntegerField(primary_key=True, verbose_name='PMID')
+    year = models.IntegerField(verbose_name='Year', null=True, blank=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'Pubmed Article Key'
+        verbose_name_plural = 'Pubmed Article Keys'
+        db_table = 'pubmed_article_keys'
+
+    def __str__(self):
+        return f'{self.pmid}'
+
+
+class PubmedArticleVector(models.Model):
+    """文章向量，从文章表中拆出，检索过滤和展示只读取紧凑的文章行
+
+    year、journal_id 冗余一份，向量召回带过滤条件时不需要关联文章表
+    按年份分区后 pmid 上没有唯一约束，因此不建外键约束，唯一性由 pubmed_article_keys 保证
+    """
+    article = models.OneToOneField(
+        PubmedArticle,
+        primary_key=True,
+        db_column='pmid',
+        related_name='vectors',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        verbose_name='PMID',
+    )
+    year = models.IntegerField(verbose_name='Year', null=True, blank=True)
+    journal_ref = models.ForeignKey(
+        Journal,
+        db_column='journal_id',
+        related_name='+',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        verbose_name='Journal',
+    )
+    title_abstract_vector = VectorField(dimensions=3072, verbose_name='Title Abstract Vector', null=True, blank=True)
+    title_abstract_vec = VectorField(dimensions=1536, verbose_name='Title Abstract Vec', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Pubmed Article Vector'
+        verbose_name_plural = 'Pubmed Article Vectors'
+        db_table = 'pubmed_article_vectors'
+
+    def __str__(self):
+        return f'{self.pk}'
+
+
+class PubmedArticleText(models.Model):
+    """不参与检索的大字段：中文摘要、作者单位，只在请求需要时关联查询
+    """
+    article = models.OneToOneField(
+        PubmedArticle,
+        primary_key=True,
+        db_column='pmid',
+        related_name='text',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        verbose_name='PMID',
+    )
+    abstract_cn = models.TextField(verbose_name='Abstract CN', null=True, blank=True)
+    # 翻译时英文摘要的 md5，与当前摘要不一致时需要重新翻译
+    source_hash = models.CharField(max_length=32, verbose_name='Source Hash', null=True, blank=True)
+    affiliations = models.JSONField(verbose_name='Affiliations', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Pubmed Article Text'
+        verbose_name_plural = 'Pubmed Article Texts'
+        db_table = 'pubmed_article_texts'
+
+    def __str__(self):
+        return f'{self.pk}'
+
+
+class TranslationCache(models.Model):
+    """按英文摘要内容的 md5 缓存翻译结果，重复摘要、重新入库的文章不再调用大模型
+    """
+    content_hash = models.CharField(max_length=32, primary_key=True, verbose_name='Content Hash')
+    translation = models.TextField(verbose_name='Translation')
+    model = models.CharField(max_length=100, verbose_name='Model')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Created At')
+
+    class Meta:
+        verbose_name = 'Translation Cache'
+        verbose_name_plural = 'Translation Cache'
+        db_table = 'pubmed_translation_cache'
+
+    def __str__(self):
+        return f'{self.content_hash} ({self.model})'
+
+
+class Subscription(models.Model):
+    """订阅：保存的检索条件，查询向量在保存时计算
+
+    新文章写入向量后与全部订阅向量做一次矩阵乘法，余弦相似度达到 threshold 的再做全文匹配检查
+    """
+    name = models.CharField(max_length=200, verbose_name='Name')
+    email = models.EmailField(verbose_name='Email', null=True, blank=True)
+    query = models.CharField(max_length=1000, verbose_name='Query')
+    # year_start、year_end、factor_min、factor_max
+    filters = models.JSONField(verbose_name='Filters', default=dict, blank=True)
+    threshold = models.FloatField(verbose_name='Similarity Threshold', default=0.5)
+    require_lexical = models.BooleanField(verbose_name='Require Lexical Match', default=True)
+    vector = VectorField(dimensions=1536, verbose_name='Query Vector', null=True, blank=True)
+    active = models.BooleanField(verbose_name='Active', default=True)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Created At')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Updated At')
+
+    class Meta:
+        verbose_name = 'Subscription'
+        verbose_name_plural = 'Subscriptions'
+        ordering = ['-created_at']
+        db_table = 'pubmed_subscriptions'
+
+    def __str__(self):
+        return f'{self.name} - {self.query}'
+
+
+class SubscriptionMatch(models.Model):
+    """订阅匹配到的新文章，delivered_at 为空的待推送
+    """
+    subscription = models.ForeignKey(Subscription, on_delete=models.CASCADE, related_name='matches', verbose_name='Subscription')
+    pmid = models.IntegerField(verbose_name='PMID')
+    score = models.FloatField(verbose_name='Score')
+    lexical = models.BooleanField(verbose_name='Lexical Match', default=False)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Created At')
+    delivered_at = models.DateTimeField(verbose_name='Delivered At', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Subscription Match'
+        verbose_name_plural = 'Subscription Matches'
+        ordering = ['-score']
+        db_table = 'pubmed_subscription_matches'
+        constraints = [
+            models.UniqueConstraint(fields=['subscription', 'pmid'], name='pubmed_sub_match_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['subscription', 'delivered_at'], name='pubmed_sub_match_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subscription_id} - {self.pmid} ({self.score:.3f})'
+
+
+class IngestedFile(models.Model):
+    """已入库的 PubMed 更新文件，路径、大小、修改时间都未变化的文件不再重复入库
+    """
+    path = models.CharField(max_length=500, unique=True, verbose_name='Path')
+    size = models.BigIntegerField(verbose_name='Size')
+    mtime = models.FloatField(verbose_name='Modified Time')
+    articles = models.IntegerField(verbose_name='Articles', default=0)
+    created = models.IntegerField(verbose_name='Created', default=0)
+    updated = models.IntegerField(verbose_name='Updated', default=0)
+    elapsed = models.FloatField(verbose_name='Elapsed (s)', default=0)
+    finished_at = models.DateTimeField(auto_now=True, verbose_name='Finished At')
+
+    class Meta:
+        verbose_name = 'Ingested File'
+        verbose_name_plural = 'Ingested Files'
+        ordering = ['-finished_at']
+        db_table = 'pubmed_ingested_files'
+
+    def __str__(self):
+        return f'{self.path} ({self.articles})'
+
+
+class ArticleChange(models.Model):
+    """入库时记录发生变化的文章，增量流水线据此只处理这些 pmid
+
+    各阶段完成时间与 changed_at 的差即该阶段的延迟
+    """
+    pmid = models.IntegerField(verbose_name='PMID')
+    created = models.BooleanField(verbose_name='Created', default=False)
+    # 标题或摘要变化，需要重新计算向量
+    text_changed = models.BooleanField(verbose_name='Text Changed', default=True)
+    changed_at = models.DateTimeField(auto_now_add=True, verbose_name='Changed At', db_index=True)
+    embedded_at = models.DateTimeField(verbose_name='Embedded At', null=True, blank=True)
+    warmed_at = models.DateTimeField(verbose_name='Cache Warmed At', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Article Change'
+        verbose_name_plural = 'Article Changes'
+        db_table = 'pubmed_article_changes'
+        indexes = [
+            models.Index(fields=['embedded_at', 'id'], name='pubmed_change_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.pmid} - {self.changed_at}'
+
+
+# 存放在附表中的字段
+TEXT_FIELDS = ['abstract_cn', 'affiliations']
+VECTOR_FIELDS = ['title_abstract_vector', 'title_abstract_vec']
+# 期刊指标，文章数据中的这些字段入库时写入期刊维表
+JOURNAL_FIELDS = ['factor', 'jcr', 'zky']
+
+
+class SlowQuery(models.Model):
+    """检索慢查询记录，超过阈值的请求会采样记录 SQL 和 EXPLAIN ANALYZE 执行计划
+    """
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Created At', db_index=True)
+    endpoint = models.CharField(max_length=100, verbose_name='Endpoint')
+    elapsed_ms = models.FloatField(verbose_name='Elapsed (ms)')
+    timings = models.JSONField(verbose_name='Stage Timings', null=True, blank=True)
+    leg = models.CharField(max_length=50, verbose_name='Recall Leg')
+    sql = models.TextField(verbose_name='SQL')
+    params = models.JSONField(verbose_name='Params', null=True, blank=True)
+    plan = models.JSONField(verbose_name='Plan', null=True, blank=True)
+    plan_shape = models.CharField(max_length=32, verbose_name='Plan Shape', db_index=True)
+    plan_summary = models.TextField(verbose_name='Plan Summary', null=True, blank=True)
+    execution_ms = models.FloatField(verbose_name='Execution (ms)', null=True, blank=True)
+    shared_hit_blocks = models.BigIntegerField(verbose_name='Shared Hit Blocks', null=True, blank=True)
+    shared_read_blocks = models.BigIntegerField(verbose_name='Shared Read Blocks', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Slow Query'
+        verbose_name_plural = 'Slow Queries'
+        ordering = ['-created_at']
+        db_table = 'pubmed_slow_queries'
+
+    def __str__(self):
+        return f'{self.endpoint}.{self.leg} - {self.elapsed_ms:.0f}ms'
+
+
+class EfSearchProfile(models.Model):
+    """ef_search 调优结果：不同 top_k、过滤选择度下各 ef_search 的召回率和延迟
+
+    由 tune_ef_search 命令生成，检索时据此选择满足目标召回率的最小 ef_search
+    """
+    k = models.IntegerField(verbose_name='K')
+    selectivity = models.FloatField(verbose_name='Filter Selectivity')
+    ef_search = models.IntegerField(verbose_name='ef_search')
+    recall = models.FloatField(verbose_name='Recall')
+    p50_ms = models.FloatField(verbose_name='P50 (ms)')
+    p95_ms = models.FloatField(verbose_name='P95 (ms)')
+    samples = models.IntegerField(verbose_name='Samples')
+    field = models.CharField(max_length=100, verbose_name='Vector Field', default='title_abstract_vec')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Created At')
+
+    class Meta:
+        verbose_name = 'ef_search Profile'
+        verbose_name_plural = 'ef_search Profiles'
+        ordering = ['field', 'k', 'selectivity', 'ef_search']
+        db_table = 'pubmed_ef_search_profiles'
+
+    def __str__(self):
+        return f'k={self.k} selectivity={self.selectivity:.3f} ef_search={self.ef_search} recall={self.recall:.3f}'
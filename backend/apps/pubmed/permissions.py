@@ -2,12 +2,18 @@ from rest_framework.permissions import BasePermission
 from django.conf import settings
 
 
-class APIKeyPermission(BasePermission):
-    def has_permission(self, request, view):
+def has_api_key(request):
+    """校验请求中的 API KEY，同时支持 DRF Request 和 Django HttpRequest
+    """
+    if hasattr(settings, 'PUBMED_API_KEY'):
+        expected_key = settings.PUBMED_API_KEY
+        query_params = getattr(request, 'query_params', request.GET)
+        api_key = request.headers.get('X-API-KEY') or query_params.get('api_key')
+        return api_key == expected_key
+
+    return True
 
-        if hasattr(settings, 'PUBMED_API_KEY'):
-            expected_key = settings.PUBMED_API_KEY
-            api_key = request.headers.get('X-API-KEY') or request.query_params.get('api_key')
-            return api_key == expected_key
 
-        return True
+class APIKeyPermission(BasePermission):
+    def has_permission(self, request, view):
+        return has_api_key(request)
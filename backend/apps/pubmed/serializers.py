@@ -3,21 +3,86 @@ from rest_framework import serializers
 from . import models
 
 
+# 检索结果默认返回的字段
+ARTICLE_FIELDS = [
+    'pmid',
+    'title',
+    'abstract',
+    'year',
+    'pubmed_pubdate',
+    'factor',
+    'jcr',
+    'journal',
+    'pagination',
+    'volume',
+    'authors',
+    'doi',
+    'pmc',
+]
+
+
+# 存放在附表中，只有 fields= 中明确指定时才返回
+OPTIONAL_FIELDS = models.TEXT_FIELDS
+
+
 class PubmedArticleSerializer(serializers.ModelSerializer):
+    # 期刊指标存放在期刊维表中
+    factor = serializers.FloatField(source='journal_ref.factor', default=None, read_only=True)
+    jcr = serializers.CharField(source='journal_ref.jcr', default=None, read_only=True)
+
     class Meta:
         model = models.PubmedArticle
-        fields = [
-            'pmid',
-            'title',
-            'abstract',
-            'year',
-            'pubmed_pubdate',
-            'factor',
-            'jcr',
-            'journal',
-            'pagination',
-            'volume',
-            'authors',
-            'doi',
-            'pmc',
-        ]
+        fields = ARTICLE_FIELDS
+
+
+class SubscriptionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.Subscription
+        fields = ['id', 'name', 'email', 'query', 'filters', 'threshold', 'require_lexical', 'active', 'created_at', 'updated_at']
+        read_only_fields = ['created_at', 'updated_at']
+
+    def validate_filters(self, value):
+        from pubmed.utils.subscriptions import FILTER_BOUNDS
+
+        unknown = set(value or {}) - set(FILTER_BOUNDS)
+        if unknown:
+            raise serializers.ValidationError(f'unknown filters: {sorted(unknown)}')
+        return value
+
+
+class SubscriptionMatchSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.SubscriptionMatch
+        fields = ['id', 'pmid', 'score', 'lexical', 'created_at', 'delivered_at']
+
+
+def get_fields(fields=None):
+    """解析 fields= 投影参数，只保留允许返回的字段，pmid 始终返回
+
+    fields: 逗号分隔的字符串或列表，为空时返回全部默认字段
+    """
+    if not fields:
+        return list(ARTICLE_FIELDS)
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    fields = [field.strip() for field in fields]
+    fields = [field for field in ARTICLE_FIELDS + OPTIONAL_FIELDS if field in fields]
+    if 'pmid' not in fields:
+        fields.insert(0, 'pmid')
+    return fields
+
+
+def serialize_articles(rows, abstract_len=None):
+    """快速序列化：直接处理 values() 返回的字典，不经过 ModelSerializer
+
+    - snippet: 若存在则替换 abstract（ts_headline 生成的摘要片段）
+    - abstract_len: 截断 abstract 到指定长度
+    """
+    data = []
+    for row in rows:
+        if 'snippet' in row:
+            row['abstract'] = row.pop('snippet')
+        if abstract_len and row.get('abstract') and len(row['abstract']) > abstract_len:
+            row['abstract'] = row['abstract'][:abstract_len] + '...'
+        data.append(row)
+    return data
@@ -1,23 +1,184 @@
-from celery import shared_task
-from pubmed_xml import Pubmed_XML_Parser
-from dateutil.parser import parse as date_parse
+from celery import shared_task, chord
+from django.conf import settings
+from django.db import OperationalError, InterfaceError
 
-from pubmed.models import PubmedArticle
+from pubmed.models import SlowQuery
+from pubmed.utils import slow_query, partition, translation, subscriptions, ingest, changes, facets, ann_index
+from pubmed.utils.locks import LeaseLock
 
 
-@shared_task
+@shared_task(ignore_result=True)
 def update_pubmed():
-    print('>>> updating pubmed ...')
-    parser = Pubmed_XML_Parser()
-    result = parser.parse('/work/data/pubmed/work/data/2025/baseline/pubmed24n0001.xml.gz')
-    for article in result:
-        data = article.data
-        data['pubmed_pubdate'] = date_parse(article.pubmed_pubdate).strftime('%F')
-        obj, created = PubmedArticle.objects.update_or_create(
-            pmid=data['pmid'],
-            defaults=data
+    """分发增量入库：按 pmid 分片，每个分片一个任务，全部完成后由 finalize_update 汇总
+
+    上一轮还在进行时（租约锁未释放）直接跳过，不会重复给数据库施加负载
+    """
+    lock = ingest.update_lock()
+    if not lock.acquire():
+        print('>>> previous update is still running, skip')
+        return
+
+    try:
+        files = ingest.pending_files(ingest.list_files())
+    except Exception:
+        lock.release()
+        raise
+    if not files:
+        lock.release()
+        print('>>> no new files')
+        return
+
+    shards = ingest.SHARDS
+    print(f'>>> updating pubmed: {len(files)} files, {shards} shards ...')
+    callback = finalize_update.s(files, shards, lock.token).on_error(release_update_lock.si(lock.token))
+    chord(ingest_shard.s(files, shard, shards, lock.token) for shard in range(shards))(callback)
+
+
+@shared_task(
+    autoretry_for=(OperationalError, InterfaceError),
+    retry_backoff=True,
+    max_retries=3,
+    acks_late=True,
+    soft_time_limit=settings.PUBMED_UPDATE_LEASE,
+)
+def ingest_shard(paths, shard, shards, token):
+    """按文件名顺序入库属于该分片的文章，可重复执行；同一分片正在被其他 worker 处理时跳过
+
+    token: update_pubmed 的租约锁，与分片锁一起在每批写入后续约
+    """
+    lock = LeaseLock(f'ingest_shard:{shard}/{shards}', ttl=settings.PUBMED_UPDATE_LEASE)
+    if not lock.acquire():
+        print(f'>>> shard {shard}/{shards} is being ingested by another worker, skip')
+        return None
+    try:
+        return ingest.ingest_shard(paths, shard, shards, locks=[ingest.update_lock(token), lock])
+    finally:
+        lock.release()
+
+
+@shared_task(ignore_result=True)
+def finalize_update(results, paths, shards, token):
+    try:
+        summary = ingest.finalize(results, paths, shards)
+    finally:
+        ingest.update_lock(token).release()
+    if summary['articles']:
+        process_changes.delay()
+        refresh_facet_rollup.delay()
+
+
+@shared_task(ignore_result=True)
+def refresh_facet_rollup():
+    """增量入库后刷新分面统计的物化视图，多轮入库同时触发时只执行一次
+    """
+    lock = LeaseLock('refresh_facet_rollup', ttl=2 * 60 * 60)
+    if not lock.acquire():
+        print('>>> facet rollup refresh is already running, skip')
+        return
+    try:
+        facets.refresh_rollup()
+    finally:
+        lock.release()
+
+
+@shared_task(ignore_result=True)
+def release_update_lock(token):
+    """chord 中有任务最终失败时释放锁，下一轮重新处理未完成的文件
+    """
+    ingest.update_lock(token).release()
+
+
+@shared_task(ignore_result=True)
+def capture_slow_query(endpoint, elapsed_ms, timings, queries):
+    """对慢请求的召回 SQL 执行 EXPLAIN ANALYZE 并入库
+
+    表中只保留最近 SLOW_QUERY_MAX_ROWS 条，相当于环形缓冲区
+    queries: {leg: (sql, params, vector_source)}，params 中的查询向量为占位符，在这里重新获取
+    """
+    for leg, (sql, params, source) in queries.items():
+        params = slow_query.resolve_params(params, source)
+        if params is None:
+            print(f'>>> skip slow query {endpoint}.{leg}: query vector is unavailable')
+            continue
+        plan = slow_query.explain(sql, params)
+        shape, summary = slow_query.plan_shape(plan)
+        SlowQuery.objects.create(
+            endpoint=endpoint,
+            elapsed_ms=elapsed_ms,
+            timings=timings,
+            leg=leg,
+            sql=sql,
+            params=slow_query.mask_params(params),
+            plan=plan,
+            plan_shape=shape,
+            plan_summary=summary,
+            execution_ms=plan.get('Execution Time'),
+            shared_hit_blocks=plan['Plan'].get('Shared Hit Blocks'),
+            shared_read_blocks=plan['Plan'].get('Shared Read Blocks'),
         )
-        if created:
-            print(f'>>> article created: {article.pmid}')
-        else:
-            print(f'>>> article updated: {article.pmid}')
+
+    max_rows = getattr(settings, 'SLOW_QUERY_MAX_ROWS', 10000)
+    stale = SlowQuery.objects.order_by('-id').values_list('id', flat=True)[max_rows:max_rows+1]
+    if stale:
+        SlowQuery.objects.filter(id__lte=stale[0]).delete()
+
+
+@shared_task(ignore_result=True)
+def maintain_partitions():
+    """提前建好下一年的分区，删除超出保留年限的分区
+    """
+    dropped = partition.maintain()
+    if dropped:
+        print(f'>>> dropped partitions: {dropped}')
+
+
+@shared_task(ignore_result=True)
+def translate_articles(pmids=None, limit=None):
+    """翻译指定的文章（接口排队），pmids 为空时翻译全部待翻译的文章
+    """
+    if pmids:
+        count = translation.translate_pmids(pmids)
+    else:
+        count = translation.run(limit=limit)
+    print(f'>>> translated {count} articles')
+
+
+@shared_task(ignore_result=True)
+def match_subscriptions(pmids):
+    """重新对指定文章做订阅匹配
+    """
+    count = subscriptions.match_articles(pmids)
+    print(f'>>> {count} subscription matches')
+
+
+@shared_task(ignore_result=True)
+def process_changes():
+    """增量流水线：为变化的文章计算向量、按需 ANALYZE、预热缓存
+
+    入库完成后触发，另有定时任务兜底；同一时间只运行一个
+    """
+    lock = changes.pipeline_lock()
+    if not lock.acquire():
+        print('>>> change pipeline is already running, skip')
+        return
+    try:
+        summary = changes.process(lock=lock)
+    finally:
+        lock.release()
+    print(f'>>> change pipeline: {summary}')
+
+
+@shared_task(ignore_result=True)
+def export_ann_index(field='title_abstract_vec'):
+    """VECTOR_BACKEND=mmap 时定时重新导出向量快照，检索进程在 RELOAD_INTERVAL 内切换到新快照
+    """
+    if not ann_index.enabled():
+        return
+    lock = LeaseLock(f'export_ann_index:{field}', ttl=6 * 60 * 60)
+    if not lock.acquire():
+        print('>>> ann index export is already running, skip')
+        return
+    try:
+        ann_index.export(field)
+    finally:
+        lock.release()
@@ -0,0 +1,43 @@
+from collections import Counter
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from pubmed.models import PubmedArticle
+from pubmed.utils import facets
+
+
+@skipUnless(connection.vendor == 'postgresql', 'facets use PostgreSQL-only SQL')
+class FacetSampleTest(TestCase):
+    """宽泛查询的分面抽样不能集中在最早写入的分区（年份）
+    """
+
+    years = [2020, 2021, 2022, 2023, 2024]
+    per_year = 400
+
+    @classmethod
+    def setUpTestData(cls):
+        # 按年份顺序写入，物理顺序与分区扫描顺序一致：未排序的 LIMIT 只会取到最早的年份
+        PubmedArticle.objects.bulk_create([
+            PubmedArticle(pmid=i * cls.per_year + j + 1, year=year, journal=f'Journal {j % 7}', pub_types=['Review'])
+            for i, year in enumerate(cls.years)
+            for j in range(cls.per_year)
+        ])
+
+    def test_sample_spans_partitions(self):
+        rows, matches = facets.sample_rows(facets.query_parser.parse('type:review'), {}, 200, 200 * 5, 'default')
+        counts = Counter(year for _, year, *_ in rows)
+
+        self.assertEqual(len(rows), 200)
+        self.assertEqual(set(counts), set(self.years))
+        self.assertLess(max(counts.values()) / len(rows), 0.4)
+        self.assertLess(abs(matches - len(self.years) * self.per_year) / (len(self.years) * self.per_year), 0.3)
+
+    def test_broad_query_facets(self):
+        result = facets.compute('type:review', facets=['year'], exact_limit=200)
+        counts = {item['value']: item['count'] for item in result['facets']['year']}
+
+        self.assertEqual(result['mode'], 'sample')
+        self.assertEqual(set(counts), set(self.years))
+        self.assertLess(max(counts.values()) / sum(counts.values()), 0.4)
@@ -11,7 +11,7 @@ urlpatterns = []
 
 
 for key, value in views.__dict__.items():
-    if hasattr(value, '__route__') and value.__base__ in [APIView]:
+    if hasattr(value, '__route__') and value.__base__ in [APIView, views.AsyncSearchView]:
         urlpatterns.append(path(f'{value.__route__}/', value.as_view(), name=value.__route__))
 
 router = DefaultRouter()
@@ -0,0 +1,338 @@
+"""
+进程内的内存映射向量检索（VECTOR_BACKEND=mmap 时代替 pgvector 的向量召回）
+
+- export 把向量表的 title_abstract_vec 导出为快照目录：
+    vectors.npy      (n, 维度) float16/float32，L2 归一化后按 IVF 聚类顺序连续存放
+    pmids.npy        int64，与 vectors 的行一一对应
+    years.npy        int16，year 为空时为 0
+    journal_ids.npy  int32，journal_id 为空时为 0
+    centroids.npy    (nlist, 维度) float32，球面 k-means 的聚类中心
+    offsets.npy      int64 (nlist + 1)，第 i 个聚类的行范围为 offsets[i]:offsets[i+1]
+    meta.json
+- 检索进程以 mmap 打开 vectors.npy，同一台机器上的多个副本共享操作系统的页缓存，不占用数据库的 shared_buffers；
+  每个聚类的向量是连续的一段，探测 nprobe 个聚类只读取对应的页
+- year、factor 过滤在 years、journal_ids 数组上计算掩码（factor 按期刊维表的指标映射，指标更新后无需重新导出）；
+  过滤后剩余行数不超过 ANN_BRUTE_FORCE_LIMIT 时直接精确计算，否则 IVF 探测的聚类数按选择度放大
+- 快照写入 {ANN_INDEX_DIR}/{field}.{时间戳} 后原子替换符号链接 {ANN_INDEX_DIR}/{field}，
+  检索进程每 RELOAD_INTERVAL 秒检查一次链接目标，变化时加载新快照
+- 导出之后新增的文章不在快照中（混合检索中仍可由全文召回命中），由定时任务 export_ann_index 重新导出
+- 没有 HNSW：图索引无法以 mmap 的形式在进程间共享，且带过滤条件时需要逐个节点回调，IVF 更适合这里的场景
+"""
+import os
+import json
+import math
+import time
+import shutil
+import threading
+import datetime
+
+import numpy as np
+from django.conf import settings
+
+from pubmed.models import PubmedArticleVector
+from pubmed.utils import journals
+
+
+BACKEND = getattr(settings, 'VECTOR_BACKEND', 'pgvector')
+INDEX_DIR = str(getattr(settings, 'ANN_INDEX_DIR', 'ann_index'))
+NPROBE = getattr(settings, 'ANN_NPROBE', 16)
+BRUTE_FORCE_LIMIT = getattr(settings, 'ANN_BRUTE_FORCE_LIMIT', 50000)
+
+RELOAD_INTERVAL = 30
+# 精确计算时每次从 mmap 读取的行数
+CHUNK_ROWS = 65536
+# 保留的历史快照数，正在使用旧快照的进程在下次检查前仍可读取
+KEEP_SNAPSHOTS = 2
+
+
+def normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-8)
+
+
+def train_centroids(sample, nlist, n_iter=10, seed=42):
+    """球面 k-means：样本和中心都在单位球面上，按内积分配
+    """
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = assign_lists(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        # 空聚类重新随机取一个样本
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+def assign_lists(matrix, centroids):
+    assign = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), CHUNK_ROWS):
+        chunk = np.asarray(matrix[start:start + CHUNK_ROWS], dtype=np.float32)
+        assign[start:start + CHUNK_ROWS] = np.argmax(chunk @ centroids.T, axis=1)
+    return assign
+
+
+def default_nlist(n):
+    return max(1, min(65536, int(4 * math.sqrt(n))))
+
+
+def export(field='title_abstract_vec', dtype='float16', nlist=None, batch_size=10000, root=INDEX_DIR, using='default', log=print):
+    """导出快照并切换符号链接，返回快照目录
+    """
+    start_time = time.time()
+    qs = (
+        PubmedArticleVector.objects.using(using)
+        .filter(**{f'{field}__isnull': False})
+        .order_by('pk')
+        .values_list('pk', 'year', 'journal_ref', field)
+    )
+    n = qs.count()
+    if not n:
+        raise ValueError(f'no vectors in {field}')
+    dimensions = PubmedArticleVector._meta.get_field(field).dimensions
+
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, f'{field}.{datetime.datetime.now():%Y%m%d%H%M%S}')
+    os.makedirs(path)
+
+    # 第一遍：按 pmid 顺序写入临时文件
+    raw = np.lib.format.open_memmap(os.path.join(path, 'raw.npy'), mode='w+', dtype=dtype, shape=(n, dimensions))
+    pmids = np.zeros(n, dtype=np.int64)
+    years = np.zeros(n, dtype=np.int16)
+    journal_ids = np.zeros(n, dtype=np.int32)
+    i = 0
+    batch = []
+
+    def flush():
+        nonlocal i
+        raw[i:i + len(batch)] = normalize([row[3] for row in batch])
+        pmids[i:i + len(batch)] = [row[0] for row in batch]
+        years[i:i + len(batch)] = [row[1] or 0 for row in batch]
+        journal_ids[i:i + len(batch)] = [row[2] or 0 for row in batch]
+        i += len(batch)
+        batch.clear()
+        log(f'>>> {i}/{n} vectors read, {time.time() - start_time:.1f}s')
+
+    for row in qs.iterator(chunk_size=batch_size):
+        if i + len(batch) >= n:
+            # 导出期间新写入的向量留给下一次导出
+            break
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    n = i
+
+    # 训练聚类中心并按聚类重新排序
+    nlist = min(nlist or default_nlist(n), n)
+    rng = np.random.default_rng(42)
+    sample_rows = np.sort(rng.choice(n, min(n, nlist * 64), replace=False))
+    centroids = train_centroids(np.asarray(raw[sample_rows], dtype=np.float32), nlist)
+    assign = assign_lists(raw[:n], centroids)
+    order = np.argsort(assign, kind='stable')
+    offsets = np.zeros(nlist + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(assign, minlength=nlist))
+    log(f'>>> {nlist} lists trained, {time.time() - start_time:.1f}s')
+
+    vectors = np.lib.format.open_memmap(os.path.join(path, 'vectors.npy'), mode='w+', dtype=dtype, shape=(n, dimensions))
+    for start in range(0, n, CHUNK_ROWS):
+        rows = order[start:start + CHUNK_ROWS]
+        # 按行号顺序读取临时文件，减少随机读
+        sorted_rows = np.sort(rows)
+        block = raw[sorted_rows]
+        vectors[start:start + len(rows)] = block[np.searchsorted(sorted_rows, rows)]
+    vectors.flush()
+    del vectors, raw
+    os.remove(os.path.join(path, 'raw.npy'))
+
+    np.save(os.path.join(path, 'pmids.npy'), pmids[:n][order])
+    np.save(os.path.join(path, 'years.npy'), years[:n][order])
+    np.save(os.path.join(path, 'journal_ids.npy'), journal_ids[:n][order])
+    np.save(os.path.join(path, 'centroids.npy'), centroids)
+    np.save(os.path.join(path, 'offsets.npy'), offsets)
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({
+            'field': field,
+            'count': int(n),
+            'dimensions': dimensions,
+            'dtype': dtype,
+            'nlist': int(nlist),
+            'exported_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        }, f)
+
+    switch(root, field, path)
+    cleanup(root, field)
+    log(f'>>> exported {n} vectors to {path} in {time.time() - start_time:.1f}s')
+    return path
+
+
+def switch(root, field, path):
+    link = os.path.join(root, field)
+    tmp = f'{link}.tmp'
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    os.symlink(os.path.basename(path), tmp)
+    os.replace(tmp, link)
+
+
+def cleanup(root, field, keep=KEEP_SNAPSHOTS):
+    snapshots = sorted(
+        name for name in os.listdir(root)
+        if name.startswith(f'{field}.') and name != f'{field}.tmp' and os.path.isdir(os.path.join(root, name))
+    )
+    for name in snapshots[:-keep]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+class AnnIndex(object):
+    """一个只读快照
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+        self.pmids = np.load(os.path.join(path, 'pmids.npy'))
+        self.years = np.load(os.path.join(path, 'years.npy'))
+        self.journal_ids = np.load(os.path.join(path, 'journal_ids.npy'))
+        self.centroids = np.load(os.path.join(path, 'centroids.npy'))
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'))
+        self._factors = (None, None)
+
+    def __len__(self):
+        return len(self.pmids)
+
+    def journal_factors(self):
+        """journal_id -> factor 的稠密数组，期刊指标缓存刷新后重建
+        """
+        metrics = journals.get_metrics('search')
+        if self._factors[0] is not metrics:
+            size = max(max(metrics, default=0), int(self.journal_ids.max(initial=0))) + 1
+            factors = np.full(size, np.nan, dtype=np.float32)
+            for journal_id, values in metrics.items():
+                if values['factor'] is not None:
+                    factors[journal_id] = values['factor']
+            self._factors = (metrics, factors)
+        return self._factors[1]
+
+    def mask(self, year_start=None, year_end=None, factor_min=None, factor_max=None):
+        """过滤条件的行掩码，没有条件时返回 None
+        """
+        mask = None
+
+        def both(condition):
+            return condition if mask is None else mask & condition
+
+        if year_start:
+            mask = both(self.years >= int(year_start))
+        if year_end:
+            mask = both((self.years <= int(year_end)) & (self.years > 0))
+        if factor_min or factor_max:
+            factors = self.journal_factors()[self.journal_ids]
+            # NaN 参与比较为 False，没有指标的文章不满足 factor 条件
+            if factor_min:
+                mask = both(factors >= float(factor_min))
+            if factor_max:
+                mask = both(factors <= float(factor_max))
+        return mask
+
+    def exact(self, query, rows, k):
+        """对给定行精确计算内积，返回 (行号, 分数)，分数从高到低
+        """
+        best_rows, best_scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        for start in range(0, len(rows), CHUNK_ROWS):
+            chunk = rows[start:start + CHUNK_ROWS]
+            scores = np.asarray(self.vectors[chunk], dtype=np.float32) @ query
+            best_rows = np.concatenate([best_rows, chunk])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_rows) > k:
+                top = np.argpartition(-best_scores, k)[:k]
+                best_rows, best_scores = best_rows[top], best_scores[top]
+        order = np.argsort(-best_scores, kind='stable')
+        return best_rows[order], best_scores[order]
+
+    def probe_rows(self, query, nprobe):
+        scores = self.centroids @ query
+        nprobe = min(nprobe, len(scores))
+        lists = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        return np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in np.sort(lists)])
+
+    def search(self, vector, k, filters=None, nprobe=NPROBE, brute_force_limit=BRUTE_FORCE_LIMIT):
+        """返回按余弦距离从小到大排序的 pmid 列表
+        """
+        query = normalize(vector)
+        mask = self.mask(**(filters or {}))
+        count = len(self) if mask is None else int(mask.sum())
+        if count == 0 or k <= 0:
+            return []
+
+        if count <= brute_force_limit:
+            rows = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+        else:
+            # 过滤后留在各聚类中的行按选择度减少，探测的聚类数相应放大
+            selectivity = count / len(self)
+            rows = self.probe_rows(query, int(math.ceil(nprobe / selectivity)))
+            if mask is not None:
+                rows = rows[mask[rows]]
+            if len(rows) < k:
+                rows = np.flatnonzero(mask) if mask is not None else np.arange(len(self))
+        rows, _ = self.exact(query, rows, k)
+        return self.pmids[rows].tolist()
+
+
+_lock = threading.Lock()
+_indexes = {}
+
+
+def enabled():
+    return BACKEND == 'mmap'
+
+
+def get_index(field='title_abstract_vec', root=INDEX_DIR):
+    """当前进程加载的快照，没有快照时返回 None
+    """
+    now = time.time()
+    entry = _indexes.get(field)
+    if entry is not None and entry['checked'] > now - RELOAD_INTERVAL:
+        return entry['index']
+    with _lock:
+        entry = _indexes.get(field)
+        if entry is not None and entry['checked'] > now - RELOAD_INTERVAL:
+            return entry['index']
+        link = os.path.join(root, field)
+        path = os.path.realpath(link) if os.path.exists(link) else None
+        index = entry['index'] if entry is not None else None
+        if path is None:
+            index = None
+        elif index is None or index.path != path:
+            index = AnnIndex(path)
+        _indexes[field] = {'index': index, 'checked': now}
+        return index
+
+
+def search(vector, k, filters=None, field='title_abstract_vec'):
+    """VECTOR_BACKEND=mmap 且快照存在时返回 pmid 列表，否则返回 None（调用方使用 pgvector）
+    """
+    if not enabled():
+        return None
+    index = get_index(field)
+    if index is None:
+        return None
+    return index.search(vector, k, filters={key: value for key, value in (filters or {}).items() if value})
+
+
+def status(field='title_abstract_vec', root=INDEX_DIR):
+    link = os.path.join(root, field)
+    if not os.path.exists(link):
+        return None
+    path = os.path.realpath(link)
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return {**meta, 'path': path, 'size_mb': round(size / 1024 / 1024, 1)}
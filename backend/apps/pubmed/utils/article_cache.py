@@ -0,0 +1,188 @@
+"""
+文章缓存：按 pmid 缓存序列化后的文章 JSON
+
+- 进程内 LRU -> Redis MGET -> PostgreSQL，只有未命中的 pmid 才查询数据库
+- 缓存内容为 ARTICLE_FIELDS 的完整行，读取时按 fields 投影；附表字段和 snippet 不走缓存
+- 期刊指标（factor、jcr）不进入缓存，缓存中保存 journal_id，读取时从进程内的期刊指标表合并
+- 文章入库/更新时由 articles.save_article 删除 Redis 中的缓存；其他进程的 LRU 依靠较短的 TTL 过期
+"""
+import time
+import threading
+from collections import OrderedDict
+
+import orjson
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from pubmed.models import PubmedArticle, JOURNAL_FIELDS
+from pubmed.serializers import ARTICLE_FIELDS
+from pubmed.utils import journals
+from pubmed.utils.metrics import ARTICLE_CACHE_REQUESTS
+
+
+# 缓存内容的字段变化时修改版本号，旧缓存自动失效
+CACHE_VERSION = 2
+
+# 缓存的字段：文章表中的 ARTICLE_FIELDS，期刊指标以 journal_id 代替
+CACHED_FIELDS = [field for field in ARTICLE_FIELDS if field not in JOURNAL_FIELDS] + ['journal_id']
+
+CACHE_TIMEOUT = getattr(settings, 'ARTICLE_CACHE_TIMEOUT', 7 * 24 * 3600)
+LRU_SIZE = getattr(settings, 'ARTICLE_CACHE_LRU_SIZE', 10000)
+LRU_TTL = getattr(settings, 'ARTICLE_CACHE_LRU_TTL', 60)
+
+
+def cache_key(pmid):
+    return f'article:v{CACHE_VERSION}:{pmid}'
+
+
+class LRUCache(object):
+    """线程安全的进程内 LRU，条目超过 ttl 秒后视为未命中
+    """
+
+    def __init__(self, maxsize=LRU_SIZE, ttl=LRU_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        result = {}
+        with self.lock:
+            for key in keys:
+                item = self.data.get(key)
+                if item is None:
+                    continue
+                expires, value = item
+                if expires < now:
+                    del self.data[key]
+                    continue
+                self.data.move_to_end(key)
+                result[key] = value
+        return result
+
+    def set_many(self, mapping):
+        if not self.maxsize:
+            return
+        expires = time.monotonic() + self.ttl
+        with self.lock:
+            for key, value in mapping.items():
+                self.data[key] = (expires, value)
+                self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+_lru = LRUCache()
+
+
+def cacheable(fields=None, snippet=False):
+    """附表字段需要关联查询，snippet 与查询相关，都不走缓存
+
+    ARTICLE_CACHE_ENABLED 在运行时读取，基准测试在合成语料上运行时会关闭
+    """
+    if not getattr(settings, 'ARTICLE_CACHE_ENABLED', True):
+        return False
+    return not snippet and all(field in ARTICLE_FIELDS for field in fields or [])
+
+
+def project(row, fields, using='default'):
+    metrics = [field for field in fields if field in JOURNAL_FIELDS]
+    if metrics:
+        row = journals.attach_metrics(dict(row), metrics, using=using)
+    return {field: row.get(field) for field in fields}
+
+
+def _lookup_local(pmids):
+    """返回 ({pmid: row}, 未命中的 pmid 列表)
+    """
+    found = _lru.get_many(pmids)
+    ARTICLE_CACHE_REQUESTS.labels('local').inc(len(found))
+    return found, [pmid for pmid in pmids if pmid not in found]
+
+
+def _decode_remote(values, missing):
+    """Redis 中存放 orjson 序列化后的字节串
+    """
+    found = {}
+    for pmid in missing:
+        data = values.get(cache_key(pmid))
+        if data is not None:
+            found[pmid] = orjson.loads(data)
+    ARTICLE_CACHE_REQUESTS.labels('redis').inc(len(found))
+    _lru.set_many(found)
+    return found
+
+
+def _encode_rows(rows):
+    """返回 ({pmid: row}, {cache_key: bytes})
+
+    数据库的行经过一次 JSON 往返，日期等类型与缓存命中时一致
+    """
+    found, values = {}, {}
+    for row in rows:
+        data = orjson.dumps(row)
+        found[row['pmid']] = orjson.loads(data)
+        values[cache_key(row['pmid'])] = data
+    ARTICLE_CACHE_REQUESTS.labels('db').inc(len(found))
+    _lru.set_many(found)
+    return found, values
+
+
+def get_articles(pmids, fields=None, using='default'):
+    """按 pmid 批量读取文章，返回投影后的字典列表并保持 pmids 的顺序
+    """
+    fields = fields or ARTICLE_FIELDS
+    found, missing = _lookup_local(pmids)
+    if missing:
+        found.update(_decode_remote(cache.get_many([cache_key(pmid) for pmid in missing]), missing))
+        missing = [pmid for pmid in missing if pmid not in found]
+    if missing:
+        rows = (
+            PubmedArticle.objects.using(using)
+            .filter(pmid__in=missing)
+            .values(*CACHED_FIELDS[:-1], journal_id=F('journal_ref'))
+        )
+        rows, values = _encode_rows(rows)
+        found.update(rows)
+        cache.set_many(values, CACHE_TIMEOUT)
+    return [project(found[pmid], fields, using=using) for pmid in pmids if pmid in found]
+
+
+async def aget_articles(pmids, fetch, fields=None, using='search'):
+    """异步版本，fetch(missing) 为查询数据库的协程，返回 CACHED_FIELDS 的行
+
+    期刊指标表在首次加载或过期时同步查询一次，之后为纯内存读取
+    """
+    fields = fields or ARTICLE_FIELDS
+    found, missing = _lookup_local(pmids)
+    if missing:
+        found.update(_decode_remote(await cache.aget_many([cache_key(pmid) for pmid in missing]), missing))
+        missing = [pmid for pmid in missing if pmid not in found]
+    if missing:
+        rows, values = _encode_rows(await fetch(missing))
+        found.update(rows)
+        await cache.aset_many(values, CACHE_TIMEOUT)
+    if any(field in JOURNAL_FIELDS for field in fields):
+        await sync_to_async(journals.get_metrics)(using)
+    return [project(found[pmid], fields, using=using) for pmid in pmids if pmid in found]
+
+
+def invalidate(pmids):
+    """文章写入后调用，删除 Redis 和当前进程 LRU 中的缓存
+    """
+    if not pmids:
+        return
+    _lru.delete_many(pmids)
+    cache.delete_many([cache_key(pmid) for pmid in pmids])
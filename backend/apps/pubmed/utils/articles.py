@@ -0,0 +1,210 @@
+"""
+文章入库：文章表和附表分开写入
+
+- pubmed_articles: 检索过滤和展示用的元数据
+- pubmed_article_texts: 中文摘要、作者单位
+- pubmed_article_vectors: 向量，冗余 year、journal_id 供向量召回过滤
+- pubmed_journals: 期刊指标，文章按 eISSN/ISSN 关联（见 journals.py）
+- pubmed_article_keys: pmid 登记表，不分区、pmid 为主键；分区后的文章表、向量表上 pmid 没有唯一约束，
+  写入前先在登记表中 INSERT ... ON CONFLICT 并锁定该行，同一 pmid 的写入串行执行
+"""
+from django.db import connections, transaction, IntegrityError
+from loguru import logger
+
+from pubmed.utils import article_cache, subscriptions, journals
+from pubmed.models import PubmedArticle, PubmedArticleKey, PubmedArticleText, PubmedArticleVector, ArticleChange, TEXT_FIELDS, VECTOR_FIELDS, JOURNAL_FIELDS
+
+
+KEY_TABLE = PubmedArticleKey._meta.db_table
+
+
+def split_article(data, using='default'):
+    """将解析得到的文章字典拆分为 (文章表字段, 附表字段)
+
+    期刊指标不写入文章表，按 ISSN 解析为 journal_id
+    """
+    skip = set(TEXT_FIELDS) | set(VECTOR_FIELDS) | set(JOURNAL_FIELDS)
+    article = {key: value for key, value in data.items() if key not in skip}
+    article['journal_ref_id'] = journals.resolve(data, using=using)
+    text = {key: data[key] for key in TEXT_FIELDS if data.get(key) is not None}
+    return article, text
+
+
+def register(pmid, year, using='default'):
+    """在 pubmed_article_keys 中登记 pmid 并锁定该行，返回 (是否新文章, 登记表中原来的年份)
+
+    必须在事务中调用，行锁持有到事务结束：同一 pmid 的其他写入在 INSERT ... ON CONFLICT 或 FOR UPDATE 处等待，
+    不会同时判断为新文章而重复插入
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {KEY_TABLE} (pmid, year) VALUES (%s, %s) ON CONFLICT (pmid) DO NOTHING RETURNING pmid',
+            [pmid, year],
+        )
+        if cursor.fetchone():
+            return True, year
+        cursor.execute(f'SELECT year FROM {KEY_TABLE} WHERE pmid = %s FOR UPDATE', [pmid])
+        old_year = cursor.fetchone()[0]
+        if old_year != year:
+            cursor.execute(f'UPDATE {KEY_TABLE} SET year = %s WHERE pmid = %s', [year, pmid])
+    return False, old_year
+
+
+def register_many(rows, using='default'):
+    """批量登记 [(pmid, year)]，返回本次新登记的 pmid 集合，已登记的不做修改
+    """
+    if not rows:
+        return set()
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'''
+            INSERT INTO {KEY_TABLE} (pmid, year)
+            SELECT * FROM unnest(%s::integer[], %s::integer[])
+            ON CONFLICT (pmid) DO NOTHING
+            RETURNING pmid
+        ''', [[pmid for pmid, _ in rows], [year for _, year in rows]])
+        return {row[0] for row in cursor.fetchall()}
+
+
+def lock_keys(pmids, using='default'):
+    """按 pmid 顺序锁定登记行，批量写入向量时使用；固定的加锁顺序避免与入库事务死锁
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'SELECT pmid FROM {KEY_TABLE} WHERE pmid = ANY(%s) ORDER BY pmid FOR UPDATE',
+            [sorted(set(pmids))],
+        )
+
+
+def save_text(pmid, text_data, using='default'):
+    PubmedArticleText.objects.using(using).bulk_create(
+        [PubmedArticleText(article_id=pmid, **text_data)],
+        update_conflicts=True,
+        unique_fields=['article'],
+        update_fields=list(text_data),
+    )
+
+
+def save_article(data, using='default'):
+    """插入或更新一篇文章，返回 (article, created)
+
+    先登记 pmid（见 register），并发写入同一 pmid 时依次执行；
+    年份变化时 UPDATE 由 PostgreSQL 把文章行、向量行移动到新年份的分区
+    同时在 pubmed_article_changes 中记录变化，由增量流水线计算向量、预热缓存
+    """
+    article_data, text_data = split_article(data, using=using)
+    pmid = article_data['pmid']
+    with transaction.atomic(using=using):
+        created, old_year = register(pmid, article_data.get('year'), using=using)
+        qs = PubmedArticle.objects.using(using).filter(pmid=pmid)
+        previous = None if created else qs.values_list('title', 'abstract').first()
+        if previous is None:
+            # 已登记但文章行不存在（所在年份的分区已删除）时按新文章插入
+            created = True
+            article = PubmedArticle.objects.using(using).create(**article_data)
+        else:
+            qs.update(**{key: value for key, value in article_data.items() if key != 'pmid'})
+            article = PubmedArticle(**article_data)
+        ArticleChange.objects.using(using).create(
+            pmid=pmid,
+            created=created,
+            text_changed=previous != (article.title, article.abstract),
+        )
+        if text_data:
+            save_text(pmid, text_data, using=using)
+        if not created:
+            # 年份、期刊可能随更新变化，保持向量表中的冗余字段一致
+            PubmedArticleVector.objects.using(using).filter(pk=pmid).update(year=article.year, journal_ref_id=article.journal_ref_id)
+            # 提交后再删除缓存，避免其他请求在提交前把旧数据重新写回缓存
+            transaction.on_commit(lambda: article_cache.invalidate([pmid]), using=using)
+    return article, created
+
+
+def create_article(data, using='default'):
+    """插入一篇新文章，pmid 已存在时抛出 IntegrityError
+    """
+    article_data, text_data = split_article(data, using=using)
+    with transaction.atomic(using=using):
+        if not register_many([(article_data['pmid'], article_data.get('year'))], using=using):
+            raise IntegrityError(f"pmid {article_data['pmid']} already exists")
+        article = PubmedArticle.objects.using(using).create(**article_data)
+        if text_data:
+            PubmedArticleText.objects.using(using).create(article_id=article.pmid, **text_data)
+    return article
+
+
+def bulk_create_articles(rows, using='default'):
+    """批量插入，rows 为文章字典列表
+
+    pmid 通过登记表判断是否已存在，新文章批量插入，已存在的（或同一批中重复的）逐条按 save_article 更新
+    """
+    rows = {int(data['pmid']): data for data in rows}
+    articles, texts, existing = [], [], []
+    with transaction.atomic(using=using):
+        created = register_many([(pmid, data.get('year')) for pmid, data in rows.items()], using=using)
+        for pmid, data in rows.items():
+            if pmid not in created:
+                existing.append(data)
+                continue
+            article_data, text_data = split_article(data, using=using)
+            articles.append(PubmedArticle(**article_data))
+            if text_data:
+                texts.append(PubmedArticleText(article_id=article_data['pmid'], **text_data))
+        PubmedArticle.objects.using(using).bulk_create(articles)
+        PubmedArticleText.objects.using(using).bulk_create(texts)
+    for data in existing:
+        save_article(data, using=using)
+    return len(articles)
+
+
+def save_vectors(rows, field, batch_size=2000, using='default'):
+    """写入向量，已有记录更新、没有的插入
+
+    rows: [(pmid, vector), ...]
+    分区后的向量表上 pmid 没有唯一约束，不能使用 ON CONFLICT；先按 pmid 顺序锁定登记行，
+    在同一事务内判断已有记录，与并发的入库、流水线任务不会重复插入
+    首次写入 title_abstract_vec 的文章写入后与订阅做匹配
+    """
+    # 同一 pmid 出现多次时以最后一个为准
+    rows = list(dict(rows).items())
+    pmids = [pmid for pmid, _ in rows]
+    match_new = field == subscriptions.VECTOR_FIELD
+    meta = {
+        row['pmid']: row
+        for row in PubmedArticle.objects.using(using).filter(pmid__in=pmids).values('pmid', 'year', 'journal_ref')
+    }
+    objs = [
+        PubmedArticleVector(
+            article_id=pmid,
+            year=meta.get(pmid, {}).get('year'),
+            journal_ref_id=meta.get(pmid, {}).get('journal_ref'),
+            **{field: vector},
+        )
+        for pmid, vector in rows
+    ]
+    with transaction.atomic(using=using):
+        lock_keys(pmids, using=using)
+        if match_new:
+            # 该列此前没有向量的文章视为新文章，与订阅做匹配
+            fresh = set(pmids) - set(
+                PubmedArticleVector.objects.using(using)
+                .filter(pk__in=pmids, **{f'{field}__isnull': False})
+                .values_list('pk', flat=True)
+            )
+        existing = set(PubmedArticleVector.objects.using(using).filter(pk__in=pmids).values_list('pk', flat=True))
+        PubmedArticleVector.objects.using(using).bulk_update(
+            [obj for obj in objs if obj.pk in existing],
+            [field, 'year', 'journal_ref'],
+            batch_size=batch_size,
+        )
+        PubmedArticleVector.objects.using(using).bulk_create(
+            [obj for obj in objs if obj.pk not in existing],
+            batch_size=batch_size,
+        )
+
+    if match_new and fresh:
+        try:
+            subscriptions.match_articles([pmid for pmid in pmids if pmid in fresh], using=using)
+        except Exception as e:
+            # 匹配失败不影响向量入库，可通过 match_subscriptions 任务重新匹配
+            logger.warning(f'subscription matching failed: {e}')
+    return len(objs)
@@ -0,0 +1,243 @@
+"""
+异步检索：异步 embedding + 异步 psycopg 召回
+
+单个 ASGI worker 在等待 Azure embedding 和数据库时不会被阻塞，
+可以同时处理大量并发请求
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+import numpy as np
+
+from pubmed.models import PubmedArticle, PubmedArticleVector, PubmedArticleText, Journal, JOURNAL_FIELDS
+from pubmed.serializers import get_fields, OPTIONAL_FIELDS
+from pubmed.utils.search import rrf_fuse, EMBED_MODEL, EMBED_DIMENSIONS, BM25_TOPN, VECTOR_TOPN
+from pubmed.utils import article_cache, query_parser, journals, single_flight, embed_batcher, ann_index
+from pubmed.utils.pool import get_async_pool
+from pubmed.utils.metrics import maybe_stage
+from pubmed.utils.vector_index import distance_sql
+
+
+TABLE = PubmedArticle._meta.db_table
+VECTOR_TABLE = PubmedArticleVector._meta.db_table
+TEXT_TABLE = PubmedArticleText._meta.db_table
+JOURNAL_TABLE = Journal._meta.db_table
+
+
+async def aget_query_vector(query, model=EMBED_MODEL, dimensions=EMBED_DIMENSIONS, cache_timeout=24*3600, trace=None):
+    """异步获取查询向量，与同步接口共用 embed: 缓存
+    """
+    cache_key = f"embed:{query}" if model == EMBED_MODEL else f"embed:{model}:{query}"
+    with maybe_stage(trace, 'cache_lookup'):
+        vector = await cache.aget(cache_key)
+    hit = vector is not None and len(vector) == dimensions
+    if trace is not None:
+        trace.cache('embed', hit)
+    if not hit:
+        async def embed():
+            vector = tuple(await embed_batcher.aembed_query(query, model))
+            await cache.aset(cache_key, vector, cache_timeout)
+            return vector
+
+        with maybe_stage(trace, 'embed'):
+            vector = await single_flight.ado(
+                single_flight.make_key('embed', model, query), embed, kind='embed', result_key=cache_key, trace=trace,
+            )
+    return vector
+
+
+def build_filters(year_start=None, year_end=None, factor_min=None, factor_max=None):
+    """将过滤参数转换为 SQL 条件和参数，文章表和向量表通用（factor 通过 journal_id 关联期刊表）
+    """
+    where, params = [], []
+    if year_start:
+        where.append('year >= %s')
+        params.append(int(year_start))
+    if year_end:
+        where.append('year <= %s')
+        params.append(int(year_end))
+    factor_where, factor_params = journals.factor_sql(factor_min, factor_max)
+    if factor_where:
+        where.append(factor_where)
+        params.extend(factor_params)
+    return where, params
+
+
+async def bm25_recall(cursor, parsed, where, params, limit, trace=None):
+    """parsed: query_parser.ParsedQuery，没有自由文本时按发表日期排序
+    """
+    if parsed.text:
+        order, order_params = "ts_rank(ts_en, websearch_to_tsquery('english', %s)) DESC", [parsed.text]
+    else:
+        order, order_params = 'pubmed_pubdate DESC NULLS LAST', []
+    sql = f'''
+        SELECT pmid
+        FROM {TABLE}
+        WHERE {' AND '.join([f'({parsed.where})'] + where)}
+        ORDER BY {order}
+        LIMIT %s
+    '''
+    params = [*parsed.params, *params, *order_params, limit]
+    if trace is not None:
+        trace.query('lexical', (sql, params))
+    await cursor.execute(sql, params)
+    return [row['pmid'] for row in await cursor.fetchall()]
+
+
+async def vector_recall(cursor, vector, where, params, limit, field='title_abstract_vec', source=None, trace=None):
+    """source: 查询向量的来源，记录在 trace 中供慢查询任务重新获取向量
+    """
+    sql = f'''
+        SELECT pmid
+        FROM {VECTOR_TABLE}
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY {distance_sql(field)}
+        LIMIT %s
+    '''
+    params = [*params, vector, limit]
+    if trace is not None:
+        trace.query('vector', (sql, params), vector=source)
+    await cursor.execute(sql, params)
+    return [row['pmid'] for row in await cursor.fetchall()]
+
+
+async def set_ef_search(cursor, ef_search):
+    """连接池中的连接处于事务内，set_config(..., true) 只在本次请求的事务内生效
+    """
+    if ef_search and ef_search != settings.SEARCH_SESSION_PARAMS.get('hnsw.ef_search'):
+        await cursor.execute("SELECT set_config('hnsw.ef_search', %s, true)", [str(ef_search)])
+
+
+def select_columns(fields):
+    """返回 (columns, joins)，文章表别名为 a，附表别名为 t，期刊表别名为 j
+
+    fields 中的 journal_id 返回文章表上的期刊 id
+    """
+    columns = [f'a.{field}' for field in fields if field not in OPTIONAL_FIELDS and field not in JOURNAL_FIELDS]
+    joins = []
+    text_fields = [field for field in fields if field in OPTIONAL_FIELDS]
+    if text_fields:
+        # 附表中的字段只在请求时关联查询
+        columns += [f't.{field}' for field in text_fields]
+        joins.append(f'LEFT JOIN {TEXT_TABLE} t ON t.pmid = a.pmid')
+    journal_fields = [field for field in fields if field in JOURNAL_FIELDS]
+    if journal_fields:
+        columns += [f'j.{field}' for field in journal_fields]
+        joins.append(f'LEFT JOIN {JOURNAL_TABLE} j ON j.id = a.journal_id')
+    return columns, ' '.join(joins)
+
+
+async def hydrate(cursor, pmids, fields=None, query=None, snippet=False):
+    """按 pmid 回表取展示字段，并保持传入的顺序
+    """
+    if not pmids:
+        return []
+    fields = get_fields(fields)
+    if article_cache.cacheable(fields, snippet=bool(snippet and query)):
+        async def fetch(missing):
+            columns, _ = select_columns(article_cache.CACHED_FIELDS)
+            await cursor.execute(f'SELECT {", ".join(columns)} FROM {TABLE} a WHERE a.pmid = ANY(%s)', [missing])
+            return await cursor.fetchall()
+        return await article_cache.aget_articles(pmids, fetch, fields)
+
+    columns, joins = select_columns(fields)
+    params = []
+    if snippet and query and 'abstract' in fields:
+        columns.remove('a.abstract')
+        columns.append("ts_headline('english', a.abstract, plainto_tsquery('english', %s), 'MaxFragments=2') AS snippet")
+        params.append(query)
+    sql = f'SELECT {", ".join(columns)} FROM {TABLE} a {joins} WHERE a.pmid = ANY(%s)'
+    await cursor.execute(sql, [*params, list(pmids)])
+    row_map = {row['pmid']: row for row in await cursor.fetchall()}
+    return [row_map[pid] for pid in pmids if pid in row_map]
+
+
+async def hybrid_search_async(query,
+                              filters=None,
+                              start=0,
+                              top_k=10,
+                              bm25_topn=BM25_TOPN,
+                              vector_topn=VECTOR_TOPN,
+                              fields=None,
+                              snippet=False,
+                              ef_search=None,
+                              trace=None,
+    ):
+    """异步混合检索：BM25 + 向量召回，RRF 融合后回表
+
+    query 支持字段查询语法，字段条件通过子查询同时作用在向量召回上
+    """
+    parsed = query_parser.parse(query)
+    # 先拿到向量，再占用数据库连接
+    vector = None
+    if parsed.text:
+        vector = np.array(await aget_query_vector(parsed.text, trace=trace), dtype=np.float32)
+    where, params = build_filters(**(filters or {}))
+    vector_where, vector_params = query_parser.vector_filter(parsed, TABLE)
+
+    # VECTOR_BACKEND=mmap 时没有字段条件的查询在进程内检索，numpy 计算放到线程中执行，不阻塞事件循环
+    vector_list, mmap_list = [], None
+    if vector is not None and not vector_where and ann_index.enabled():
+        with maybe_stage(trace, 'vector_recall'):
+            mmap_list = await sync_to_async(ann_index.search, thread_sensitive=False)(vector, vector_topn, filters)
+        if mmap_list is not None:
+            vector_list = mmap_list
+            if trace is not None:
+                trace.set('vector_backend', 'mmap')
+
+    # hnsw.ef_search、work_mem 已在连接池建立连接时设置
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cursor:
+            with maybe_stage(trace, 'lexical_recall'):
+                bm25_list = await bm25_recall(cursor, parsed, where, params, bm25_topn, trace=trace)
+            if vector is not None and mmap_list is None:
+                with maybe_stage(trace, 'vector_recall'):
+                    await set_ef_search(cursor, ef_search)
+                    vector_list = await vector_recall(
+                        cursor,
+                        vector,
+                        where + ([vector_where] if vector_where else []),
+                        params + vector_params,
+                        vector_topn,
+                        source={'query': parsed.text, 'model': EMBED_MODEL},
+                        trace=trace,
+                    )
+            if trace is not None:
+                trace.count('lexical', len(bm25_list))
+                trace.count('vector', len(vector_list))
+
+            with maybe_stage(trace, 'fusion'):
+                final_pmids = rrf_fuse(bm25_list, vector_list)[start:start+top_k]
+            with maybe_stage(trace, 'hydration'):
+                return await hydrate(cursor, final_pmids, fields=fields, query=parsed.text, snippet=snippet)
+
+
+async def fetch_articles_async(pmids, fields=None):
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cursor:
+            return await hydrate(cursor, pmids, fields=fields)
+
+
+async def vector_search_async(query, filters=None, start=0, top_k=10, fields=None, ef_search=None, trace=None):
+    """异步纯向量检索，与 PubmedSearchView 一致使用 3072 维的 title_abstract_vector
+    """
+    vector = await aget_query_vector(query, model='text-embedding-3-large', dimensions=3072, trace=trace)
+    vector = np.array(vector, dtype=np.float32)
+    where, params = build_filters(**(filters or {}))
+
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cursor:
+            with maybe_stage(trace, 'vector_recall'):
+                await set_ef_search(cursor, ef_search)
+                pmids = await vector_recall(
+                    cursor, vector, where, params, start + top_k,
+                    field='title_abstract_vector',
+                    source={'query': query, 'model': 'text-embedding-3-large'},
+                    trace=trace,
+                )
+            with maybe_stage(trace, 'hydration'):
+                return await hydrate(cursor, pmids[start:], fields=fields)
@@ -0,0 +1,271 @@
+"""
+离线基准测试工具：合成语料、查询负载、延迟统计
+
+合成语料的向量与 utils.llm.FakeEmbeddings 使用同一套词向量，
+因此查询向量和文档向量在离线环境下依然是“语义”相关的
+"""
+import json
+import time
+import random
+import datetime
+
+import numpy as np
+from django.db import connections, transaction
+
+from utils.llm import token_vector
+
+
+SYLLABLES = [
+    'ca', 'ri', 'no', 'ge', 'ne', 'to', 'mi', 'la', 'pro', 'te', 'in', 'ase', 'cy', 'to', 'kin', 'lym', 'pho',
+    'neu', 'ro', 'car', 'dio', 'hep', 'at', 'onc', 'ol', 'im', 'mu', 'vir', 'bac', 'ter', 'gly', 'co', 'lip',
+    'id', 'mel', 'an', 'oma', 'sar', 'path', 'ic', 'al', 'tion', 'ous', 'gen', 'ex', 'pre', 'syn', 'dys',
+]
+
+COMMON_WORDS = [
+    'the', 'of', 'and', 'in', 'to', 'a', 'with', 'for', 'patients', 'study', 'results', 'was', 'were', 'we',
+    'analysis', 'associated', 'risk', 'treatment', 'clinical', 'expression', 'cells', 'cancer', 'data',
+    'group', 'compared', 'significant', 'increased', 'methods', 'model', 'effect', 'between', 'using',
+]
+
+CURRENT_YEAR = datetime.date.today().year
+
+# 最近 5 年的文章数量逐年增加
+YEAR_WEIGHTS = [0.14, 0.17, 0.2, 0.23, 0.26]
+
+
+class SyntheticCorpus(object):
+    """确定性的合成语料生成器
+
+    - 标题约 14 个词，摘要约 230 个词，词频服从 Zipf 分布，每篇文章属于一个主题
+    - 年份集中在最近 5 年，影响因子服从对数正态分布，按期刊划分
+    """
+
+    def __init__(self, seed=42, vocab_size=8000, n_topics=50, n_journals=500, dimensions=1536):
+        self.rng = np.random.default_rng(seed)
+        self.dimensions = dimensions
+
+        words = set(COMMON_WORDS)
+        while len(words) < vocab_size:
+            n = self.rng.integers(2, 5)
+            words.add(''.join(self.rng.choice(SYLLABLES, n)))
+        self.vocab = sorted(words)
+
+        # Zipf 词频
+        ranks = np.arange(1, len(self.vocab) + 1)
+        self.word_probs = 1.0 / ranks
+        self.word_probs /= self.word_probs.sum()
+
+        self.topics = [self.rng.choice(len(self.vocab), 300, replace=False) for _ in range(n_topics)]
+
+        self.journals = []
+        for n in range(n_journals):
+            factor = round(float(self.rng.lognormal(1.0, 0.7)), 3)
+            self.journals.append({
+                'id': n + 1,
+                'journal': f'Journal of {self.vocab[n * 7 % len(self.vocab)].title()} Research {n}',
+                'issn': f'{1000 + n:04d}-{n % 10000:04d}',
+                'factor': factor,
+                'jcr': jcr_of(factor),
+            })
+
+        self._vocab_matrix = None
+
+    @property
+    def vocab_matrix(self):
+        if self._vocab_matrix is None:
+            self._vocab_matrix = np.stack([token_vector(word, self.dimensions) for word in self.vocab])
+        return self._vocab_matrix
+
+    def sample_words(self, topic, n):
+        n_topic = int(n * 0.6)
+        topic_words = self.rng.choice(self.topics[topic], n_topic)
+        global_words = self.rng.choice(len(self.vocab), n - n_topic, p=self.word_probs)
+        ids = np.concatenate([topic_words, global_words])
+        self.rng.shuffle(ids)
+        return ids
+
+    def text_vector(self, ids):
+        """与 FakeEmbeddings.embed_query 结果一致
+        """
+        vector = self.vocab_matrix[ids].sum(axis=0)
+        return vector / (np.linalg.norm(vector) + 1e-8)
+
+    def article(self, pmid):
+        topic = int(self.rng.integers(len(self.topics)))
+        title_ids = self.sample_words(topic, int(np.clip(self.rng.normal(14, 4), 4, 40)))
+        abstract_ids = self.sample_words(topic, int(np.clip(self.rng.normal(230, 70), 50, 500)))
+        title = ' '.join(self.vocab[i] for i in title_ids).capitalize()
+        abstract = ' '.join(self.vocab[i] for i in abstract_ids).capitalize() + '.'
+
+        year = CURRENT_YEAR - len(YEAR_WEIGHTS) + 1 + int(self.rng.choice(len(YEAR_WEIGHTS), p=YEAR_WEIGHTS))
+        pubdate = datetime.date(year, int(self.rng.integers(1, 13)), int(self.rng.integers(1, 29)))
+        journal = self.journals[int(self.rng.integers(len(self.journals)))]
+
+        # 与 embedding_calc 一致，对 "title abstract" 整体计算向量
+        ids = np.concatenate([title_ids, abstract_ids])
+
+        return {
+            'pmid': pmid,
+            'title': title,
+            'abstract': abstract,
+            'journal': journal['journal'],
+            'issn': journal['issn'],
+            'year': year,
+            'pubmed_pubdate': pubdate,
+            'journal_id': journal['id'],
+            'authors': json.dumps([f'{self.vocab[i].title()} {chr(65 + i % 26)}' for i in self.rng.choice(len(self.vocab), 5)]),
+            'pub_types': json.dumps(['Journal Article']),
+            'title_abstract_vec': '[' + ','.join(f'{x:.6f}' for x in self.text_vector(ids)) + ']',
+        }
+
+    def articles(self, n, start_pmid=1):
+        for pmid in range(start_pmid, start_pmid + n):
+            yield self.article(pmid)
+
+
+def jcr_of(factor):
+    if factor >= 6:
+        return 'Q1'
+    if factor >= 3:
+        return 'Q2'
+    if factor >= 1.5:
+        return 'Q3'
+    return 'Q4'
+
+
+def set_search_path(schema, aliases=('search',)):
+    """通过连接参数设置 search_path，必须在对应连接建立前调用
+
+    所有引擎（ORM、异步 psycopg）都会查询 schema 下的 pubmed_articles、pubmed_article_vectors、pubmed_journals
+    """
+    for alias in aliases:
+        settings_dict = connections[alias].settings_dict
+        options = settings_dict.setdefault('OPTIONS', {})
+        options['options'] = ' '.join(filter(None, [options.get('options'), f'-c search_path={schema},public']))
+
+
+def create_corpus(schema, n, batch_size=5000, seed=42, m=16, ef_construction=200, log=print):
+    """在独立 schema 中生成合成语料并建立索引
+    """
+    corpus = SyntheticCorpus(seed=seed)
+    columns = [
+        'pmid', 'title', 'abstract', 'journal', 'issn', 'year', 'pubmed_pubdate',
+        'journal_id', 'authors', 'pub_types',
+    ]
+    vector_columns = ['pmid', 'year', 'journal_id', 'title_abstract_vec']
+    journal_columns = ['id', 'journal', 'issn', 'factor', 'jcr']
+
+    with connections['default'].cursor() as cursor:
+        cursor.execute(f'DROP SCHEMA IF EXISTS {schema} CASCADE')
+        cursor.execute(f'CREATE SCHEMA {schema}')
+        cursor.execute(f'CREATE TABLE {schema}.pubmed_articles (LIKE public.pubmed_articles INCLUDING DEFAULTS)')
+        cursor.execute(f'ALTER TABLE {schema}.pubmed_articles DROP COLUMN IF EXISTS ts_en')
+        cursor.execute(f'''
+            ALTER TABLE {schema}.pubmed_articles
+            ADD COLUMN ts_en tsvector GENERATED ALWAYS AS (
+                setweight(to_tsvector('english', coalesce(title,'')), 'A')
+                ||
+                setweight(to_tsvector('english', coalesce(abstract,'')), 'B')
+            ) STORED
+        ''')
+        cursor.execute(f'ALTER TABLE {schema}.pubmed_articles ADD PRIMARY KEY (pmid)')
+        cursor.execute(f'CREATE TABLE {schema}.pubmed_article_vectors (LIKE public.pubmed_article_vectors INCLUDING DEFAULTS)')
+        cursor.execute(f'ALTER TABLE {schema}.pubmed_article_vectors ADD PRIMARY KEY (pmid)')
+        cursor.execute(f'CREATE TABLE {schema}.pubmed_journals (LIKE public.pubmed_journals INCLUDING DEFAULTS)')
+        cursor.execute(f'ALTER TABLE {schema}.pubmed_journals ADD PRIMARY KEY (id)')
+
+        start_time = time.time()
+        with cursor.copy(f'COPY {schema}.pubmed_journals (id, name, issn, factor, jcr) FROM STDIN') as copy:
+            for journal in corpus.journals:
+                copy.write_row([journal[col] for col in journal_columns])
+        sql = f'COPY {schema}.pubmed_articles ({", ".join(columns)}) FROM STDIN'
+        vector_sql = f'COPY {schema}.pubmed_article_vectors ({", ".join(vector_columns)}) FROM STDIN'
+        for start in range(0, n, batch_size):
+            size = min(batch_size, n - start)
+            batch = list(corpus.articles(size, start_pmid=start + 1))
+            with transaction.atomic(using='default'):
+                with cursor.copy(sql) as copy:
+                    for article in batch:
+                        copy.write_row([article[col] for col in columns])
+                with cursor.copy(vector_sql) as copy:
+                    for article in batch:
+                        copy.write_row([article[col] for col in vector_columns])
+            log(f'>>> {start + size}/{n} articles generated, {time.time() - start_time:.1f}s')
+
+        log('>>> building indexes ...')
+        cursor.execute(f'CREATE INDEX ON {schema}.pubmed_articles USING GIN (ts_en)')
+        cursor.execute(f'CREATE INDEX ON {schema}.pubmed_articles (year)')
+        cursor.execute(f'CREATE INDEX ON {schema}.pubmed_articles (journal_id)')
+        cursor.execute(f'CREATE INDEX ON {schema}.pubmed_article_vectors (year)')
+        cursor.execute(f'CREATE INDEX ON {schema}.pubmed_article_vectors (journal_id)')
+        cursor.execute(f'CREATE INDEX ON {schema}.pubmed_journals (factor)')
+        cursor.execute(f'''
+            CREATE INDEX ON {schema}.pubmed_article_vectors
+            USING hnsw (title_abstract_vec vector_cosine_ops)
+            WITH (m = {int(m)}, ef_construction = {int(ef_construction)})
+        ''')
+        # factor 条件的选择度按各期刊的文章数估算
+        cursor.execute(f'''
+            UPDATE {schema}.pubmed_journals j SET articles = c.n
+            FROM (SELECT journal_id, count(*) AS n FROM {schema}.pubmed_articles GROUP BY journal_id) c
+            WHERE c.journal_id = j.id
+        ''')
+        cursor.execute(f'ANALYZE {schema}.pubmed_articles')
+        cursor.execute(f'ANALYZE {schema}.pubmed_article_vectors')
+        cursor.execute(f'ANALYZE {schema}.pubmed_journals')
+
+    log(f'>>> corpus ready in {time.time() - start_time:.1f}s')
+
+
+def build_workload(n, seed=42, using='search'):
+    """从语料标题中截取 2~4 个词作为查询，并随机组合过滤条件
+    """
+    rng = random.Random(seed)
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT title FROM pubmed_articles TABLESAMPLE SYSTEM (1) LIMIT %s', [n * 5])
+        titles = [row[0] for row in cursor.fetchall()]
+        if len(titles) < n:
+            cursor.execute('SELECT title FROM pubmed_articles ORDER BY random() LIMIT %s', [n])
+            titles = [row[0] for row in cursor.fetchall()]
+
+    workload = []
+    for _ in range(n):
+        words = rng.choice(titles).split()
+        size = min(len(words), rng.randint(2, 4))
+        offset = rng.randint(0, len(words) - size)
+        filters = {}
+        r = rng.random()
+        if r < 0.3:
+            filters['year_start'] = CURRENT_YEAR - rng.randint(0, 2)
+        elif r < 0.5:
+            filters['factor_min'] = rng.choice([3, 5, 10])
+        elif r < 0.6:
+            filters['year_start'] = CURRENT_YEAR - 1
+            filters['factor_min'] = 3
+        workload.append({'q': ' '.join(words[offset:offset + size]), 'filters': filters})
+    return workload
+
+
+def summarize_latencies(latencies, total_time=None):
+    """latencies: 秒；返回毫秒单位的分位数统计
+    """
+    if not latencies:
+        return {'count': 0}
+    arr = np.array(latencies) * 1000
+    result = {
+        'count': len(latencies),
+        'mean_ms': round(float(arr.mean()), 3),
+        'p50_ms': round(float(np.percentile(arr, 50)), 3),
+        'p95_ms': round(float(np.percentile(arr, 95)), 3),
+        'p99_ms': round(float(np.percentile(arr, 99)), 3),
+        'max_ms': round(float(arr.max()), 3),
+    }
+    if total_time:
+        result['qps'] = round(len(latencies) / total_time, 2)
+    return result
+
+
+def recall_at_k(results, truth, k):
+    if not truth:
+        return None
+    return len(set(results[:k]) & set(truth[:k])) / min(k, len(truth))
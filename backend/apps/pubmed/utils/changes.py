@@ -0,0 +1,191 @@
+"""
+入库后的增量流水线
+
+- 入库：save_article 在 pubmed_article_changes 中记录变化的 pmid
+- embed：只为新增或标题/摘要变化的文章计算向量并写入向量表（新文章同时触发订阅匹配）
+- analyze：pg_stat_user_tables.n_mod_since_analyze 超过阈值时才 ANALYZE
+- cache：文章缓存在 save_article 中已失效，新文章在这里预热到 Redis
+- 各阶段完成时间记录在变化记录上，延迟导出为 pubmed_pipeline_lag_seconds
+"""
+import time
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Min
+from django.utils import timezone
+
+import utils
+from pubmed.models import PubmedArticle, PubmedArticleVector, ArticleChange
+from pubmed.utils import article_cache
+from pubmed.utils.articles import save_vectors
+from pubmed.utils.locks import LeaseLock
+from pubmed.utils.metrics import PIPELINE_LAG
+
+
+BATCH_SIZE = getattr(settings, 'CHANGE_PIPELINE_BATCH_SIZE', 500)
+
+# 需要计算的向量列及对应的 embedding 模型
+EMBED_FIELDS = getattr(settings, 'CHANGE_PIPELINE_FIELDS', {
+    'title_abstract_vec': 'text-embedding-3-small',
+    'title_abstract_vector': 'text-embedding-3-large',
+})
+
+# 修改行数占比超过阈值时 ANALYZE
+ANALYZE_THRESHOLD = getattr(settings, 'CHANGE_ANALYZE_THRESHOLD', 0.02)
+
+# 已处理的变化记录保留天数
+RETENTION_DAYS = 7
+
+
+def observe_lag(stage, changed_at, now):
+    for value in changed_at:
+        PIPELINE_LAG.labels(stage).observe((now - value).total_seconds())
+
+
+def embed_changes(changes, using='default', log=print):
+    """为需要的文章计算向量，返回写入向量的 pmid
+    """
+    pmids = sorted({change.pmid for change in changes if change.text_changed})
+    rows = list(PubmedArticle.objects.using(using).filter(pmid__in=pmids).values('pmid', 'title', 'abstract'))
+    if not rows:
+        return []
+    texts = [f"{row['title']} {row['abstract']}" for row in rows]
+    for field, model in EMBED_FIELDS.items():
+        start = time.time()
+        vectors = utils.get_embeddings(model).embed_documents(texts)
+        save_vectors([(row['pmid'], vector) for row, vector in zip(rows, vectors)], field, using=using)
+        log(f'>>> embedded {len(rows)} articles into {field} in {time.time() - start:.1f}s')
+    return [row['pmid'] for row in rows]
+
+
+def warm_caches(changes, embedded, using='default'):
+    """新文章预热到文章缓存，更新的文章在 save_article 中已失效，等首次读取时再加载
+    """
+    # 相似文章的排名结果依赖向量集合，有新向量写入后失效
+    if embedded and hasattr(cache, 'delete_pattern'):
+        cache.delete_pattern('similar:*')
+    pmids = [change.pmid for change in changes if change.created]
+    if pmids and article_cache.cacheable():
+        article_cache.get_articles(pmids, using=using)
+    return pmids
+
+
+def process_batch(changes, using='default', log=print):
+    embedded = embed_changes(changes, using=using, log=log)
+    now = timezone.now()
+    ids = [change.id for change in changes]
+    ArticleChange.objects.using(using).filter(id__in=ids).update(embedded_at=now)
+    observe_lag('embed', [change.changed_at for change in changes if change.text_changed], now)
+
+    warm_caches(changes, embedded, using=using)
+    now = timezone.now()
+    ArticleChange.objects.using(using).filter(id__in=ids).update(warmed_at=now)
+    observe_lag('cache', [change.changed_at for change in changes], now)
+
+
+def modified_fraction(table, using='default'):
+    """自上次 ANALYZE 以来修改的行数占比，分区表按各分区汇总
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute('''
+            SELECT coalesce(sum(n_mod_since_analyze), 0), coalesce(sum(n_live_tup), 0)
+            FROM pg_stat_user_tables
+            WHERE relid = to_regclass(%s)
+               OR relid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(%s))
+        ''', [table, table])
+        modified, live = cursor.fetchone()
+    return modified / live if live else (1.0 if modified else 0.0)
+
+
+def analyze_if_needed(threshold=ANALYZE_THRESHOLD, since=None, using='default', log=print):
+    """返回执行了 ANALYZE 的表
+
+    since: 本轮处理的最早变化时间，用于统计 analyze 阶段的延迟
+    """
+    analyzed = []
+    for table in (PubmedArticle._meta.db_table, PubmedArticleVector._meta.db_table):
+        fraction = modified_fraction(table, using=using)
+        if fraction < threshold:
+            continue
+        start = time.time()
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'ANALYZE {table}')
+        log(f'>>> ANALYZE {table}: {fraction:.2%} rows modified, {time.time() - start:.1f}s')
+        analyzed.append(table)
+    if analyzed and since is not None:
+        observe_lag('analyze', [since], timezone.now())
+    return analyzed
+
+
+def process(batch_size=BATCH_SIZE, max_batches=None, lock=None, using='default', log=print):
+    """处理全部未完成的变化记录，返回统计信息
+
+    embedding 失败时该批保持未完成状态，下次运行重试
+    lock: 流水线的租约锁，每批完成后续约；积压较多时总耗时可能超过租约，
+    不续约的话定时任务会启动第二轮，重复计算同一批文章的向量。续约失败（租约已过期）时停止
+    """
+    summary = {'changes': 0, 'batches': 0, 'analyzed': []}
+    since = None
+    while max_batches is None or summary['batches'] < max_batches:
+        changes = list(
+            ArticleChange.objects.using(using)
+            .filter(embedded_at__isnull=True)
+            .order_by('id')[:batch_size]
+        )
+        if not changes:
+            break
+        oldest = min(change.changed_at for change in changes)
+        since = oldest if since is None else min(since, oldest)
+        process_batch(changes, using=using, log=log)
+        summary['changes'] += len(changes)
+        summary['batches'] += 1
+        if lock is not None and not lock.extend():
+            log('>>> change pipeline lease expired, stop')
+            break
+
+    if summary['changes']:
+        summary['analyzed'] = analyze_if_needed(since=since, using=using, log=log)
+
+    cutoff = timezone.now() - datetime.timedelta(days=RETENTION_DAYS)
+    ArticleChange.objects.using(using).filter(warmed_at__lt=cutoff).delete()
+    return summary
+
+
+def pipeline_lock(token=None):
+    return LeaseLock('process_changes', ttl=60 * 60, token=token)
+
+
+def lag_stats(using='default'):
+    """各阶段积压和最近一小时的延迟
+    """
+    now = timezone.now()
+    pending = ArticleChange.objects.using(using).filter(embedded_at__isnull=True)
+    oldest = pending.aggregate(oldest=Min('changed_at'))['oldest']
+    recent = list(
+        ArticleChange.objects.using(using)
+        .filter(warmed_at__gte=now - datetime.timedelta(hours=1))
+        .values_list('changed_at', 'embedded_at', 'warmed_at')
+    )
+
+    def percentiles(values):
+        if not values:
+            return {}
+        values = sorted(values)
+        return {
+            'p50_s': round(values[len(values) // 2], 3),
+            'p95_s': round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+            'max_s': round(values[-1], 3),
+        }
+
+    return {
+        'pending': pending.count(),
+        'oldest_pending_s': round((now - oldest).total_seconds(), 3) if oldest else 0,
+        'embed': percentiles([(embedded - changed).total_seconds() for changed, embedded, _ in recent]),
+        'cache': percentiles([(warmed - changed).total_seconds() for changed, _, warmed in recent]),
+        'modified_since_analyze': {
+            table: round(modified_fraction(table, using=using), 4)
+            for table in (PubmedArticle._meta.db_table, PubmedArticleVector._meta.db_table)
+        },
+    }
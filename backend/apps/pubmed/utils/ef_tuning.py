@@ -0,0 +1,166 @@
+"""
+ef_search 自动选择
+
+- tune_ef_search 命令离线测量不同 k、过滤选择度下各 ef_search 的召回率，写入 EfSearchProfile
+- 检索时根据 pg_stats 估算过滤条件的选择度，查表选出满足目标召回率的最小 ef_search
+"""
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from pubmed.utils.partition import is_partitioned
+
+
+# 进程内缓存的有效期（秒）
+TABLE_TTL = 600
+STATS_TTL = 3600
+
+_lock = threading.Lock()
+_table = {'expires': 0, 'rows': []}
+_stats = {'expires': 0, 'columns': {}}
+
+
+def load_table(field='title_abstract_vec'):
+    """加载 ef_search 调优表，进程内缓存
+    """
+    from pubmed.models import EfSearchProfile
+
+    now = time.time()
+    if _table['expires'] < now:
+        with _lock:
+            if _table['expires'] < now:
+                _table['rows'] = list(
+                    EfSearchProfile.objects.using('search').values('field', 'k', 'selectivity', 'ef_search', 'recall')
+                )
+                _table['expires'] = now + TABLE_TTL
+    return [row for row in _table['rows'] if row['field'] == field]
+
+
+def reset_cache():
+    _table['expires'] = 0
+    _stats['expires'] = 0
+
+
+def load_column_stats(table, columns=('year',), using='search'):
+    """读取 pg_stats 中的 MCV 和直方图，用于估算范围条件的选择度
+    """
+    now = time.time()
+    if _stats['expires'] < now:
+        with connections[using].cursor() as cursor:
+            cursor.execute('''
+                SELECT attname, null_frac,
+                       most_common_vals::text::float8[],
+                       most_common_freqs,
+                       histogram_bounds::text::float8[]
+                FROM pg_stats
+                WHERE tablename = %s AND attname = ANY(%s)
+            ''', [table, list(columns)])
+            _stats['columns'] = {
+                row[0]: {
+                    'null_frac': row[1] or 0,
+                    'mcv': row[2] or [],
+                    'mcf': row[3] or [],
+                    'hist': row[4] or [],
+                }
+                for row in cursor.fetchall()
+            }
+        _stats['expires'] = now + STATS_TTL
+    return _stats['columns']
+
+
+def fraction_ge(stats, value):
+    """估算 column >= value 的比例
+    """
+    mcv_frac = sum(f for v, f in zip(stats['mcv'], stats['mcf']) if v >= value)
+    rest = max(0.0, 1 - stats['null_frac'] - sum(stats['mcf']))
+    hist = stats['hist']
+    if len(hist) > 1:
+        hist_frac = (len(hist) - bisect.bisect_left(hist, value)) / len(hist)
+    else:
+        hist_frac = 0.0
+    return mcv_frac + rest * hist_frac
+
+
+def estimate_selectivity(table, year_start=None, year_end=None, factor_min=None, factor_max=None):
+    """按列独立假设估算过滤条件的选择度，无法估算时返回 1
+    """
+    from pubmed.utils import journals
+
+    if not any([year_start, year_end, factor_min, factor_max]):
+        return 1.0
+    try:
+        stats = load_column_stats(table)
+        factor_frac = journals.factor_selectivity(factor_min, factor_max) if (factor_min or factor_max) else None
+    except Exception:
+        return 1.0
+
+    # factor 在期刊维表中，按各期刊的文章数估算；按年份分区时 year 条件由分区裁剪完成
+    columns = []
+    if not is_partitioned(table, using='search'):
+        columns.append(('year', year_start, year_end))
+
+    selectivity = 1.0
+    if factor_frac is not None:
+        selectivity *= min(1.0, max(factor_frac, 0.0))
+    for column, low, high in columns:
+        if column not in stats or not (low or high):
+            continue
+        frac = 1.0 - stats[column]['null_frac']
+        if low:
+            frac = fraction_ge(stats[column], float(low))
+        if high:
+            # column <= high 等价于 1 - (column > high)
+            frac -= fraction_ge(stats[column], float(high) + 1e-9)
+        selectivity *= min(1.0, max(frac, 0.0))
+    return selectivity
+
+
+def choose_ef_search(k, selectivity=1.0, target_recall=None, field='title_abstract_vec'):
+    """返回满足目标召回率的最小 ef_search，没有调优数据时返回 None（使用连接上的默认值）
+    """
+    target_recall = target_recall or getattr(settings, 'EF_SEARCH_TARGET_RECALL', 0.95)
+    rows = load_table(field)
+    if not rows:
+        return None
+
+    # k: 取 >= 请求 k 的最小档位；选择度: 取 <= 估算值的最大档位（更严格的过滤需要更大的 ef_search）
+    ks = sorted(set(row['k'] for row in rows))
+    k_bucket = next((x for x in ks if x >= k), ks[-1])
+    rows = [row for row in rows if row['k'] == k_bucket]
+
+    selectivities = sorted(set(row['selectivity'] for row in rows))
+    lower = [s for s in selectivities if s <= selectivity]
+    s_bucket = lower[-1] if lower else selectivities[0]
+    rows = sorted((row for row in rows if row['selectivity'] == s_bucket), key=lambda row: row['ef_search'])
+
+    for row in rows:
+        if row['recall'] >= target_recall:
+            return max(row['ef_search'], k)
+    return max(rows[-1]['ef_search'], k)
+
+
+def auto_ef_search(table, k, filters=None, field='title_abstract_vec'):
+    """根据请求的 k 和过滤条件选择 ef_search
+    """
+    if not getattr(settings, 'EF_SEARCH_AUTOTUNE', True):
+        return None
+    selectivity = estimate_selectivity(table, **(filters or {}))
+    return choose_ef_search(k, selectivity, field=field)
+
+
+@contextmanager
+def ef_search_scope(using, ef_search):
+    """在事务内临时设置 hnsw.ef_search，与连接默认值相同时不做任何操作
+    """
+    default = settings.SEARCH_SESSION_PARAMS.get('hnsw.ef_search')
+    if not ef_search or ef_search == default:
+        yield
+        return
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute("SELECT set_config('hnsw.ef_search', %s, true)", [str(ef_search)])
+        yield
@@ -0,0 +1,124 @@
+"""
+查询 embedding 的微批处理
+
+每个检索请求单独调用 embed_query 时，请求数（RPM）配额远早于 token 配额用完。
+dispatcher 线程把各请求的查询文本收集起来：收到第一条后最多再等 EMBED_BATCH_MAX_DELAY_MS 毫秒
+或凑够 EMBED_BATCH_MAX_SIZE 条，合并为一次 embed_documents 调用，再把结果分发给各个等待的请求。
+
+- 同步接口等待 concurrent.futures.Future，异步接口通过 asyncio.wrap_future 等待同一个 Future，
+  两条检索路径共用批次
+- 批次由 EMBED_BATCH_CONCURRENCY 个线程并发发送，前一批未返回时不阻塞下一批的收集
+- 同一批中的相同文本只计算一次；调用失败时该批的所有请求抛出同一个异常
+- 已取消的请求（客户端断开、异步请求超时）在发送前剔除，不影响同一批其他请求的结果分发；
+  同步等待最多 EMBED_BATCH_TIMEOUT 秒
+- fork 后在子进程中首次使用时重新启动 dispatcher 线程
+"""
+import os
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+
+import utils
+from pubmed.utils.metrics import EMBED_BATCH_SIZE
+
+
+ENABLED = getattr(settings, 'EMBED_BATCH_ENABLED', True)
+MAX_SIZE = getattr(settings, 'EMBED_BATCH_MAX_SIZE', 64)
+MAX_DELAY = getattr(settings, 'EMBED_BATCH_MAX_DELAY_MS', 5) / 1000
+CONCURRENCY = getattr(settings, 'EMBED_BATCH_CONCURRENCY', 4)
+TIMEOUT = getattr(settings, 'EMBED_BATCH_TIMEOUT', 60)
+
+
+class EmbeddingBatcher(object):
+    """单个模型的 dispatcher
+    """
+
+    def __init__(self, model, max_size=MAX_SIZE, max_delay=MAX_DELAY, concurrency=CONCURRENCY):
+        self.model = model
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.concurrency = concurrency
+        self.lock = threading.Lock()
+        self.pid = None
+        self.queue = None
+        self.executor = None
+
+    def start(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            # fork 继承的线程和队列在子进程中不可用，重新创建
+            self.queue = queue.SimpleQueue()
+            self.executor = ThreadPoolExecutor(self.concurrency, thread_name_prefix=f'embed-{self.model}')
+            thread = threading.Thread(target=self.run, args=(self.queue,), name=f'embed-batcher-{self.model}', daemon=True)
+            thread.start()
+            self.pid = os.getpid()
+
+    def submit(self, text):
+        self.start()
+        future = Future()
+        self.queue.put((text, future))
+        return future
+
+    def run(self, requests):
+        while True:
+            batch = [requests.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self.executor.submit(self.send, batch)
+
+    def send(self, batch):
+        # 进入 RUNNING 状态后 Future 不能再被取消，之后 set_result/set_exception 不会抛出 InvalidStateError
+        batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        EMBED_BATCH_SIZE.labels(self.model).observe(len(texts))
+        try:
+            vectors = utils.get_embeddings(self.model).embed_documents(texts)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        by_text = dict(zip(texts, vectors))
+        for text, future in batch:
+            future.set_result(by_text[text])
+
+
+_lock = threading.Lock()
+_batchers = {}
+
+
+def get_batcher(model):
+    batcher = _batchers.get(model)
+    if batcher is None:
+        with _lock:
+            batcher = _batchers.setdefault(model, EmbeddingBatcher(model))
+    return batcher
+
+
+def embed_query(text, model):
+    """同步接口，关闭微批处理时直接调用 embed_query
+    """
+    if not ENABLED:
+        return utils.get_embeddings(model).embed_query(text)
+    return get_batcher(model).submit(text).result(timeout=TIMEOUT)
+
+
+async def aembed_query(text, model):
+    if not ENABLED:
+        return await utils.get_embeddings(model).aembed_query(text)
+    return await asyncio.wait_for(asyncio.wrap_future(get_batcher(model).submit(text)), TIMEOUT)
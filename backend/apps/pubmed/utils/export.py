@@ -0,0 +1,130 @@
+"""
+流式批量导出
+
+- 通过服务端命名游标分批读取，应用和数据库两侧的内存占用都与导出总量无关
+- 逐批编码为 NDJSON / CSV，可选 gzip 增量压缩
+- 第一批数据读出后即开始发送，大文件导出不会因网关等待响应头而超时
+"""
+import io
+import csv
+import uuid
+import zlib
+import asyncio
+from contextlib import aclosing
+
+import orjson
+from django.conf import settings
+
+from pubmed.serializers import get_fields
+from pubmed.utils import query_parser
+from pubmed.utils.pool import get_async_pool
+from pubmed.utils.async_search import TABLE, build_filters, select_columns
+
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+_semaphore = None
+
+
+def get_semaphore():
+    """限制单个进程同时进行的导出数量，每个导出在整个传输期间占用一个异步连接池连接
+    """
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(getattr(settings, 'EXPORT_MAX_CONCURRENCY', 4))
+    return _semaphore
+
+
+def build_export_query(pmids=None, query=None, filters=None, fields=None, limit=None):
+    """返回 (sql, params, fields)
+
+    - pmids: 按 pmid 列表导出
+    - query: 导出全部匹配查询（支持字段查询语法）的文章，不做排序，排序会让数据库物化全部结果
+    """
+    fields = get_fields(fields)
+    columns, joins = select_columns(fields)
+    where, params = build_filters(**(filters or {}))
+    if pmids is not None:
+        where.append('a.pmid = ANY(%s)')
+        params.append(list(pmids))
+    parsed = query_parser.parse(query)
+    if parsed:
+        where.append(f'({parsed.where})')
+        params.extend(parsed.params)
+    sql = f'SELECT {", ".join(columns)} FROM {TABLE} a {joins}'
+    if where:
+        sql += f' WHERE {" AND ".join(where)}'
+    if limit:
+        sql += ' LIMIT %s'
+        params.append(int(limit))
+    return sql, params, fields
+
+
+async def iter_chunks(sql, params, chunk_size=EXPORT_CHUNK_SIZE):
+    """通过服务端命名游标逐批读取
+
+    命名游标需要在事务内使用，连接池中的连接默认不是 autocommit，归还时事务会被回滚
+    """
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor(name=f'export_{uuid.uuid4().hex}') as cursor:
+            cursor.itersize = chunk_size
+            await cursor.execute(sql, params)
+            while True:
+                rows = await cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+
+
+def encode_ndjson(rows):
+    return b''.join(orjson.dumps(row) + b'\n' for row in rows)
+
+
+def csv_value(value):
+    # authors 等 jsonb 字段以 JSON 字符串写入
+    if isinstance(value, (list, dict)):
+        return orjson.dumps(value).decode()
+    return value
+
+
+def encode_csv(rows, fields, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(fields)
+    writer.writerows([csv_value(row.get(field)) for field in fields] for row in rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+async def stream_export(sql, params, fields, format='ndjson', compress=False, chunk_size=EXPORT_CHUNK_SIZE, trace=None):
+    """异步生成器，产出编码（和压缩）后的字节块
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip 格式
+    total = 0
+    try:
+        async with get_semaphore():
+            if format == 'csv':
+                # 没有数据时也输出表头
+                header = encode_csv([], fields, header=True)
+                yield compressor.compress(header) if compressor else header
+            # 客户端断开时关闭内层生成器，及时释放游标和连接
+            async with aclosing(iter_chunks(sql, params, chunk_size=chunk_size)) as chunks:
+                async for rows in chunks:
+                    total += len(rows)
+                    data = encode_csv(rows, fields) if format == 'csv' else encode_ndjson(rows)
+                    if compressor:
+                        data = compressor.compress(data)
+                    if data:
+                        yield data
+            if compressor:
+                yield compressor.flush()
+    finally:
+        if trace is not None:
+            trace.set('rows', total)
+            trace.finish()
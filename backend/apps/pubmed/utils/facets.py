@@ -0,0 +1,334 @@
+"""
+分面统计：查询结果按 year、journal、jcr、pub_types 的分布
+
+- 精确模式：全文匹配数不超过 FACET_EXACT_LIMIT 时，对全文匹配的全部文章和向量召回的候选集合计数
+- 近似模式：宽泛查询（匹配数超过上限）不做全量 GROUP BY，从匹配文章中按 pmid 哈希抽取 FACET_EXACT_LIMIT 行
+  （bottom-k 抽样，与年份、入库顺序无关，不会偏向最早的分区），按样本分布缩放到估算的匹配数，返回 approximate=True；
+  物化视图 pubmed_facet_rollup（按 分面、取值、年份 预先汇总的文章数）存在时，
+  各取值的计数不超过该取值在年份范围内的文章总数
+- 没有 q 时直接返回物化视图中的汇总（只有 year 条件时是精确值）
+- 物化视图由增量入库完成后的 refresh_facet_rollup 任务刷新（REFRESH ... CONCURRENTLY，不阻塞读取）
+"""
+import json
+import time
+import hashlib
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from pubmed.models import PubmedArticle, Journal
+from pubmed.utils import query_parser
+from pubmed.utils.async_search import build_filters
+from pubmed.utils.search import get_query_vector, vector_queryset, VECTOR_TOPN
+from pubmed.utils.vector_index import cosine_distance
+
+
+TABLE = PubmedArticle._meta.db_table
+JOURNAL_TABLE = Journal._meta.db_table
+ROLLUP = 'pubmed_facet_rollup'
+
+FACETS = ['year', 'journal', 'jcr', 'pub_types']
+
+# 全文匹配数不超过该值时精确计数，超过时抽样的行数
+EXACT_LIMIT = getattr(settings, 'FACET_EXACT_LIMIT', 20000)
+
+# 抽样用的 pmid 哈希，取值范围 [0, HASH_RANGE)
+SAMPLE_HASH = '(hashint8extended(pmid::bigint, 0) & 2147483647)'
+HASH_RANGE = 2 ** 31
+CACHE_TIMEOUT = getattr(settings, 'FACET_CACHE_TIMEOUT', 600)
+
+# 取值为空的统一记为 ''，年份为空记为 0，REFRESH ... CONCURRENTLY 需要不含 NULL 的唯一索引
+ROLLUP_SQL = f'''
+    CREATE MATERIALIZED VIEW IF NOT EXISTS {ROLLUP} AS
+    SELECT 'year' AS facet, coalesce(year::text, '') AS value, coalesce(year, 0) AS year, count(*) AS n
+    FROM {TABLE} GROUP BY 2, 3
+    UNION ALL
+    SELECT 'journal', coalesce(journal, ''), coalesce(year, 0), count(*)
+    FROM {TABLE} GROUP BY 2, 3
+    UNION ALL
+    SELECT 'jcr', coalesce(j.jcr, ''), coalesce(a.year, 0), count(*)
+    FROM {TABLE} a LEFT JOIN {JOURNAL_TABLE} j ON j.id = a.journal_id GROUP BY 2, 3
+    UNION ALL
+    SELECT 'pub_types', t.value, coalesce(a.year, 0), count(*)
+    FROM {TABLE} a,
+         jsonb_array_elements_text(CASE WHEN jsonb_typeof(a.pub_types) = 'array' THEN a.pub_types ELSE '[]'::jsonb END) t(value)
+    GROUP BY 2, 3
+'''
+
+
+def rollup_exists(using='default'):
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [ROLLUP])
+        return cursor.fetchone()[0]
+
+
+def create_rollup(using='default', log=print):
+    start = time.time()
+    with connections[using].cursor() as cursor:
+        cursor.execute(ROLLUP_SQL)
+        cursor.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {ROLLUP}_uniq ON {ROLLUP} (facet, value, year)')
+    log(f'>>> {ROLLUP} created in {time.time() - start:.1f}s')
+
+
+def refresh_rollup(using='default', log=print):
+    """物化视图不存在时创建，否则并发刷新，刷新后清除分面缓存
+    """
+    if not rollup_exists(using):
+        create_rollup(using=using, log=log)
+    else:
+        start = time.time()
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'REFRESH MATERIALIZED VIEW CONCURRENTLY {ROLLUP}')
+        log(f'>>> {ROLLUP} refreshed in {time.time() - start:.1f}s')
+    if hasattr(cache, 'delete_pattern'):
+        cache.delete_pattern('facets:*')
+
+
+def drop_rollup(using='default'):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DROP MATERIALIZED VIEW IF EXISTS {ROLLUP}')
+
+
+def count_rows(rows, facets):
+    """rows: [(year, journal, jcr, pub_types)]，返回 {facet: Counter}
+    """
+    counters = {facet: Counter() for facet in facets}
+    for year, journal, jcr, pub_types in rows:
+        values = {'year': [year], 'journal': [journal], 'jcr': [jcr], 'pub_types': pub_types if isinstance(pub_types, list) else []}
+        for facet in facets:
+            counters[facet].update(value for value in values[facet] if value not in (None, ''))
+    return counters
+
+
+def format_counts(counters, top):
+    return {
+        facet: [{'value': value, 'count': count} for value, count in counter.most_common(top)]
+        for facet, counter in counters.items()
+    }
+
+
+def match_where(parsed, filters):
+    where, params = build_filters(**filters)
+    if parsed:
+        where, params = [f'({parsed.where})'] + where, [*parsed.params, *params]
+    return where, params
+
+
+def lexical_rows(parsed, filters, limit, using):
+    """全文匹配的文章（最多 limit 行），不排序，GIN 位图扫描取到 limit 行即停止
+
+    只用于判断匹配数是否超过 limit：未排序的前 limit 行集中在最早的分区，不能当作样本
+    """
+    where, params = match_where(parsed, filters)
+    # 查询条件中的列名不带表别名，先在子查询中过滤，再关联期刊表取 jcr
+    sql = f'''
+        SELECT a.pmid, a.year, a.journal, j.jcr, a.pub_types
+        FROM (
+            SELECT pmid, year, journal, journal_id, pub_types
+            FROM {TABLE}
+            {'WHERE ' + ' AND '.join(where) if where else ''}
+            LIMIT %s
+        ) a
+        LEFT JOIN {JOURNAL_TABLE} j ON j.id = a.journal_id
+    '''
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, [*params, limit])
+        return cursor.fetchall()
+
+
+def sample_rows(parsed, filters, limit, estimate, using):
+    """匹配文章中 pmid 哈希值最小的 limit 行，返回 (rows, 估算的匹配数)
+
+    pmid 哈希与年份、入库顺序无关，样本在各分区之间均匀。按 planner 估算的匹配数先用哈希值过滤掉大部分行，
+    排序只作用在剩余的候选上；估算偏高导致样本过少时放宽过滤条件重试。
+    LIMIT 生效时匹配数按第 limit 小的哈希值估算（(k - 1) / U_k），否则为样本数 / 过滤比例
+    """
+    where, params = match_where(parsed, filters)
+    fraction = min(1.0, 2 * limit / max(estimate, 1))
+    while True:
+        sql = f'''
+            SELECT a.pmid, a.year, a.journal, j.jcr, a.pub_types, a.h
+            FROM (
+                SELECT pmid, year, journal, journal_id, pub_types, {SAMPLE_HASH} AS h
+                FROM {TABLE}
+                WHERE {' AND '.join(where + [f'{SAMPLE_HASH} < %s'])}
+                ORDER BY h
+                LIMIT %s
+            ) a
+            LEFT JOIN {JOURNAL_TABLE} j ON j.id = a.journal_id
+        '''
+        with connections[using].cursor() as cursor:
+            cursor.execute(sql, [*params, int(fraction * HASH_RANGE), limit])
+            rows = cursor.fetchall()
+        if len(rows) >= limit // 2 or fraction >= 1:
+            break
+        fraction = min(1.0, fraction * 4)
+
+    if len(rows) >= limit:
+        matches = (len(rows) - 1) * HASH_RANGE / (max(row[-1] for row in rows) + 1)
+    else:
+        matches = len(rows) / fraction
+    return [row[:-1] for row in rows], int(matches)
+
+
+def vector_pmids(parsed, filters, topn, using):
+    """与混合检索相同的向量召回候选
+    """
+    if not parsed.text:
+        return []
+    vector = get_query_vector(parsed.text)
+    qs = vector_queryset(using, filters)
+    vector_where, vector_params = query_parser.vector_filter(parsed, TABLE)
+    if vector_where:
+        qs = qs.extra(where=[vector_where], params=vector_params)
+    return list(
+        qs.annotate(distance=cosine_distance('title_abstract_vec', np.array(vector)))
+        .order_by('distance')
+        .values_list('pk', flat=True)[:topn]
+    )
+
+
+def fetch_rows(pmids, using):
+    if not pmids:
+        return []
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'''
+            SELECT a.pmid, a.year, a.journal, j.jcr, a.pub_types
+            FROM {TABLE} a LEFT JOIN {JOURNAL_TABLE} j ON j.id = a.journal_id
+            WHERE a.pmid = ANY(%s)
+        ''', [list(pmids)])
+        return cursor.fetchall()
+
+
+def decode(rows):
+    """原生 SQL 取出的 jsonb 在部分驱动配置下是字符串
+    """
+    return [
+        (year, journal, jcr, json.loads(pub_types) if isinstance(pub_types, str) else pub_types)
+        for _, year, journal, jcr, pub_types in rows
+    ]
+
+
+def estimate_matches(parsed, filters, using):
+    """planner 对匹配行数的估算，ts_en 的选择性来自 ANALYZE 收集的词频统计
+    """
+    where, params = match_where(parsed, filters)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {TABLE} {'WHERE ' + ' AND '.join(where) if where else ''}",
+            params,
+        )
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def rollup_where(filters):
+    where, params = ['facet = %s'], []
+    if filters.get('year_start'):
+        where.append('year >= %s')
+        params.append(int(filters['year_start']))
+    if filters.get('year_end'):
+        where.append('year <= %s')
+        params.append(int(filters['year_end']))
+    return where, params
+
+
+def rollup_counts(facets, filters, top, using):
+    """返回 ({facet: Counter}, 年份范围内的文章总数)
+    """
+    where, params = rollup_where(filters)
+    counters = {}
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"SELECT coalesce(sum(n), 0) FROM {ROLLUP} WHERE {' AND '.join(where)}", ['year', *params])
+        total = int(cursor.fetchone()[0])
+        for facet in facets:
+            cursor.execute(f'''
+                SELECT value, sum(n) FROM {ROLLUP}
+                WHERE {' AND '.join(where)} AND value <> ''
+                GROUP BY value ORDER BY 2 DESC LIMIT %s
+            ''', [facet, *params, top])
+            counters[facet] = Counter({
+                (int(value) if facet == 'year' else value): int(n) for value, n in cursor.fetchall()
+            })
+    return counters, total
+
+
+def rollup_limits(counters, filters, using):
+    """返回 ({facet: {value: 年份范围内的文章数}}, 年份范围内的文章总数)，用作近似计数的上限
+    """
+    where, params = rollup_where(filters)
+    limits = {}
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"SELECT coalesce(sum(n), 0) FROM {ROLLUP} WHERE {' AND '.join(where)}", ['year', *params])
+        total = int(cursor.fetchone()[0])
+        for facet, counter in counters.items():
+            if not counter:
+                continue
+            cursor.execute(f'''
+                SELECT value, sum(n) FROM {ROLLUP}
+                WHERE {' AND '.join(where)} AND value = ANY(%s)
+                GROUP BY value
+            ''', [facet, *params, [str(value) for value in counter]])
+            limits[facet] = {
+                (int(value) if facet == 'year' else value): int(n) for value, n in cursor.fetchall()
+            }
+    return limits, total
+
+
+def compute(query=None, filters=None, facets=None, top=20, vector_topn=VECTOR_TOPN, exact_limit=EXACT_LIMIT, using='default'):
+    """返回 {'total', 'approximate', 'mode', 'facets'}
+    """
+    filters = {key: value for key, value in (filters or {}).items() if value}
+    facets = [facet for facet in (facets or FACETS) if facet in FACETS]
+    parsed = query_parser.parse(query)
+
+    has_rollup = rollup_exists(using)
+    if not parsed and has_rollup:
+        counters, total = rollup_counts(facets, filters, top, using)
+        # factor 不在物化视图中，有 factor 条件时为近似值
+        approximate = bool(filters.get('factor_min') or filters.get('factor_max'))
+        return {'total': total, 'approximate': approximate, 'mode': 'rollup', 'facets': format_counts(counters, top)}
+
+    rows = lexical_rows(parsed, filters, exact_limit + 1, using)
+    if len(rows) <= exact_limit:
+        seen = {row[0] for row in rows}
+        extra = [pmid for pmid in vector_pmids(parsed, filters, vector_topn, using) if pmid not in seen]
+        rows += fetch_rows(extra, using)
+        counters = count_rows(decode(rows), facets)
+        return {'total': len(rows), 'approximate': False, 'mode': 'exact', 'facets': format_counts(counters, top)}
+
+    # 宽泛查询：匹配文章的随机样本按估算的匹配数缩放，分布来自本次查询而不是全库
+    rows, estimate = sample_rows(parsed, filters, exact_limit, estimate_matches(parsed, filters, using), using)
+    estimate = max(estimate, exact_limit + 1)
+    counters, limits = count_rows(decode(rows), facets), {}
+    if has_rollup:
+        # 缩放后的计数不超过物化视图中该取值在年份范围内的文章数
+        limits, total = rollup_limits(counters, filters, using)
+        estimate = min(estimate, total) if total else estimate
+    ratio = estimate / len(rows)
+    counters = {
+        facet: Counter({
+            value: min(max(1, round(count * ratio)), limits.get(facet, {}).get(value, estimate))
+            for value, count in counter.items()
+        })
+        for facet, counter in counters.items()
+    }
+    return {'total': estimate, 'approximate': True, 'mode': 'sample', 'facets': format_counts(counters, top)}
+
+
+def get_facets(query=None, filters=None, facets=None, top=20, using='default'):
+    """带缓存的 compute，物化视图刷新时清除
+    """
+    filters = {key: value for key, value in (filters or {}).items() if value}
+    key_str = f'{query}|{sorted(filters.items())}|{sorted(facets or FACETS)}|{top}'
+    cache_key = f'facets:{hashlib.md5(key_str.encode()).hexdigest()}'
+    result = cache.get(cache_key)
+    if result is None:
+        result = compute(query, filters, facets=facets, top=top, using=using)
+        cache.set(cache_key, result, CACHE_TIMEOUT)
+    return result
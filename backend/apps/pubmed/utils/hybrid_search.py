@@ -26,6 +26,9 @@ def hybrid_search(query,
 
     embeddings = get_embeddings()
 
+    # 向量存放在 pubmed_article_vectors 中
+    base_qs = base_qs.annotate(title_abstract_vector=F('vectors__title_abstract_vector'))
+
     # --- 1. BM25 查询 ---
     rank=SearchRank(F('ts_en'), SearchQuery(query, config='english'))
     bm25_qs = base_qs.annotate(rank=rank).extra(
@@ -0,0 +1,140 @@
+"""
+增量入库：按 pmid 分片，每个分片一个 Celery 任务，由 chord 汇总
+
+- update_pubmed 获取租约锁后，把未入库的文件分发给各分片并行处理，上一轮未结束时新一轮直接跳过
+- 同一 pmid 会在多个更新文件中反复修订：按 pmid % 分片数 分配，同一 pmid 总是由同一个分片处理，
+  分片内按文件名顺序应用，较新的修订总是最后写入；各分片都要解析全部文件，解析比写入快得多
+- 文章写入经过 pmid 登记表（见 articles.register），与增量流水线等其他写入并发时也不会产生重复行
+- 分片任务可重复执行：文章按 pmid upsert，重新执行时按相同顺序再应用一遍
+- 所有分片完成后由回调记录已完成的文件（路径、大小、修改时间），释放租约锁，并触发增量流水线（见 changes.py）
+"""
+import os
+import glob
+import time
+
+from dateutil.parser import parse as date_parse
+from django.conf import settings
+from django.db import transaction
+
+from pubmed.models import IngestedFile
+from pubmed.utils import articles
+from pubmed.utils.locks import LeaseLock
+
+
+UPDATE_LOCK = 'update_pubmed'
+
+# 每个事务写入的文章数
+BATCH_SIZE = 500
+
+SHARDS = getattr(settings, 'PUBMED_UPDATE_SHARDS', 4)
+
+
+def list_files(pattern=None):
+    pattern = pattern or settings.PUBMED_UPDATE_FILES
+    return sorted(glob.glob(pattern))
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+
+def pending_files(paths, using='default'):
+    """过滤掉已经完整入库且之后未被修改的文件
+    """
+    done = {
+        row['path']: (row['size'], row['mtime'])
+        for row in IngestedFile.objects.using(using).filter(path__in=paths).values('path', 'size', 'mtime')
+    }
+    return [path for path in paths if done.get(path) != file_signature(path)]
+
+
+def parse_file(path):
+    from pubmed_xml import Pubmed_XML_Parser
+
+    parser = Pubmed_XML_Parser()
+    for article in parser.parse(path):
+        data = article.data
+        data['pubmed_pubdate'] = date_parse(article.pubmed_pubdate).strftime('%F')
+        yield data
+
+
+def shard_of(pmid, shards=SHARDS):
+    return int(pmid) % shards
+
+
+def ingest_shard(paths, shard, shards=SHARDS, locks=(), using='default', log=print):
+    """按文件名顺序入库各文件中属于该分片的文章，返回各文件的统计信息
+
+    locks: 每批写入后续约的租约锁；续约失败说明租约已过期、可能已有新一轮入库，抛出异常停止
+    """
+    results = []
+    for path in sorted(paths):
+        size, mtime = file_signature(path)
+        start = time.time()
+        stats = {'path': path, 'size': size, 'mtime': mtime, 'articles': 0, 'created': 0, 'updated': 0}
+        batch = []
+
+        def flush():
+            # 按 pmid 排序后加锁顺序与 save_vectors 一致，避免死锁；排序稳定，同一 pmid 在文件中的先后不变
+            batch.sort(key=lambda data: int(data['pmid']))
+            with transaction.atomic(using=using):
+                for data in batch:
+                    _, created = articles.save_article(data, using=using)
+                    stats['created' if created else 'updated'] += 1
+            stats['articles'] += len(batch)
+            batch.clear()
+            for lock in locks:
+                if not lock.extend():
+                    raise RuntimeError(f'lease {lock.key} expired during ingestion')
+
+        for data in parse_file(path):
+            if shard_of(data['pmid'], shards) != shard:
+                continue
+            batch.append(data)
+            if len(batch) >= BATCH_SIZE:
+                flush()
+        if batch:
+            flush()
+
+        stats['elapsed'] = round(time.time() - start, 3)
+        log(f'>>> shard {shard}/{shards} {path}: {stats}')
+        results.append(stats)
+    return {'shard': shard, 'files': results}
+
+
+def finalize(results, paths, shards=SHARDS, using='default', log=print):
+    """所有分片完成后汇总结果，记录完整入库的文件
+
+    文件的全部分片都已完成、且各分片读取时文件未被修改，才记为已入库；否则下一轮重新处理
+    向量计算、ANALYZE、缓存由增量流水线按变化量处理
+    """
+    files = {path: [] for path in paths}
+    for result in results:
+        if result:
+            for stats in result['files']:
+                files.setdefault(stats['path'], []).append(stats)
+
+    summary = {'files': 0, 'incomplete': 0, 'articles': 0, 'created': 0, 'updated': 0}
+    for path, parts in files.items():
+        for key in ('articles', 'created', 'updated'):
+            summary[key] += sum(stats[key] for stats in parts)
+        if len(parts) != shards or len({(stats['size'], stats['mtime']) for stats in parts}) != 1:
+            summary['incomplete'] += 1
+            continue
+        IngestedFile.objects.using(using).update_or_create(
+            path=path,
+            defaults={
+                'size': parts[0]['size'],
+                'mtime': parts[0]['mtime'],
+                'elapsed': max(stats['elapsed'] for stats in parts),
+                **{key: sum(stats[key] for stats in parts) for key in ('articles', 'created', 'updated')},
+            },
+        )
+        summary['files'] += 1
+    log(f'>>> update finished: {summary}')
+    return summary
+
+
+def update_lock(token=None):
+    return LeaseLock(UPDATE_LOCK, ttl=settings.PUBMED_UPDATE_LEASE, token=token)
@@ -0,0 +1,296 @@
+"""
+期刊维表 pubmed_journals
+
+- 文章表、向量表只保存 journal_id，factor_min/factor_max 通过 journal_id IN (SELECT id FROM pubmed_journals WHERE ...) 过滤
+- 入库时按 eISSN/ISSN 在进程内的映射表中查找 journal_id，未知期刊插入一行
+- 每年发布新指标后由 journal_metrics 命令批量更新期刊表，文章和向量不需要改写
+- 文章缓存中只保存 journal_id，读取时从进程内的指标表（METRICS_TTL 秒重新加载）合并 factor/jcr/zky，
+  指标更新后不需要清除文章缓存
+"""
+import csv
+import json
+import time
+import threading
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q, Sum
+
+from pubmed.models import Journal, PubmedArticle, JOURNAL_FIELDS
+
+
+TABLE = Journal._meta.db_table
+ARTICLE_TABLE = PubmedArticle._meta.db_table
+
+METRICS_TTL = getattr(settings, 'JOURNAL_METRICS_TTL', 600)
+
+
+def normalize_issn(value):
+    """统一为 1234-567X 的形式，空值返回 None
+    """
+    value = (value or '').strip().upper().replace(' ', '')
+    if not value:
+        return None
+    if len(value) == 8 and '-' not in value:
+        value = f'{value[:4]}-{value[4:]}'
+    return value
+
+
+class JournalMap(object):
+    """进程内的 ISSN -> journal_id 映射，首次使用时一次性加载，未命中时插入新期刊
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.keys = {}
+        self.loaded = set()
+
+    def load(self, using='default'):
+        if using in self.loaded:
+            return
+        with self.lock:
+            if using in self.loaded:
+                return
+            for pk, issn, e_issn in Journal.objects.using(using).values_list('id', 'issn', 'e_issn'):
+                self.register(using, pk, issn, e_issn)
+            self.loaded.add(using)
+
+    def register(self, using, pk, issn, e_issn):
+        if e_issn:
+            self.keys[(using, 'e_issn', e_issn)] = pk
+        if issn:
+            self.keys[(using, 'issn', issn)] = pk
+
+    def lookup(self, issn, e_issn, using='default'):
+        self.load(using)
+        return self.keys.get((using, 'e_issn', e_issn)) or self.keys.get((using, 'issn', issn))
+
+    def resolve(self, data, using='default'):
+        """返回文章所属期刊的 id，没有 ISSN 时返回 None
+
+        data 中带有期刊指标（如 load_pubmed_xml 查询到的影响因子）时，用于初始化新期刊的指标
+        """
+        issn, e_issn = normalize_issn(data.get('issn')), normalize_issn(data.get('e_issn'))
+        if not issn and not e_issn:
+            return None
+        pk = self.lookup(issn, e_issn, using)
+        if pk is None:
+            pk = self.create(issn, e_issn, data, using)
+        return pk
+
+    def create(self, issn, e_issn, data, using='default'):
+        """其他进程可能同时插入同一期刊，ignore_conflicts 后重新查询
+        """
+        Journal.objects.using(using).bulk_create(
+            [Journal(issn=issn, e_issn=e_issn, name=data.get('journal'), **{key: data.get(key) for key in JOURNAL_FIELDS})],
+            ignore_conflicts=True,
+        )
+        query = Q()
+        if e_issn:
+            query |= Q(e_issn=e_issn)
+        if issn:
+            query |= Q(issn=issn)
+        journal = Journal.objects.using(using).filter(query).values_list('id', 'issn', 'e_issn').first()
+        if journal is None:
+            return None
+        with self.lock:
+            self.register(using, *journal)
+        return journal[0]
+
+    def clear(self):
+        with self.lock:
+            self.keys.clear()
+            self.loaded.clear()
+
+
+_map = JournalMap()
+
+
+def resolve(data, using='default'):
+    return _map.resolve(data, using=using)
+
+
+_metrics_lock = threading.Lock()
+_metrics = {}
+
+
+def get_metrics(using='default'):
+    """{journal_id: {'factor', 'jcr', 'zky'}}，进程内缓存
+    """
+    now = time.time()
+    entry = _metrics.get(using)
+    if entry is None or entry['expires'] < now:
+        with _metrics_lock:
+            entry = _metrics.get(using)
+            if entry is None or entry['expires'] < now:
+                rows = Journal.objects.using(using).values_list('id', *JOURNAL_FIELDS)
+                entry = {
+                    'data': {row[0]: dict(zip(JOURNAL_FIELDS, row[1:])) for row in rows},
+                    'expires': now + METRICS_TTL,
+                }
+                _metrics[using] = entry
+    return entry['data']
+
+
+def attach_metrics(row, fields=JOURNAL_FIELDS, using='default'):
+    """为 journal_id 字段补充期刊指标
+    """
+    metrics = get_metrics(using).get(row.get('journal_id')) or {}
+    for field in fields:
+        row[field] = metrics.get(field)
+    return row
+
+
+def factor_queryset(factor_min=None, factor_max=None, using='default'):
+    """满足影响因子条件的期刊 id，用作 journal_ref__in= 子查询
+    """
+    qs = Journal.objects.using(using)
+    if factor_min:
+        qs = qs.filter(factor__gte=float(factor_min))
+    if factor_max:
+        qs = qs.filter(factor__lte=float(factor_max))
+    return qs.values('id')
+
+
+def factor_sql(factor_min=None, factor_max=None, column='journal_id'):
+    """原生 SQL 版本，返回 (sql, params)，没有条件时返回 (None, [])
+    """
+    where, params = [], []
+    if factor_min:
+        where.append('factor >= %s')
+        params.append(float(factor_min))
+    if factor_max:
+        where.append('factor <= %s')
+        params.append(float(factor_max))
+    if not where:
+        return None, []
+    return f'{column} IN (SELECT id FROM {TABLE} WHERE {" AND ".join(where)})', params
+
+
+_selectivity = {'expires': 0, 'rows': []}
+
+
+def factor_selectivity(factor_min=None, factor_max=None, using='search'):
+    """按各期刊文章数加权估算 factor 条件的选择度，没有文章数统计时返回 None
+    """
+    now = time.time()
+    if _selectivity['expires'] < now:
+        _selectivity['rows'] = list(
+            Journal.objects.using(using).filter(articles__gt=0).values_list('factor', 'articles')
+        )
+        _selectivity['expires'] = now + METRICS_TTL
+    rows = _selectivity['rows']
+    total = sum(n for _, n in rows)
+    if not total:
+        return None
+    low = float(factor_min) if factor_min else float('-inf')
+    high = float(factor_max) if factor_max else float('inf')
+    return sum(n for factor, n in rows if factor is not None and low <= factor <= high) / total
+
+
+def read_metrics(path):
+    """读取指标文件：csv/tsv（表头包含 issn、eissn 或 e_issn、factor、jcr、zky）或 jsonl
+    """
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.jsonl') or path.endswith('.jl'):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f, delimiter='\t' if path.endswith('.tsv') else ','))
+    for row in rows:
+        factor = row.get('factor')
+        yield {
+            'issn': normalize_issn(row.get('issn')),
+            'e_issn': normalize_issn(row.get('e_issn') or row.get('eissn')),
+            'factor': float(factor) if factor not in (None, '') else None,
+            'jcr': row.get('jcr') or None,
+            'zky': row.get('zky') or None,
+        }
+
+
+def lookup_impact_factor(journals):
+    """通过 impact_factor 包（load_pubmed_xml 使用的同一数据源）查询指标
+    """
+    from impact_factor.core import Factor
+
+    fa = Factor()
+    for journal in journals:
+        result = None
+        if journal['e_issn']:
+            result = fa.search(journal['e_issn'], key='eissn')
+        if not result and journal['issn']:
+            result = fa.search(journal['issn'], key='issn')
+        if result:
+            yield {
+                'issn': journal['issn'],
+                'e_issn': journal['e_issn'],
+                'factor': result[0].get('factor'),
+                'jcr': result[0].get('jcr'),
+                'zky': result[0].get('zky'),
+            }
+
+
+def update_metrics(metrics, batch_size=2000, using='default', log=print):
+    """metrics: [{'issn', 'e_issn', 'factor', 'jcr', 'zky'}]，只更新指标有变化的期刊，返回更新的期刊数
+    """
+    journals = {
+        row['id']: row
+        for row in Journal.objects.using(using).values('id', 'issn', 'e_issn', *JOURNAL_FIELDS)
+    }
+    keys = {}
+    for row in journals.values():
+        if row['e_issn']:
+            keys[('e_issn', row['e_issn'])] = row['id']
+        if row['issn']:
+            keys[('issn', row['issn'])] = row['id']
+
+    changed, unmatched = {}, 0
+    for item in metrics:
+        pk = keys.get(('e_issn', item['e_issn'])) or keys.get(('issn', item['issn']))
+        if pk is None:
+            unmatched += 1
+            continue
+        values = {key: item.get(key) for key in JOURNAL_FIELDS}
+        if any(journals[pk][key] != values[key] for key in JOURNAL_FIELDS):
+            changed[pk] = Journal(id=pk, **values)
+
+    start = time.time()
+    Journal.objects.using(using).bulk_update(list(changed.values()), JOURNAL_FIELDS, batch_size=batch_size)
+    log(f'>>> {len(changed)} journals updated, {unmatched} unmatched, {time.time() - start:.1f}s')
+    reset_cache()
+    return len(changed)
+
+
+def update_counts(using='default', log=print):
+    """统计各期刊的文章数，用于估算 factor 条件的选择度
+    """
+    start = time.time()
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'''
+            WITH c AS (
+                SELECT journal_id, count(*) AS n FROM {ARTICLE_TABLE}
+                WHERE journal_id IS NOT NULL GROUP BY journal_id
+            )
+            UPDATE {TABLE} j SET articles = coalesce(c.n, 0)
+            FROM {TABLE} j2
+            LEFT JOIN c ON c.journal_id = j2.id
+            WHERE j.id = j2.id AND j.articles <> coalesce(c.n, 0)
+        ''')
+        updated = cursor.rowcount
+    log(f'>>> article counts updated for {updated} journals in {time.time() - start:.1f}s')
+    return updated
+
+
+def stats(using='default'):
+    qs = Journal.objects.using(using)
+    return {
+        'journals': qs.count(),
+        'with_factor': qs.filter(factor__isnull=False).count(),
+        'articles': qs.aggregate(n=Sum('articles'))['n'] or 0,
+    }
+
+
+def reset_cache():
+    """当前进程的指标缓存立即失效，其他进程在 METRICS_TTL 内更新
+    """
+    _metrics.clear()
+    _selectivity['expires'] = 0
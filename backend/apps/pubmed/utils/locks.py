@@ -0,0 +1,84 @@
+"""
+基于 Redis 的租约锁
+
+- SET NX PX 获取，值为随机 token，只有持有者才能续约和释放（Lua 脚本比较后操作）
+- 持有者崩溃时锁在租约到期后自动释放，不会永久卡住
+- 缓存后端不是 Redis 时（如 DJANGO_CACHE=locmem）退化为 cache.add，只在单进程内有效
+"""
+import uuid
+
+from django.core.cache import cache
+
+
+RELEASE_SCRIPT = '''
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+'''
+
+EXTEND_SCRIPT = '''
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+'''
+
+
+def get_redis():
+    """返回原生 redis 客户端，缓存后端不是 django_redis 时返回 None
+    """
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        return None
+
+
+class LeaseLock(object):
+    """用法：
+        lock = LeaseLock('update_pubmed', ttl=3600)
+        if lock.acquire():
+            try:
+                ...
+            finally:
+                lock.release()
+
+    token 可以跨进程传递（如传给 Celery chord 的回调），由回调释放锁
+    """
+
+    def __init__(self, name, ttl=60, token=None):
+        self.key = f'lock:{name}'
+        self.ttl = ttl
+        self.token = token or uuid.uuid4().hex
+        self.redis = get_redis()
+
+    def acquire(self):
+        if self.redis is None:
+            return cache.add(self.key, self.token, self.ttl)
+        return bool(self.redis.set(self.key, self.token, nx=True, px=int(self.ttl * 1000)))
+
+    def extend(self, ttl=None):
+        ttl = ttl or self.ttl
+        if self.redis is None:
+            return cache.get(self.key) == self.token and cache.touch(self.key, ttl)
+        return bool(self.redis.eval(EXTEND_SCRIPT, 1, self.key, self.token, int(ttl * 1000)))
+
+    def release(self):
+        if self.redis is None:
+            if cache.get(self.key) == self.token:
+                cache.delete(self.key)
+                return True
+            return False
+        return bool(self.redis.eval(RELEASE_SCRIPT, 1, self.key, self.token))
+
+    def locked(self):
+        if self.redis is None:
+            return cache.get(self.key) is not None
+        return bool(self.redis.exists(self.key))
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
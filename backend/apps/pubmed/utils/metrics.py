@@ -0,0 +1,205 @@
+"""
+检索各阶段耗时统计与 Prometheus 指标
+
+- SearchTrace: 记录单次请求各阶段耗时、候选数量、缓存命中情况
+- /metrics: 导出 Prometheus 指标，多进程部署时需设置 PROMETHEUS_MULTIPROC_DIR
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Histogram, Counter, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+
+
+STAGE_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+CANDIDATE_BUCKETS = (0, 10, 25, 50, 100, 200, 500, 1000)
+
+STAGE_SECONDS = Histogram(
+    'pubmed_search_stage_seconds',
+    'Search latency per stage',
+    ['endpoint', 'stage'],
+    buckets=STAGE_BUCKETS,
+)
+
+REQUEST_SECONDS = Histogram(
+    'pubmed_search_request_seconds',
+    'Search latency per request',
+    ['endpoint'],
+    buckets=STAGE_BUCKETS,
+)
+
+CANDIDATES = Histogram(
+    'pubmed_search_candidates',
+    'Number of candidates returned by each recall leg',
+    ['endpoint', 'leg'],
+    buckets=CANDIDATE_BUCKETS,
+)
+
+CACHE_REQUESTS = Counter(
+    'pubmed_search_cache_requests_total',
+    'Search cache lookups',
+    ['endpoint', 'cache', 'result'],
+)
+
+ARTICLE_CACHE_REQUESTS = Counter(
+    'pubmed_article_cache_requests_total',
+    'Article cache lookups per layer (local LRU / redis / database)',
+    ['layer'],
+)
+
+SINGLE_FLIGHT = Counter(
+    'pubmed_single_flight_total',
+    'Coalesced backend calls: leader computed, local/remote shared its result, fallback computed after waiting',
+    ['kind', 'result'],
+)
+
+EMBED_BATCH_SIZE = Histogram(
+    'pubmed_embed_batch_size',
+    'Number of distinct query texts per batched embedding call',
+    ['model'],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+LAG_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600, 86400)
+
+PIPELINE_LAG = Histogram(
+    'pubmed_pipeline_lag_seconds',
+    'Delay between an article change and each incremental pipeline stage',
+    ['stage'],
+    buckets=LAG_BUCKETS,
+)
+
+
+class SearchTrace(object):
+    """单次检索请求的耗时追踪
+
+    用法：
+        trace = SearchTrace('hybrid_search')
+        with trace.stage('embed'):
+            ...
+        trace.count('lexical', len(bm25_list))
+        trace.cache('embed', hit=True)
+        trace.finish()
+    """
+
+    # 各阶段名称，按请求处理顺序
+    STAGES = ['cache_lookup', 'embed', 'lexical_recall', 'vector_recall', 'fusion', 'hydration', 'serialization']
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.start_time = time.perf_counter()
+        self.timings = {}
+        self.candidates = {}
+        self.caches = {}
+        self.queries = {}
+        self.vectors = {}
+        self.params = {}
+        self.elapsed = None
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0) + time.perf_counter() - start
+
+    def count(self, leg, value):
+        self.candidates[leg] = value
+
+    def cache(self, name, hit):
+        self.caches[name] = bool(hit)
+
+    def set(self, key, value):
+        """记录请求实际使用的参数，如 ef_search
+        """
+        self.params[key] = value
+
+    def query(self, leg, query, vector=None):
+        """记录召回 SQL，供慢查询采样使用
+
+        query: Django QuerySet 或 (sql, params)
+        vector: 查询向量的来源，{'query': 文本, 'model': 模型} 或 {'pmids': [...]}；
+            向量本身不随任务发送，由慢查询任务重新获取
+        """
+        self.queries[leg] = query
+        if vector is not None:
+            self.vectors[leg] = vector
+
+    def finish(self):
+        """结束追踪并导出 Prometheus 指标
+        """
+        self.elapsed = time.perf_counter() - self.start_time
+        REQUEST_SECONDS.labels(self.endpoint).observe(self.elapsed)
+        for name, seconds in self.timings.items():
+            STAGE_SECONDS.labels(self.endpoint, name).observe(seconds)
+        for leg, value in self.candidates.items():
+            CANDIDATES.labels(self.endpoint, leg).observe(value)
+        for name, hit in self.caches.items():
+            CACHE_REQUESTS.labels(self.endpoint, name, 'hit' if hit else 'miss').inc()
+
+        from pubmed.utils.slow_query import maybe_capture
+        maybe_capture(self)
+
+        return self.elapsed
+
+    def to_dict(self):
+        """返回给前端的 debug 信息
+        """
+        elapsed = self.elapsed if self.elapsed is not None else time.perf_counter() - self.start_time
+        return {
+            'total_ms': round(elapsed * 1000, 3),
+            'timings_ms': {name: round(seconds * 1000, 3) for name, seconds in self.timings.items()},
+            'candidates': self.candidates,
+            'cache': self.caches,
+            'params': self.params,
+        }
+
+
+@contextmanager
+def maybe_stage(trace, name):
+    """trace 为 None 时不做任何统计，便于在工具函数中可选地传入 trace
+    """
+    if trace is None:
+        yield
+    else:
+        with trace.stage(name):
+            yield
+
+
+class PoolStatsCollector(object):
+    """抓取时读取连接池统计信息，导出为 Gauge
+    """
+
+    def collect(self):
+        from pubmed.utils.pool import get_pool_stats
+
+        metrics = {
+            'pool_size': GaugeMetricFamily('pubmed_db_pool_size', 'Current number of connections', labels=['pool']),
+            'pool_available': GaugeMetricFamily('pubmed_db_pool_available', 'Idle connections', labels=['pool']),
+            'requests_waiting': GaugeMetricFamily('pubmed_db_pool_requests_waiting', 'Requests waiting for a connection', labels=['pool']),
+            'requests_wait_ms': GaugeMetricFamily('pubmed_db_pool_requests_wait_ms', 'Total time spent waiting for a connection', labels=['pool']),
+            'checkout_avg_ms': GaugeMetricFamily('pubmed_db_pool_checkout_avg_ms', 'Average connection checkout latency', labels=['pool']),
+        }
+        for pool_name, stats in get_pool_stats().items():
+            for key, metric in metrics.items():
+                metric.add_metric([pool_name], stats.get(key, 0))
+        yield from metrics.values()
+
+
+REGISTRY.register(PoolStatsCollector())
+
+
+def export_metrics():
+    """返回 (content, content_type)
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        # 连接池是进程内状态，只能导出当前进程
+        registry.register(PoolStatsCollector())
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
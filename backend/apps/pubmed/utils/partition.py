@@ -0,0 +1,230 @@
+"""
+pubmed_articles 和 pubmed_article_vectors 按 year 做声明式分区
+
+- 每年一个分区 {table}_y{year}，year 为空的文章落在 {table}_default
+- 在父表上建立的索引（GIN、HNSW 等）会自动在每个分区上建立
+- 检索条件中的 year 过滤由 PostgreSQL 做分区裁剪，各分区的 HNSW 结果按距离归并（Merge Append）
+- 超出保留年限的数据通过 DETACH PARTITION + DROP TABLE 删除，不需要大批量 DELETE
+- 分区表上 pmid 不能建唯一约束，由不分区的登记表 pubmed_article_keys 保证唯一（见 articles.register）
+- 由 partition_pubmed -o migrate 执行，迁移 0016_partition 只记录模型状态（去掉向量表的 year 索引）
+"""
+import time
+import datetime
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from pubmed.models import PubmedArticle, PubmedArticleKey, PubmedArticleVector
+from pubmed.utils import vector_index
+from pubmed.utils.query_parser import FIELD_INDEXES
+
+
+TABLE = PubmedArticle._meta.db_table
+VECTOR_TABLE = PubmedArticleVector._meta.db_table
+KEY_TABLE = PubmedArticleKey._meta.db_table
+
+# 两张表使用相同的年份分区
+TABLES = [TABLE, VECTOR_TABLE]
+
+_partitioned = {}
+
+
+def partition_name(year, table=TABLE):
+    return f'{table}_y{int(year)}'
+
+
+def is_partitioned(table=TABLE, using='default'):
+    """进程内缓存，迁移后需要重启进程
+    """
+    if table not in _partitioned:
+        with connections[using].cursor() as cursor:
+            cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", [table])
+            row = cursor.fetchone()
+            _partitioned[table] = bool(row and row[0])
+    return _partitioned[table]
+
+
+def list_partitions(table=TABLE, using='default'):
+    """返回 [(name, bounds, rows, size)]，rows 为 pg_class.reltuples 估算值
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute('''
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint, pg_total_relation_size(c.oid)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+            ORDER BY c.relname
+        ''', [table])
+        return cursor.fetchall()
+
+
+def partition_years(table=TABLE, using='default'):
+    prefix = f'{table}_y'
+    return sorted(int(name[len(prefix):]) for name, *_ in list_partitions(table, using) if name.startswith(prefix))
+
+
+def create_partition(cursor, year, table=TABLE):
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {partition_name(year, table)}
+        PARTITION OF {table}
+        FOR VALUES FROM ({int(year)}) TO ({int(year) + 1})
+    ''')
+
+
+def create_partitioned_table(cursor, table, source, years=()):
+    """以 source 的列定义创建分区表、各年份分区和默认分区
+    """
+    cursor.execute(f'''
+        CREATE TABLE {table} (LIKE {source} INCLUDING DEFAULTS INCLUDING GENERATED)
+        PARTITION BY RANGE (year)
+    ''')
+    for year in years:
+        create_partition(cursor, year, table)
+    cursor.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+
+def create_indexes(cursor, table, source, log=print):
+    """在父表上建索引，PostgreSQL 会在每个分区上各建一个
+
+    分区表上不能唯一约束 pmid（唯一约束必须包含分区键），pmid 只建普通索引，
+    唯一性由 pubmed_article_keys 的主键保证，写入前先在登记表中登记并锁定
+    """
+    cursor.execute(f'CREATE INDEX {table}_pmid_idx ON {table} (pmid)')
+    cursor.execute(f'CREATE INDEX {table}_journal_id_idx ON {table} (journal_id)')
+    if source == TABLE:
+        cursor.execute(f'CREATE INDEX {table}_ts_en_idx ON {table} USING GIN (ts_en)')
+        for field, definition in FIELD_INDEXES.items():
+            cursor.execute(f'CREATE INDEX {table}_{field}_gin_idx ON {table} {definition}')
+        return
+
+    for field in getattr(settings, 'VECTOR_INDEXES', {}):
+        config = vector_index.get_config(field)
+        if config['method'] == 'ivfflat':
+            # IVFFlat 的聚类中心需要按分区数据训练，迁移完成后用 vector_index 命令单独建立
+            log(f'>>> skip ivfflat index on {field}, run vector_index -o build after migration')
+            continue
+        sql = f'''
+            CREATE INDEX {table}_{field}_{config['method']}_idx
+            ON {table}
+            USING hnsw ({vector_index.column_sql(field, config)} {vector_index.operator_class(config)})
+            WITH (m = {int(config['m'])}, ef_construction = {int(config['ef_construction'])})
+        '''
+        log(f'>>> run sql: {sql}')
+        start = time.time()
+        cursor.execute(sql)
+        log(f'>>> {field} index built in {time.time() - start:.1f}s')
+
+
+def migrate_table(source, log=print, using='default'):
+    """将一张表迁移为分区表
+
+    按年份逐个分区 INSERT ... SELECT，建好索引后在一个事务内交换表名，旧表保留为 {source}_unpartitioned。
+    复制期间检索继续读旧表；入库任务需暂停，否则复制开始后的写入会丢失
+    """
+    new_table = f'{source}_partitioned'
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'SELECT DISTINCT year FROM {source} WHERE year IS NOT NULL ORDER BY year')
+        years = [row[0] for row in cursor.fetchall()]
+        log(f'>>> {source} years: {years}')
+
+        cursor.execute(f'DROP TABLE IF EXISTS {new_table} CASCADE')
+        create_partitioned_table(cursor, new_table, source, years=years)
+
+        cursor.execute('''
+            SELECT attname FROM pg_attribute
+            WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = ''
+            ORDER BY attnum
+        ''', [source])
+        columns = ', '.join(row[0] for row in cursor.fetchall())
+
+        start = time.time()
+        for year in years + [None]:
+            condition = 'year IS NULL' if year is None else f'year = {int(year)}'
+            with transaction.atomic(using=using):
+                cursor.execute(f'INSERT INTO {new_table} ({columns}) SELECT {columns} FROM {source} WHERE {condition}')
+            log(f'>>> {source} copied year={year}: {cursor.rowcount} rows, {time.time() - start:.1f}s')
+
+        log(f'>>> building indexes on {new_table} ...')
+        create_indexes(cursor, new_table, source, log=log)
+        cursor.execute(f'ANALYZE {new_table}')
+
+    swap_tables(source, new_table, log=log, using=using)
+
+
+def migrate(log=print, using='default'):
+    for table in TABLES:
+        if is_partitioned(table, using):
+            log(f'>>> {table} is already partitioned')
+            continue
+        migrate_table(table, log=log, using=using)
+
+
+def swap_tables(table, new_table, log=print, using='default'):
+    """交换表名，分区同时改名为 {table}_y{year}
+    """
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute("SELECT set_config('lock_timeout', '10s', true)")
+            cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_unpartitioned')
+            cursor.execute(f'ALTER TABLE {new_table} RENAME TO {table}')
+            # 索引名保持不变，避免与旧表上的同名索引冲突
+            for name, *_ in list_partitions(table, using):
+                cursor.execute(f'ALTER TABLE {name} RENAME TO {table}{name[len(new_table):]}')
+    _partitioned.pop(table, None)
+    log(f'>>> {table} is now partitioned, old table kept as {table}_unpartitioned')
+
+
+def ensure_partitions(years, using='default', log=print):
+    """提前建好分区，避免新年份的数据落入默认分区
+
+    默认分区中已有该年份数据时 CREATE PARTITION 会失败，需要先把数据移出默认分区
+    """
+    for table in TABLES:
+        if not is_partitioned(table, using):
+            continue
+        existing = set(partition_years(table, using))
+        with connections[using].cursor() as cursor:
+            for year in years:
+                if year in existing:
+                    continue
+                create_partition(cursor, year, table)
+                log(f'>>> created partition {partition_name(year, table)}')
+
+
+def detach_partitions(before_year, drop=True, using='default', log=print):
+    """摘除 year < before_year 的分区
+
+    存在默认分区时不能使用 DETACH CONCURRENTLY；普通 DETACH 只是修改元数据，持锁时间很短
+    """
+    detached = []
+    for table in TABLES:
+        if not is_partitioned(table, using):
+            continue
+        for year in partition_years(table, using):
+            if year >= before_year:
+                continue
+            name = partition_name(year, table)
+            with transaction.atomic(using=using):
+                with connections[using].cursor() as cursor:
+                    cursor.execute("SELECT set_config('lock_timeout', '5s', true)")
+                    cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {name}')
+            if drop:
+                with connections[using].cursor() as cursor:
+                    cursor.execute(f'DROP TABLE {name}')
+                    if table == TABLE:
+                        # 删除的文章之后再次入库时按新文章处理
+                        cursor.execute(f'DELETE FROM {KEY_TABLE} WHERE year = %s', [year])
+            log(f'>>> {"dropped" if drop else "detached"} partition {name}')
+            detached.append(name)
+    return detached
+
+
+def maintain(n_years=None, using='default', log=print):
+    """保证当年和下一年的分区存在，并删除超出保留年限的分区
+    """
+    if not is_partitioned(using=using):
+        return []
+    n_years = n_years or getattr(settings, 'PUBMED_RETENTION_YEARS', 5)
+    year = datetime.date.today().year
+    ensure_partitions([year, year + 1], using=using, log=log)
+    return detach_partitions(year - n_years + 1, using=using, log=log)
@@ -0,0 +1,87 @@
+"""
+数据库连接池
+
+- Django 的 default / search 连接池由 settings.DATABASES 中的 OPTIONS.pool 配置
+- 异步检索使用单独的 AsyncConnectionPool，会话参数同 search 连接池
+"""
+import asyncio
+
+from psycopg.rows import dict_row
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+from pgvector.psycopg import register_vector_async
+from django.conf import settings
+from django.db import connections
+
+
+SEARCH_DB = 'search'
+
+_async_pool = None
+_async_pool_lock = asyncio.Lock()
+
+
+def get_conninfo(alias=SEARCH_DB):
+    db = settings.DATABASES[alias]
+    return make_conninfo(
+        dbname=db['NAME'],
+        user=db['USER'],
+        password=db['PASSWORD'],
+        host=db['HOST'],
+        port=db['PORT'],
+        options=db.get('OPTIONS', {}).get('options'),
+    )
+
+
+async def configure_connection(conn):
+    await register_vector_async(conn)
+    # configure 中的查询会开启事务，归还前需要提交
+    await conn.commit()
+
+
+async def get_async_pool():
+    """惰性创建异步连接池，必须在事件循环内调用
+    """
+    global _async_pool
+    if _async_pool is None:
+        async with _async_pool_lock:
+            if _async_pool is None:
+                pool_options = settings.DATABASES[SEARCH_DB].get('OPTIONS', {}).get('pool', {})
+                pool = AsyncConnectionPool(
+                    get_conninfo(SEARCH_DB),
+                    name='search_async',
+                    min_size=pool_options.get('min_size', 4),
+                    max_size=pool_options.get('max_size', 20),
+                    timeout=pool_options.get('timeout', 10),
+                    kwargs={'row_factory': dict_row},
+                    configure=configure_connection,
+                    open=False,
+                )
+                await pool.open()
+                _async_pool = pool
+    return _async_pool
+
+
+def format_stats(stats):
+    """psycopg_pool 的统计信息，附加平均获取连接耗时
+    """
+    stats = dict(stats)
+    requests_num = stats.get('requests_num', 0)
+    stats['checkout_avg_ms'] = round(stats.get('requests_wait_ms', 0) / requests_num, 3) if requests_num else 0.0
+    return stats
+
+
+def get_pool_stats():
+    """返回当前进程内所有连接池的统计信息
+
+    - pool_size / pool_available: 当前连接数 / 空闲连接数
+    - requests_waiting: 正在等待连接的请求数
+    - requests_wait_ms / checkout_avg_ms: 等待连接的累计耗时 / 平均耗时
+    """
+    result = {}
+    for alias in settings.DATABASES:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is not None:
+            result[alias] = format_stats(pool.get_stats())
+    if _async_pool is not None:
+        result['search_async'] = format_stats(_async_pool.get_stats())
+    return result
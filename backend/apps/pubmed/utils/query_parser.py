@@ -0,0 +1,276 @@
+"""
+字段查询语法
+
+    cancer immunotherapy author:"Smith J" journal:lancet -type:review
+    (keyword:crispr OR keyword:"gene editing") year
+
+- 自由文本按 websearch_to_tsquery 的语义匹配 ts_en：支持 "短语"、OR、-排除
+- 字段条件：author/au、journal/ta、keyword/kw、type/pt，值中有空格时用双引号
+- 多个条件之间默认 AND，支持 OR、-（NOT）和括号
+- 每个字段都有对应的索引（见 FIELD_INDEXES），由 index_pubmed 命令建立：
+    - authors、keywords、journal：lower(...) 上的 pg_trgm GIN 索引，支持大小写无关的子串匹配；
+      jsonb 数组由 pubmed_array_text（迁移 0017）把各元素用分隔符连接，不会匹配 JSON 标点或跨过相邻两项
+    - pub_types：jsonb_path_ops GIN 索引，@> 精确匹配
+- 字段条件同时作用在两路召回上：词法召回直接加在文章表的 WHERE 中，
+  向量召回通过 pmid IN (SELECT pmid FROM 文章表 WHERE ...) 过滤，
+  条件选择性高时由 planner 选择先走字段索引再对少量候选精确计算距离
+"""
+import re
+import json
+
+
+# 字段名（含 PubMed 风格的缩写）到标准名
+FIELD_ALIASES = {
+    'author': 'author',
+    'au': 'author',
+    'journal': 'journal',
+    'ta': 'journal',
+    'keyword': 'keyword',
+    'kw': 'keyword',
+    'type': 'type',
+    'pt': 'type',
+}
+
+# 文章表列 -> 索引定义，partition、index_pubmed 共用
+FIELD_INDEXES = {
+    'authors': 'USING GIN (lower(pubmed_array_text(authors)) gin_trgm_ops)',
+    'keywords': 'USING GIN (lower(pubmed_array_text(keywords)) gin_trgm_ops)',
+    'journal': 'USING GIN (lower(journal) gin_trgm_ops)',
+    'pub_types': 'USING GIN (pub_types jsonb_path_ops)',
+}
+
+TEXT_SQL = "ts_en @@ websearch_to_tsquery('english', %s)"
+
+# NOT 常量
+CONSTANTS = {'TRUE': 'FALSE', 'FALSE': 'TRUE'}
+
+TOKEN_RE = re.compile(r'''
+    \s*(?:
+        (?P<rparen>\))
+        | (?P<neg>-)?(?:
+            (?P<lparen>\()
+            | (?P<field>[A-Za-z_]+):(?:"(?P<quoted>[^"]*)"|(?P<value>[^\s()"]+))
+            | (?P<text>"[^"]*"|[^\s()"]+)
+        )
+    )
+''', re.X)
+
+
+def like_pattern(value):
+    value = value.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{value}%'
+
+
+def pub_type(value):
+    """PubMed 的文献类型首字母大写（如 Randomized Controlled Trial），全小写输入时转换，其余原样匹配
+    """
+    return value.title() if value == value.lower() else value
+
+
+def field_sql(field, value):
+    """返回 (sql, params)，列名不带表别名，在文章表的上下文中使用
+    """
+    if field == 'author':
+        return 'lower(pubmed_array_text(authors)) LIKE %s', [like_pattern(value)]
+    if field == 'journal':
+        return 'lower(journal) LIKE %s', [like_pattern(value)]
+    if field == 'keyword':
+        return 'lower(pubmed_array_text(keywords)) LIKE %s', [like_pattern(value)]
+    if field == 'type':
+        return 'pub_types @> %s::jsonb', [json.dumps([pub_type(value)])]
+    raise ValueError(f'unknown field: {field}')
+
+
+def tokenize(query):
+    """返回 token 列表：('(', negated)、(')',)、('OR',)、('term', negated, node)
+    """
+    tokens, pos = [], 0
+    while pos < len(query):
+        match = TOKEN_RE.match(query, pos)
+        if match is None or match.end() == pos:
+            # 不成对的引号等无法识别的字符直接跳过
+            pos += 1
+            continue
+        pos = match.end()
+        if match['lparen']:
+            tokens.append(('(', bool(match['neg'])))
+        elif match['rparen']:
+            tokens.append((')',))
+        elif match['field'] and match['field'].lower() in FIELD_ALIASES:
+            value = match['quoted'] if match['quoted'] is not None else match['value']
+            if value.strip():
+                tokens.append(('term', bool(match['neg']), ('field', FIELD_ALIASES[match['field'].lower()], value.strip())))
+        elif match['field'] or match['text']:
+            # 未知字段按普通文本处理
+            text = match.group(0).strip().lstrip('-') if match['field'] else match['text']
+            if text == 'OR' and not match['neg']:
+                tokens.append(('OR',))
+            elif text != 'AND' and re.search(r'\w', text):
+                tokens.append(('term', bool(match['neg']), ('text', text)))
+    return tokens
+
+
+class Parser(object):
+    """递归下降：
+        expr := and ('OR' and)*
+        and  := unary+
+        unary := ['-'] '(' expr ')' | ['-'] term
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def parse(self):
+        nodes = []
+        while self.peek() is not None:
+            node = self.expr()
+            if node is not None:
+                nodes.append(node)
+            if self.peek() == (')',):
+                # 多余的右括号忽略
+                self.pos += 1
+        return combine('and', nodes)
+
+    def expr(self):
+        nodes = [self.conjunction()]
+        while self.peek() == ('OR',):
+            self.pos += 1
+            nodes.append(self.conjunction())
+        return combine('or', [node for node in nodes if node is not None])
+
+    def conjunction(self):
+        nodes = []
+        while True:
+            token = self.peek()
+            if token is None or token in ((')',), ('OR',)):
+                break
+            self.pos += 1
+            if token[0] == '(':
+                negated, node = token[1], self.expr()
+                if self.peek() == (')',):
+                    self.pos += 1
+            else:
+                _, negated, node = token
+            if node is not None and negated:
+                node = ('not', node)
+            if node is not None:
+                nodes.append(node)
+        return combine('and', nodes)
+
+
+def combine(op, nodes):
+    if not nodes:
+        return None
+    if len(nodes) == 1:
+        return nodes[0]
+    return (op, nodes)
+
+
+def compile_node(node, keep_text=True, positive=True):
+    """返回 (sql, params)
+
+    keep_text=False 时只保留字段条件，文本条件按所处位置替换为 TRUE/FALSE（NOT 下取反），
+    得到的条件是原条件的放宽，用于向量召回
+    """
+    kind = node[0]
+    if kind == 'text':
+        if keep_text:
+            return TEXT_SQL, [node[1]]
+        return ('TRUE' if positive else 'FALSE'), []
+    if kind == 'field':
+        return field_sql(node[1], node[2])
+    if kind == 'not':
+        sql, params = compile_node(node[1], keep_text, not positive)
+        if sql in CONSTANTS:
+            return CONSTANTS[sql], []
+        return f'NOT ({sql})', params
+
+    # 化简常量：AND 中去掉 TRUE、遇到 FALSE 整体为 FALSE，OR 反之
+    identity, absorbing = ('TRUE', 'FALSE') if kind == 'and' else ('FALSE', 'TRUE')
+    parts = []
+    for child in node[1]:
+        sql, params = compile_node(child, keep_text, positive)
+        if sql == absorbing:
+            return absorbing, []
+        if sql != identity:
+            parts.append((sql, params))
+    if not parts:
+        return identity, []
+    if len(parts) == 1:
+        return parts[0]
+    sql = f' {kind.upper()} '.join(f'({sql})' for sql, _ in parts)
+    return sql, [param for _, params in parts for param in params]
+
+
+def positive_text(node, negated=False):
+    """不在 NOT 下的文本，用于排序和计算查询向量
+    """
+    if node is None:
+        return []
+    kind = node[0]
+    if kind == 'text':
+        return [] if negated else [node[1]]
+    if kind == 'field':
+        return []
+    if kind == 'not':
+        return positive_text(node[1], not negated)
+    return [text for child in node[1] for text in positive_text(child, negated)]
+
+
+def has_fields(node):
+    if node is None:
+        return False
+    if node[0] == 'field':
+        return True
+    if node[0] == 'text':
+        return False
+    if node[0] == 'not':
+        return has_fields(node[1])
+    return any(has_fields(child) for child in node[1])
+
+
+class ParsedQuery(object):
+    """
+    - text: 用于 ts_rank 排序和 embedding 的自由文本，没有时两路召回只按字段条件过滤
+    - where/params: 词法召回的完整条件
+    - filter_where/filter_params: 只含字段条件，用于向量召回，没有字段条件时为 None
+    """
+
+    def __init__(self, query):
+        self.query = query or ''
+        self.tree = Parser(tokenize(self.query)).parse()
+        self.fielded = has_fields(self.tree)
+        if not self.fielded:
+            # 纯文本查询整体交给 websearch_to_tsquery，保留其 OR、-、短语语义
+            self.text = self.query.strip()
+            self.where, self.params = (TEXT_SQL, [self.text]) if self.text else (None, [])
+            self.filter_where, self.filter_params = None, []
+            return
+        self.text = ' '.join(positive_text(self.tree))
+        self.where, self.params = compile_node(self.tree)
+        self.filter_where, self.filter_params = compile_node(self.tree, keep_text=False)
+        if self.filter_where in CONSTANTS:
+            # 放宽后恒为真（如 cancer OR author:x）时向量召回不过滤
+            self.filter_where, self.filter_params = None, []
+
+    def __bool__(self):
+        return self.where is not None
+
+    def __repr__(self):
+        return f'ParsedQuery(text={self.text!r}, where={self.where!r}, params={self.params!r})'
+
+
+def parse(query):
+    return ParsedQuery(query)
+
+
+def vector_filter(parsed, table):
+    """向量召回的过滤条件 (sql, params)，没有字段条件时返回 (None, [])
+    """
+    if not parsed.filter_where:
+        return None, []
+    return f'pmid IN (SELECT pmid FROM {table} WHERE {parsed.filter_where})', list(parsed.filter_params)
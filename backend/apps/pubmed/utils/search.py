@@ -1,97 +1,268 @@
 from itertools import chain
 
+import hashlib
+
 import numpy as np
 from django.db import transaction, connection
 from django.db.models import F
 from django.core.cache import cache
-from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
-from pgvector.django import CosineDistance
+from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank, SearchHeadline
+
+from pubmed.models import PubmedArticle, PubmedArticleVector, JOURNAL_FIELDS
+from pubmed.serializers import get_fields, OPTIONAL_FIELDS
+from pubmed.utils import article_cache, query_parser, journals, single_flight, embed_batcher, ann_index
+from pubmed.utils.metrics import maybe_stage
+from pubmed.utils.ef_tuning import ef_search_scope
+from pubmed.utils.vector_index import cosine_distance
+
+
+# RRF 算法的常数，通常取 60
+RRF_K = 60
+
+EMBED_MODEL = 'text-embedding-3-small'
+EMBED_DIMENSIONS = 1536
+
+# 混合检索每一路召回的候选数量
+BM25_TOPN = 200
+VECTOR_TOPN = 200
+
+
+def get_query_vector(query, cache_timeout=24*3600, trace=None):
+    """获取查询向量，优先从 Django cache 读取
+
+    未命中时相同查询的并发请求只调用一次 embedding 接口（见 single_flight），
+    不同查询由 embed_batcher 合并为批量请求
+    """
+    cache_key = f"embed:{query}"
+    with maybe_stage(trace, 'cache_lookup'):
+        vector = cache.get(cache_key)
+    hit = vector is not None and len(vector) == EMBED_DIMENSIONS
+    if trace is not None:
+        trace.cache('embed', hit)
+    if not hit:
+        def embed():
+            vector = tuple(embed_batcher.embed_query(query, EMBED_MODEL))
+            cache.set(cache_key, vector, cache_timeout)
+            return vector
+
+        with maybe_stage(trace, 'embed'):
+            vector = single_flight.do(
+                single_flight.make_key('embed', EMBED_MODEL, query), embed, kind='embed', result_key=cache_key, trace=trace,
+            )
+    return vector
+
+
+def rrf_fuse(*ranked_lists, k=RRF_K):
+    """RRF 融合 (Reciprocal Rank Fusion)
+
+    rrf_score = sum( 1 / (rank + K) )
+
+    ranked_lists: 多个按相关性排好序的 pmid 列表
+    返回按 RRF 分数从高到低排序的 pmid 列表
+    """
+    rrf_scores = {}
+    for ranked in ranked_lists:
+        for rank, pmid in enumerate(ranked, start=1):
+            rrf_scores[pmid] = rrf_scores.get(pmid, 0) + 1.0 / (k + rank)
+    return sorted(rrf_scores.keys(), key=lambda x: rrf_scores[x], reverse=True)
+
+
+def apply_filters(base_qs, year_start=None, year_end=None, factor_min=None, factor_max=None):
+    """年份、影响因子过滤，文章表和向量表通用
+
+    影响因子在期刊表中，通过 journal_id IN (SELECT id FROM pubmed_journals WHERE ...) 过滤
+    """
+    if year_start:
+        base_qs = base_qs.filter(year__gte=int(year_start))
+    if year_end:
+        base_qs = base_qs.filter(year__lte=int(year_end))
+    if factor_min or factor_max:
+        base_qs = base_qs.filter(journal_ref__in=journals.factor_queryset(factor_min, factor_max, using=base_qs.db))
+    return base_qs
+
+
+def vector_queryset(using, filters=None):
+    """向量召回只查询向量表，year、factor 过滤条件通过冗余的 year、journal_id 作用在向量表上
+    """
+    return apply_filters(PubmedArticleVector.objects.using(using), **(filters or {}))
 
-import utils
+
+def hydrate(base_qs, pmids, fields=None, query=None, snippet=False):
+    """批量回表取展示字段 (Hydration)，返回 values() 字典并保持 pmids 的顺序
+
+    snippet: 用 ts_headline 生成 abstract 片段，需要提供 query
+    附表中的字段（abstract_cn、affiliations）只在 fields 中指定时才关联查询，期刊指标关联期刊表
+
+    可以走文章缓存时不查询数据库，此时不再应用 base_qs 上的过滤条件（pmids 已由召回阶段过滤）
+    """
+    fields = get_fields(fields)
+    if article_cache.cacheable(fields, snippet=bool(snippet and query)):
+        return article_cache.get_articles(pmids, fields, using=base_qs.db)
+    qs = base_qs.filter(pmid__in=pmids)
+    extra = {field: F(f'text__{field}') for field in fields if field in OPTIONAL_FIELDS}
+    extra.update({field: F(f'journal_ref__{field}') for field in fields if field in JOURNAL_FIELDS})
+    fields = [field for field in fields if field not in extra]
+    if snippet and query and 'abstract' in fields:
+        headline = SearchHeadline(
+            'abstract',
+            SearchQuery(query, config='english'),
+            config='english',
+            max_fragments=2,
+        )
+        qs = qs.annotate(snippet=headline)
+        fields = [f for f in fields if f != 'abstract'] + ['snippet']
+
+    # 注意：filter(pmid__in=...) 会破坏原有的排序顺序，需要手动恢复顺序
+    row_map = {row['pmid']: row for row in qs.values(*fields, **extra)}
+    return [row_map[pid] for pid in pmids if pid in row_map]
 
 
 def hybrid_search(query,
                   base_qs,
                   start=0,
                   top_k=10,
-                  bm25_topn=200,
-                  vector_topn=200,
+                  bm25_topn=BM25_TOPN,
+                  vector_topn=VECTOR_TOPN,
                   cache_timeout=24*3600,
+                  fields=None,
+                  snippet=False,
+                  filters=None,
+                  ef_search=None,
+                  trace=None,
     ):
     """
     Hybrid search: BM25 + vector search for PubmedArticle
     使用 Django cache 缓存 embeddings
-    """
+    query 支持字段查询语法（见 query_parser），字段条件同时作用在两路召回上
 
-    # RRF 算法的常数，通常取 60
-    K = 60
-
-    embeddings = utils.get_embeddings('text-embedding-3-small')
+    返回 values() 字典列表，fields 指定需要回表的字段
+    filters: 年份、影响因子过滤条件，base_qs 需已应用相同的过滤；向量召回在向量表上单独应用
+    ef_search: 向量召回使用的 hnsw.ef_search，为空时使用连接上的默认值
+    trace: 可选的 SearchTrace，记录各阶段耗时
+    """
 
-    cache_key = f"embed:{query}"
-    vector = cache.get(cache_key)
-    if vector is None or len(vector) != 1536:
-        vector = embeddings.embed_query(query)
-        cache.set(cache_key, tuple(vector), cache_timeout)
-    vector_array = np.array(vector)
+    parsed = query_parser.parse(query)
 
     # --- 1：BM25 召回 (仅取 ID 和 排名) ---
-    rank=SearchRank(F('ts_en'), SearchQuery(query, config='english'))
-    bm25_qs = base_qs.annotate(rank=rank).extra(
-        where=["ts_en @@ plainto_tsquery('english', %s)"],
-        params=[query]
-    )
-    bm25_qs = bm25_qs.filter(rank__gt=0.0).order_by('-rank')[:bm25_topn]
+    # 只有字段条件、没有自由文本时按发表日期排序
+    bm25_qs = base_qs.extra(where=[parsed.where], params=parsed.params)
+    if parsed.text:
+        rank = SearchRank(F('ts_en'), SearchQuery(parsed.text, config='english', search_type='websearch'))
+        bm25_qs = bm25_qs.annotate(rank=rank).order_by('-rank')
+        if not parsed.fielded:
+            bm25_qs = bm25_qs.filter(rank__gt=0.0)
+    else:
+        bm25_qs = bm25_qs.order_by(F('pubmed_pubdate').desc(nulls_last=True))
+    bm25_qs = bm25_qs.values_list('pmid', flat=True)[:bm25_topn]
 
     # --- 2：向量召回 (仅取 ID 和 排名) ---
-    vector_qs = (
-        base_qs.annotate(
-            distance=CosineDistance('title_abstract_vec', vector_array)
-        )
-        .order_by('distance')
-        .only('pmid')[:vector_topn]
-    )
+    # 字段条件通过子查询作用在向量表上，没有自由文本时不做向量召回
+    # VECTOR_BACKEND=mmap 时没有字段条件的查询在进程内检索（见 ann_index）
+    vector_qs = None
+    vector_list = []
+    if parsed.text:
+        vector = get_query_vector(parsed.text, cache_timeout=cache_timeout, trace=trace)
+        vector_where, vector_params = query_parser.vector_filter(parsed, PubmedArticle._meta.db_table)
+        mmap_list = None
+        if not vector_where:
+            with maybe_stage(trace, 'vector_recall'):
+                mmap_list = ann_index.search(vector, vector_topn, filters)
+        if mmap_list is not None:
+            vector_list = mmap_list
+            if trace is not None:
+                trace.set('vector_backend', 'mmap')
+        else:
+            vector_qs = vector_queryset(base_qs.db, filters)
+            if vector_where:
+                vector_qs = vector_qs.extra(where=[vector_where], params=vector_params)
+            vector_qs = (
+                vector_qs.annotate(distance=cosine_distance('title_abstract_vec', np.array(vector)))
+                .order_by('distance')
+                .values_list('pk', flat=True)[:vector_topn]
+            )
 
     # 触发查询并转换为列表
-    bm25_list = list(bm25_qs)
-    vector_list = list(vector_qs)
+    with maybe_stage(trace, 'lexical_recall'):
+        bm25_list = list(bm25_qs)
+    if vector_qs is not None:
+        with maybe_stage(trace, 'vector_recall'), ef_search_scope(base_qs.db, ef_search):
+            vector_list = list(vector_qs)
     # print(bm25_qs.explain())
     # print(vector_qs.explain())
+    if trace is not None:
+        trace.count('lexical', len(bm25_list))
+        trace.count('vector', len(vector_list))
+        trace.query('lexical', bm25_qs)
+        if vector_qs is not None:
+            trace.query('vector', vector_qs, vector={'query': parsed.text, 'model': EMBED_MODEL})
 
     # --- 3. RRF 融合 (Reciprocal Rank Fusion) ---
-    # rrf_score = sum( 1 / (rank + K) )
-    rrf_scores = {}
+    # 按 RRF 分数从高到低排序，取最终 top_k 个 PMID
+    with maybe_stage(trace, 'fusion'):
+        final_pmids = rrf_fuse(bm25_list, vector_list)[start:start+top_k]
 
-    # 处理 BM25 排名
-    for rank, obj in enumerate(bm25_list, start=1):
-        rrf_scores[obj.pmid] = rrf_scores.get(obj.pmid, 0) + 1.0 / (K + rank)
+    # --- 4. 批量回表取展示字段 (Hydration) ---
+    with maybe_stage(trace, 'hydration'):
+        return hydrate(base_qs, final_pmids, fields=fields, query=parsed.text, snippet=snippet)
 
-    # 处理向量排名
-    for rank, obj in enumerate(vector_list, start=1):
-        rrf_scores[obj.pmid] = rrf_scores.get(obj.pmid, 0) + 1.0 / (K + rank)
 
-    # 按 RRF 分数从高到低排序，取最终 top_k 个 PMID
-    final_pmids = sorted(rrf_scores.keys(), key=lambda x: rrf_scores[x], reverse=True)[start:start+top_k]
-
-    # --- 4. 批量回表取完整字段 (Hydration) ---
-    final_objs = base_qs.filter(pmid__in=final_pmids).only(
-        'pmid',
-        'title',
-        'abstract',
-        'year',
-        'pubmed_pubdate',
-        'factor',
-        'jcr',
-        'journal',
-        'pagination',
-        'volume',
-        'authors',
-        'doi',
-        'pmc',
+def mean_vector(pmids, using='default'):
+    """各文章的 title_abstract_vec 归一化后取平均，都没有向量时返回 None
+    """
+    vectors = list(
+        PubmedArticleVector.objects.using(using)
+        .filter(pk__in=pmids, title_abstract_vec__isnull=False)
+        .values_list('title_abstract_vec', flat=True)
     )
+    if not vectors:
+        return None
+    matrix = np.array(vectors, dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-8
+    return matrix.mean(axis=0)
+
+
+def similar_search(pmids,
+                   base_qs,
+                   filters=None,
+                   start=0,
+                   top_k=10,
+                   fields=None,
+                   cache_timeout=3600,
+                   ef_search=None,
+                   trace=None,
+    ):
+    """More-like-this: 使用已入库文章的 title_abstract_vec 做 kNN，不调用 embedding 接口
+
+    多个 pmid 时先对各自向量归一化再取平均，结果排除源文章
+    排名结果按 pmid 集合 + 过滤条件缓存
+    """
+    pmids = sorted(set(pmids))
+    filters = {key: value for key, value in (filters or {}).items() if value}
 
-    # 注意：filter(pmid__in=...) 会破坏 RRF 的排序顺序，需要手动恢复顺序
-    obj_map = {obj.pmid: obj for obj in final_objs}
-    results = [obj_map[pid] for pid in final_pmids if pid in obj_map]
+    key_str = f'{",".join(map(str, pmids))}|{sorted(filters.items())}|{start}|{top_k}'
+    cache_key = f'similar:{hashlib.md5(key_str.encode()).hexdigest()}'
+
+    with maybe_stage(trace, 'cache_lookup'):
+        final_pmids = cache.get(cache_key)
+    if trace is not None:
+        trace.cache('similar', final_pmids is not None)
+    if final_pmids is None:
+        vector = mean_vector(pmids, using=base_qs.db)
+        if vector is None:
+            return []
+
+        qs = (
+            vector_queryset(base_qs.db, filters)
+            .exclude(pk__in=pmids)
+            .annotate(distance=cosine_distance('title_abstract_vec', vector))
+            .order_by('distance')
+            .values_list('pk', flat=True)[start:start+top_k]
+        )
+        with maybe_stage(trace, 'vector_recall'), ef_search_scope(base_qs.db, ef_search):
+            final_pmids = list(qs)
+        if trace is not None:
+            trace.query('vector', qs, vector={'pmids': pmids})
+        cache.set(cache_key, final_pmids, cache_timeout)
 
-    return results
+    with maybe_stage(trace, 'hydration'):
+        return hydrate(base_qs, final_pmids, fields=fields)
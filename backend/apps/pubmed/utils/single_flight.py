@@ -0,0 +1,188 @@
+"""
+相同请求合并（single-flight）
+
+热门查询同时到达时，只有第一个请求调用后端（embedding 接口、召回 SQL），其余请求等待并共享结果：
+- 进程内：同一个 key 只有一个线程（或协程）执行，其余等待 threading.Event / asyncio.Future
+- 跨进程：执行者先获取 Redis 租约锁（见 locks.py），未获取到锁的进程轮询执行者写入缓存的结果，
+  结果只保留 SINGLE_FLIGHT_RESULT_TTL 秒，用于吸收同一时刻的突发请求，不是结果缓存
+- 等待超时或执行者失败时自行执行，不会因为合并而失败
+- 有等待者时执行者保存一份结果的深拷贝，每个等待者再各自拷贝，调用方可以就地修改结果（如 serialize_articles）
+- 结果计入 pubmed_single_flight_total：leader（实际执行）、local/remote（进程内/跨进程共享）、
+  fallback（等待后自行执行）
+"""
+import copy
+import time
+import asyncio
+import hashlib
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from pubmed.utils.locks import LeaseLock
+from pubmed.utils.metrics import SINGLE_FLIGHT
+
+
+ENABLED = getattr(settings, 'SINGLE_FLIGHT_ENABLED', True)
+# 等待执行者的最长秒数
+WAIT_TIMEOUT = getattr(settings, 'SINGLE_FLIGHT_WAIT', 10)
+# 执行者崩溃时锁自动释放的秒数
+LOCK_TTL = getattr(settings, 'SINGLE_FLIGHT_LOCK_TTL', 30)
+RESULT_TTL = getattr(settings, 'SINGLE_FLIGHT_RESULT_TTL', 5)
+
+POLL_INTERVAL = 0.02
+
+# 执行者失败时交给等待者的标记，等待者自行执行
+_FAILED = object()
+_MISSING = object()
+
+
+def make_key(*parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def record(kind, result, trace=None):
+    SINGLE_FLIGHT.labels(kind, result).inc()
+    if trace is not None:
+        trace.set(f'single_flight_{kind}', result)
+
+
+class Call(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = _FAILED
+        self.waiters = 0
+
+
+_lock = threading.Lock()
+_calls = {}
+
+
+def do(key, fn, kind='search', result_key=None, trace=None):
+    """执行 fn() 并返回结果，相同 key 的并发调用共享同一次执行
+
+    result_key: fn 自己会写入缓存时传入对应的缓存 key（如 embed:），跨进程等待者直接读取；
+    否则执行者把结果写入 singleflight:{key}
+    """
+    if not ENABLED:
+        return fn()
+    with _lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = Call()
+        else:
+            call.waiters += 1
+
+    if not leader:
+        if call.event.wait(WAIT_TIMEOUT) and call.result is not _FAILED:
+            record(kind, 'local', trace)
+            return copy.deepcopy(call.result)
+        record(kind, 'fallback', trace)
+        return fn()
+
+    result = _FAILED
+    try:
+        result = lead(key, fn, kind, result_key, trace)
+        return result
+    finally:
+        # 出队后不会再有新的等待者
+        with _lock:
+            _calls.pop(key, None)
+            waiters = call.waiters
+        if waiters and result is not _FAILED:
+            call.result = copy.deepcopy(result)
+        call.event.set()
+
+
+def lead(key, fn, kind, result_key=None, trace=None):
+    """进程内的执行者再通过 Redis 锁在进程之间选出一个执行者
+    """
+    lock = LeaseLock(f'singleflight:{key}', ttl=LOCK_TTL)
+    remote_key = result_key or f'singleflight:{key}'
+    if lock.acquire():
+        try:
+            result = fn()
+            if result_key is None:
+                cache.set(remote_key, result, RESULT_TTL)
+        finally:
+            lock.release()
+        record(kind, 'leader', trace)
+        return result
+
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        result = cache.get(remote_key, _MISSING)
+        if result is not _MISSING:
+            record(kind, 'remote', trace)
+            return result
+        if not lock.locked():
+            # 执行者失败，锁已释放但没有结果
+            break
+    record(kind, 'fallback', trace)
+    return fn()
+
+
+_futures = {}
+_waiters = {}
+
+
+async def ado(key, coro_fn, kind='search', result_key=None, trace=None):
+    """异步版本，coro_fn() 返回协程；进程内按事件循环合并
+    """
+    if not ENABLED:
+        return await coro_fn()
+    loop = asyncio.get_running_loop()
+    future = _futures.get((loop, key))
+    if future is not None:
+        _waiters[(loop, key)] = _waiters.get((loop, key), 0) + 1
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            result = _FAILED
+        if result is not _FAILED:
+            record(kind, 'local', trace)
+            return copy.deepcopy(result)
+        record(kind, 'fallback', trace)
+        return await coro_fn()
+
+    future = _futures[(loop, key)] = loop.create_future()
+    result = _FAILED
+    try:
+        result = await alead(key, coro_fn, kind, result_key, trace)
+        return result
+    finally:
+        _futures.pop((loop, key), None)
+        if _waiters.pop((loop, key), 0) and result is not _FAILED:
+            result = copy.deepcopy(result)
+        future.set_result(result)
+
+
+async def alead(key, coro_fn, kind, result_key=None, trace=None):
+    lock = LeaseLock(f'singleflight:{key}', ttl=LOCK_TTL)
+    remote_key = result_key or f'singleflight:{key}'
+    # Redis 调用很快，但不能阻塞事件循环，也不占用 thread_sensitive 的共享线程
+    if await sync_to_async(lock.acquire, thread_sensitive=False)():
+        try:
+            result = await coro_fn()
+            if result_key is None:
+                await cache.aset(remote_key, result, RESULT_TTL)
+        finally:
+            await sync_to_async(lock.release, thread_sensitive=False)()
+        record(kind, 'leader', trace)
+        return result
+
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(POLL_INTERVAL)
+        result = await cache.aget(remote_key, _MISSING)
+        if result is not _MISSING:
+            record(kind, 'remote', trace)
+            return result
+        if not await sync_to_async(lock.locked, thread_sensitive=False)():
+            break
+    record(kind, 'fallback', trace)
+    return await coro_fn()
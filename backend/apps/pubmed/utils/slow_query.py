@@ -0,0 +1,183 @@
+"""
+慢查询采样记录
+
+请求耗时超过 SLOW_QUERY_THRESHOLD_MS 时，按 SLOW_QUERY_SAMPLE_RATE 采样，
+交给 Celery 重新执行 EXPLAIN (ANALYZE, BUFFERS, VERBOSE)，记录执行计划和各阶段耗时，
+用于发现 HNSW 索引被悄悄换成顺序扫描之类的问题
+
+- 任务投递放在后台线程中，异步接口在事件循环上调用 SearchTrace.finish 时不会阻塞在 broker 上
+- 查询向量（1536/3072 维）不经过 broker：参数中替换为占位符，任务按 trace 记录的来源
+  （查询文本 + 模型，或 similar 的 pmid 列表）从 embedding 缓存读取或重新计算
+"""
+import os
+import json
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from loguru import logger
+
+
+VECTOR_PLACEHOLDER = '<vector>'
+
+
+def is_vector(value):
+    if isinstance(value, np.ndarray):
+        return True
+    if isinstance(value, (list, tuple)) and len(value) >= 32 and all(isinstance(v, float) for v in value[:32]):
+        return True
+    # pgvector.django 编译后的参数为 '[0.1,0.2,...]' 字符串
+    if isinstance(value, str) and len(value) > 256 and value.startswith('[') and value.endswith(']'):
+        return True
+    return False
+
+
+def to_db_param(value):
+    """向量参数转换为 pgvector 文本格式，便于在 Django cursor 中执行
+    """
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    if isinstance(value, (list, tuple)) and is_vector(value):
+        return '[' + ','.join(map(str, value)) + ']'
+    return value
+
+
+def mask_params(params):
+    """向量参数替换为哈希，避免记录几千维的向量
+    """
+    masked = []
+    for value in params:
+        if is_vector(value):
+            digest = hashlib.sha1(str(to_db_param(value)).encode()).hexdigest()[:12]
+            masked.append(f'<vector sha1:{digest}>')
+        elif isinstance(value, (list, tuple)):
+            masked.append(list(value))
+        else:
+            masked.append(value)
+    return json.loads(json.dumps(masked, default=str))
+
+
+def walk_plan(node, depth=0):
+    """遍历执行计划，返回 (depth, node) 列表
+    """
+    nodes = [(depth, node)]
+    for child in node.get('Plans', []):
+        nodes += walk_plan(child, depth + 1)
+    return nodes
+
+
+def plan_shape(plan):
+    """执行计划的结构：节点类型 + 使用的索引，用于分组统计
+
+    返回 (shape_hash, summary)
+    """
+    lines = []
+    for depth, node in walk_plan(plan['Plan']):
+        line = node['Node Type']
+        if node.get('Index Name'):
+            line += f' using {node["Index Name"]}'
+        elif node.get('Relation Name'):
+            line += f' on {node["Relation Name"]}'
+        lines.append('  ' * depth + line)
+    summary = '\n'.join(lines)
+    return hashlib.md5(summary.encode()).hexdigest(), summary
+
+
+def explain(sql, params, using='search'):
+    """执行 EXPLAIN ANALYZE，返回 JSON 格式的执行计划
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, VERBOSE, FORMAT JSON) {sql}', [to_db_param(p) for p in params])
+        result = cursor.fetchone()[0]
+    if isinstance(result, str):
+        result = json.loads(result)
+    return result[0]
+
+
+def should_capture(elapsed):
+    threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None)
+    if not threshold or elapsed * 1000 < threshold:
+        return False
+    return random.random() < getattr(settings, 'SLOW_QUERY_SAMPLE_RATE', 1.0)
+
+
+def strip_vectors(params):
+    return [VECTOR_PLACEHOLDER if is_vector(p) else to_db_param(p) for p in params]
+
+
+def resolve_vector(source, using='search'):
+    """按来源重新获取查询向量，无法获取时返回 None
+    """
+    from pubmed.utils import embed_batcher
+    from pubmed.utils.search import EMBED_MODEL, mean_vector
+
+    if not source:
+        return None
+    if 'pmids' in source:
+        return mean_vector(source['pmids'], using=using)
+    text, model = source['query'], source['model']
+    # 与 get_query_vector/aget_query_vector 使用相同的缓存 key，检索刚发生过，通常命中
+    vector = cache.get(f'embed:{text}' if model == EMBED_MODEL else f'embed:{model}:{text}')
+    if vector is None:
+        vector = embed_batcher.embed_query(text, model)
+    return vector
+
+
+def resolve_params(params, source, using='search'):
+    """把占位符替换回查询向量，无法获取向量时返回 None
+    """
+    if VECTOR_PLACEHOLDER not in params:
+        return params
+    vector = resolve_vector(source, using=using)
+    if vector is None:
+        return None
+    return [to_db_param(vector) if p == VECTOR_PLACEHOLDER else p for p in params]
+
+
+_executor_lock = threading.Lock()
+_executor = {'pid': None, 'executor': None}
+
+
+def get_executor():
+    """投递任务的后台线程，fork 后在子进程中重新创建
+    """
+    if _executor['pid'] != os.getpid():
+        with _executor_lock:
+            if _executor['pid'] != os.getpid():
+                _executor['executor'] = ThreadPoolExecutor(1, thread_name_prefix='slow-query')
+                _executor['pid'] = os.getpid()
+    return _executor['executor']
+
+
+def publish(endpoint, elapsed_ms, timings, queries):
+    from pubmed.tasks import capture_slow_query
+
+    try:
+        capture_slow_query.delay(endpoint, elapsed_ms, timings, queries)
+    except Exception as e:
+        logger.warning(f'failed to capture slow query: {e}')
+
+
+def maybe_capture(trace):
+    """由 SearchTrace.finish 调用，慢请求交给 Celery 异步 EXPLAIN
+
+    SQL 在调用方编译（QuerySet 不能跨线程使用），投递在后台线程中完成
+    """
+    if not trace.queries or not should_capture(trace.elapsed):
+        return False
+
+    queries = {}
+    for leg, query in trace.queries.items():
+        # Django QuerySet 延迟到这里才编译 SQL
+        if hasattr(query, 'query'):
+            query = query.query.get_compiler(using=query.db).as_sql()
+        sql, params = query
+        queries[leg] = (sql, strip_vectors(params), trace.vectors.get(leg))
+
+    get_executor().submit(publish, trace.endpoint, trace.elapsed * 1000, trace.to_dict()['timings_ms'], queries)
+    return True
@@ -0,0 +1,146 @@
+"""
+订阅匹配：只对新写入向量的文章打分
+
+- 订阅的查询向量在保存时计算（与混合检索相同的 text-embedding-3-small），归一化后组成 (订阅数 x 维度) 矩阵，进程内缓存
+- 新文章向量 (n x 维度) 与订阅矩阵相乘得到余弦相似度，按各订阅的阈值和 year/factor 过滤条件筛选
+- 候选再用 ts_en @@ plainto_tsquery(query) 做全文匹配检查，一条 SQL 完成
+- 计算量为 新文章数 x 订阅数，与库中文章总量无关
+"""
+import threading
+
+import numpy as np
+from django.db import connections
+from django.db.models import Count, Max
+
+from pubmed.models import PubmedArticle, PubmedArticleVector, Subscription, SubscriptionMatch
+
+
+TABLE = PubmedArticle._meta.db_table
+SUBSCRIPTION_TABLE = Subscription._meta.db_table
+
+# 订阅向量与该列处于同一向量空间
+VECTOR_FIELD = 'title_abstract_vec'
+
+FILTER_BOUNDS = {
+    'year_start': -np.inf,
+    'year_end': np.inf,
+    'factor_min': -np.inf,
+    'factor_max': np.inf,
+}
+
+_lock = threading.Lock()
+_matrix = {'version': None}
+
+
+def normalize(matrix):
+    return matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-8)
+
+
+def compute_vector(query):
+    """订阅保存时调用，复用检索的 embed: 缓存
+    """
+    from pubmed.utils.search import get_query_vector
+
+    return list(get_query_vector(query))
+
+
+def filter_value(filters, key):
+    value = (filters or {}).get(key)
+    return float(value) if value not in (None, '') else FILTER_BOUNDS[key]
+
+
+def load_matrix(using='default'):
+    """返回订阅矩阵和过滤条件，订阅数量或更新时间变化时重新加载
+    """
+    qs = Subscription.objects.using(using).filter(active=True, vector__isnull=False)
+    version = tuple(qs.aggregate(count=Count('id'), updated=Max('updated_at')).values())
+    if _matrix['version'] != version:
+        with _lock:
+            if _matrix['version'] != version:
+                rows = list(qs.values('id', 'vector', 'threshold', 'require_lexical', 'filters'))
+                _matrix.update({
+                    'ids': np.array([row['id'] for row in rows], dtype=np.int64),
+                    'vectors': normalize(np.array([row['vector'] for row in rows], dtype=np.float32)) if rows else None,
+                    'thresholds': np.array([row['threshold'] for row in rows], dtype=np.float32),
+                    'require_lexical': np.array([row['require_lexical'] for row in rows], dtype=bool),
+                    'bounds': {
+                        key: np.array([filter_value(row['filters'], key) for row in rows], dtype=np.float64)
+                        for key in FILTER_BOUNDS
+                    },
+                    'version': version,
+                })
+    return _matrix
+
+
+def load_articles(pmids, using='default'):
+    """返回 (pmids, vectors, years, factors)，没有向量的文章跳过
+    """
+    rows = list(
+        PubmedArticleVector.objects.using(using)
+        .filter(pk__in=list(pmids), **{f'{VECTOR_FIELD}__isnull': False})
+        .values_list('pk', VECTOR_FIELD, 'year', 'journal_ref__factor')
+    )
+    if not rows:
+        return [], None, None, None
+    pmids, vectors, years, factors = zip(*rows)
+    return (
+        list(pmids),
+        np.array(vectors, dtype=np.float32),
+        np.array([np.nan if y is None else y for y in years], dtype=np.float64),
+        np.array([np.nan if f is None else f for f in factors], dtype=np.float64),
+    )
+
+
+def filter_mask(bounds, years, factors):
+    """(文章数 x 订阅数) 的过滤条件掩码，没有 year/factor 的文章只匹配没有对应条件的订阅
+    """
+    years, factors = years[:, None], factors[:, None]
+    mask = np.ones((len(years), len(bounds['year_start'])), dtype=bool)
+    with np.errstate(invalid='ignore'):
+        mask &= (years >= bounds['year_start']) | np.isinf(bounds['year_start'])
+        mask &= (years <= bounds['year_end']) | np.isinf(bounds['year_end'])
+        mask &= (factors >= bounds['factor_min']) | np.isinf(bounds['factor_min'])
+        mask &= (factors <= bounds['factor_max']) | np.isinf(bounds['factor_max'])
+    return mask
+
+
+def lexical_matches(pairs, using='default'):
+    """pairs: [(subscription_id, pmid)]，返回其中全文匹配的集合
+    """
+    if not pairs:
+        return set()
+    sub_ids, pmids = zip(*pairs)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'''
+            SELECT c.sub_id, c.pmid
+            FROM unnest(%s::bigint[], %s::int[]) AS c(sub_id, pmid)
+            JOIN {SUBSCRIPTION_TABLE} s ON s.id = c.sub_id
+            JOIN {TABLE} a ON a.pmid = c.pmid
+            WHERE a.ts_en @@ plainto_tsquery('english', s.query)
+        ''', [list(sub_ids), list(pmids)])
+        return set(cursor.fetchall())
+
+
+def match_articles(pmids, using='default'):
+    """对新文章打分并写入匹配结果，返回匹配数，已存在的匹配不会重复写入
+    """
+    subs = load_matrix(using)
+    if not pmids or subs['vectors'] is None:
+        return 0
+    pmids, vectors, years, factors = load_articles(pmids, using)
+    if not pmids:
+        return 0
+
+    scores = normalize(vectors) @ subs['vectors'].T
+    mask = (scores >= subs['thresholds'][None, :]) & filter_mask(subs['bounds'], years, factors)
+    rows, cols = np.nonzero(mask)
+    candidates = [(int(subs['ids'][col]), pmids[row], float(scores[row, col]), bool(subs['require_lexical'][col])) for row, col in zip(rows, cols)]
+
+    lexical = lexical_matches([(sub_id, pmid) for sub_id, pmid, _, _ in candidates], using=using)
+    matches = [
+        SubscriptionMatch(subscription_id=sub_id, pmid=pmid, score=score, lexical=(sub_id, pmid) in lexical)
+        for sub_id, pmid, score, require_lexical in candidates
+        if not require_lexical or (sub_id, pmid) in lexical
+    ]
+    SubscriptionMatch.objects.using(using).bulk_create(matches, ignore_conflicts=True, batch_size=2000)
+    return len(matches)
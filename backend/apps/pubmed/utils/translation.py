@@ -0,0 +1,234 @@
+"""
+摘要翻译：填充 pubmed_article_texts.abstract_cn
+
+- 待翻译：有英文摘要，且没有中文摘要或英文摘要在翻译后发生了变化（source_hash 与 md5(abstract) 不一致）
+- 按英文摘要的 md5 查询 pubmed_translation_cache，命中的直接写入，重复摘要只翻译一次
+- 未命中的按 token 预算打包成批，线程池并发调用大模型，结果批量写入
+- 按 pmid 顺序逐段处理，每段处理完即写入，中断后重新运行会从未完成的文章继续
+"""
+import time
+import hashlib
+import concurrent.futures
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+import utils
+from pubmed.models import PubmedArticle, PubmedArticleText, TranslationCache
+
+
+TABLE = PubmedArticle._meta.db_table
+TEXT_TABLE = PubmedArticleText._meta.db_table
+
+# 单批请求的输入 token 预算和最多篇数，输出长度与输入相近，需要给模型的输出上限留出余量
+MAX_BATCH_TOKENS = getattr(settings, 'TRANSLATION_MAX_BATCH_TOKENS', 4000)
+MAX_BATCH_ITEMS = getattr(settings, 'TRANSLATION_MAX_BATCH_ITEMS', 16)
+CONCURRENCY = getattr(settings, 'TRANSLATION_CONCURRENCY', 4)
+
+# 已加入翻译队列的 pmid，避免接口重复排队
+QUEUED_TIMEOUT = 3600
+
+
+def content_hash(text):
+    """与 SQL 中的 md5(abstract) 一致
+    """
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：英文约 4 个字符一个 token
+    """
+    return len(text) // 4 + 1
+
+
+def pack_batches(items, max_tokens=MAX_BATCH_TOKENS, max_items=MAX_BATCH_ITEMS):
+    """items: [(content_hash, text)]，按 token 预算打包，超过预算的单篇单独成批
+    """
+    batches, batch, tokens = [], [], 0
+    for item in items:
+        n = estimate_tokens(item[1])
+        if batch and (tokens + n > max_tokens or len(batch) >= max_items):
+            batches.append(batch)
+            batch, tokens = [], 0
+        batch.append(item)
+        tokens += n
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def translate_batch(translator, batch, log=print):
+    """返回 {content_hash: translation}
+
+    模型返回数量不一致或解析失败时对半拆分重试，单篇仍失败则跳过，下次运行时重新翻译
+    """
+    try:
+        translations = translator.translate([text for _, text in batch])
+        return {key: translation for (key, _), translation in zip(batch, translations)}
+    except Exception as e:
+        if len(batch) == 1:
+            log(f'>>> translation failed for {batch[0][0]}: {e}')
+            return {}
+        middle = len(batch) // 2
+        return {**translate_batch(translator, batch[:middle], log=log), **translate_batch(translator, batch[middle:], log=log)}
+
+
+def lookup_cache(hashes, using='default'):
+    return dict(
+        TranslationCache.objects.using(using)
+        .filter(content_hash__in=list(hashes))
+        .values_list('content_hash', 'translation')
+    )
+
+
+def translate_texts(texts, translator=None, concurrency=CONCURRENCY, max_tokens=MAX_BATCH_TOKENS,
+                    max_items=MAX_BATCH_ITEMS, using='default', log=print):
+    """texts: {content_hash: text}，先查缓存，未命中的并发翻译并写入缓存
+
+    返回 {content_hash: translation}
+    """
+    result = lookup_cache(texts.keys(), using=using)
+    missing = [(key, text) for key, text in texts.items() if key not in result]
+    if not missing:
+        return result
+
+    translator = translator or utils.get_translator()
+    batches = pack_batches(missing, max_tokens=max_tokens, max_items=max_items)
+    translated = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for part in executor.map(lambda batch: translate_batch(translator, batch, log=log), batches):
+            translated.update(part)
+
+    TranslationCache.objects.using(using).bulk_create(
+        [TranslationCache(content_hash=key, translation=value, model=translator.model) for key, value in translated.items()],
+        ignore_conflicts=True,
+    )
+    log(f'>>> translated {len(translated)}/{len(missing)} texts in {len(batches)} batches')
+    result.update(translated)
+    return result
+
+
+def pending_sql(pmids=None):
+    where = '''
+        a.abstract IS NOT NULL AND a.abstract <> ''
+        AND (t.abstract_cn IS NULL OR (t.source_hash IS NOT NULL AND t.source_hash <> md5(a.abstract)))
+    '''
+    if pmids is not None:
+        where += ' AND a.pmid = ANY(%s)'
+    return f'''
+        SELECT a.pmid, a.abstract
+        FROM {TABLE} a
+        LEFT JOIN {TEXT_TABLE} t ON t.pmid = a.pmid
+        WHERE {where}
+    '''
+
+
+def select_pending(after_pmid=0, limit=500, using='default'):
+    """按 pmid 顺序取下一段待翻译的文章，返回 [(pmid, abstract)]
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(pending_sql() + ' AND a.pmid > %s ORDER BY a.pmid LIMIT %s', [after_pmid, limit])
+        return cursor.fetchall()
+
+
+def write_translations(rows, using='default'):
+    """rows: [(pmid, source_hash, translation)]，批量写入附表，已有记录只更新中文摘要
+    """
+    objs = [PubmedArticleText(article_id=pmid, source_hash=key, abstract_cn=translation) for pmid, key, translation in rows]
+    PubmedArticleText.objects.using(using).bulk_create(
+        objs,
+        update_conflicts=True,
+        unique_fields=['article'],
+        update_fields=['abstract_cn', 'source_hash'],
+        batch_size=1000,
+    )
+    return len(objs)
+
+
+def translate_rows(rows, translator=None, using='default', log=print, **kwargs):
+    """rows: [(pmid, abstract)]，翻译并写入，返回写入的篇数
+    """
+    hashes = {pmid: content_hash(abstract) for pmid, abstract in rows}
+    translations = translate_texts(
+        {hashes[pmid]: abstract for pmid, abstract in rows},
+        translator=translator,
+        using=using,
+        log=log,
+        **kwargs,
+    )
+    return write_translations(
+        [(pmid, hashes[pmid], translations[hashes[pmid]]) for pmid, _ in rows if hashes[pmid] in translations],
+        using=using,
+    )
+
+
+def run(limit=None, chunk_size=500, start_pmid=0, translator=None, using='default', log=print, **kwargs):
+    """翻译全部待翻译的文章，limit 为最多处理的篇数
+    """
+    translator = translator or utils.get_translator()
+    last_pmid, total, written = start_pmid, 0, 0
+    start = time.time()
+    while limit is None or total < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - total)
+        rows = select_pending(last_pmid, size, using=using)
+        if not rows:
+            break
+        written += translate_rows(rows, translator=translator, using=using, log=log, **kwargs)
+        total += len(rows)
+        last_pmid = rows[-1][0]
+        log(f'>>> {written}/{total} articles translated, last pmid {last_pmid}, {time.time() - start:.1f}s')
+    return written
+
+
+def translate_pmids(pmids, translator=None, using='default', log=print):
+    """翻译指定的文章，只处理仍待翻译的部分
+    """
+    try:
+        with connections[using].cursor() as cursor:
+            cursor.execute(pending_sql(pmids) + ' ORDER BY a.pmid', [list(pmids)])
+            rows = cursor.fetchall()
+        if not rows:
+            return 0
+        return translate_rows(rows, translator=translator, using=using, log=log)
+    finally:
+        cache.delete_many([f'translate:queued:{pmid}' for pmid in pmids])
+
+
+def get_translations(pmids, using='default'):
+    """接口使用：返回 ({pmid: abstract_cn}, 附表中需要写入翻译的 pmid 列表)
+
+    附表中已是最新翻译的直接返回；摘要相同的其他文章已翻译过的从缓存返回，
+    这部分仍需写入附表，交给翻译任务时不会调用大模型
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'''
+            SELECT a.pmid, md5(a.abstract), t.abstract_cn, t.source_hash
+            FROM {TABLE} a
+            LEFT JOIN {TEXT_TABLE} t ON t.pmid = a.pmid
+            WHERE a.pmid = ANY(%s) AND a.abstract IS NOT NULL AND a.abstract <> ''
+        ''', [list(pmids)])
+        rows = cursor.fetchall()
+
+    found, pending = {}, {}
+    for pmid, key, translation, source_hash in rows:
+        if translation and (source_hash is None or source_hash == key):
+            found[pmid] = translation
+        else:
+            pending[pmid] = key
+    cached = lookup_cache(set(pending.values()), using=using)
+    for pmid, key in pending.items():
+        if key in cached:
+            found[pmid] = cached[key]
+    return found, list(pending)
+
+
+def queue_translations(pmids):
+    """将未翻译的 pmid 交给 Celery，已在队列中的不重复提交
+    """
+    from pubmed.tasks import translate_articles
+
+    pmids = [pmid for pmid in pmids if cache.add(f'translate:queued:{pmid}', 1, QUEUED_TIMEOUT)]
+    if pmids:
+        translate_articles.delay(pmids)
+    return pmids
@@ -0,0 +1,336 @@
+"""
+向量索引管理
+
+- 根据 settings.VECTOR_INDEXES 在任意向量列上建立 HNSW 或 IVFFlat 索引
+- 先以临时名称 CREATE INDEX CONCURRENTLY，完成后在一个事务内删除旧索引并改名，检索不中断
+- 建索引期间从 pg_stat_progress_create_index 读取进度
+- 建索引前估算所需内存，与 maintenance_work_mem 比较
+"""
+import re
+import math
+import time
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models.functions import Cast
+from pgvector import HalfVector
+from pgvector.django import CosineDistance, HalfVectorField
+
+from pubmed.models import PubmedArticleVector
+
+
+TABLE = PubmedArticleVector._meta.db_table
+
+DEFAULT_CONFIG = {
+    'method': 'hnsw',
+    'm': 16,
+    'ef_construction': 200,
+    'lists': None,
+    'halfvec': False,
+}
+
+METHODS = ['hnsw', 'ivfflat']
+
+
+def get_config(field, **overrides):
+    """合并默认值、settings.VECTOR_INDEXES 和命令行参数
+    """
+    config = {**DEFAULT_CONFIG, **getattr(settings, 'VECTOR_INDEXES', {}).get(field, {})}
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    if config['method'] not in METHODS:
+        raise ValueError(f'unknown index method: {config["method"]}')
+    config['dimensions'] = PubmedArticleVector._meta.get_field(field).dimensions
+    return config
+
+
+def is_partitioned(using='default'):
+    from pubmed.utils.partition import is_partitioned
+    return is_partitioned(TABLE, using)
+
+
+def list_partitions(using='default'):
+    from pubmed.utils.partition import list_partitions
+    return list_partitions(TABLE, using)
+
+
+def index_name(field, method):
+    return f'{field}_{method}_idx'
+
+
+def column_sql(field, config=None):
+    """索引表达式：halfvec 索引需要在列上做类型转换
+    """
+    config = config or get_config(field)
+    if config['halfvec']:
+        return f'({field}::halfvec({config["dimensions"]}))'
+    return field
+
+
+def operator_class(config):
+    return 'halfvec_cosine_ops' if config['halfvec'] else 'vector_cosine_ops'
+
+
+def distance_sql(field):
+    """原生 SQL 的余弦距离表达式，与索引表达式一致才能使用索引
+    """
+    config = get_config(field)
+    if config['halfvec']:
+        return f'{column_sql(field, config)} <=> %s::halfvec({config["dimensions"]})'
+    return f'{field} <=> %s'
+
+
+def cosine_distance(field, vector):
+    """ORM 的余弦距离表达式，与索引表达式一致才能使用索引
+    """
+    config = get_config(field)
+    if config['halfvec']:
+        field = Cast(field, HalfVectorField(dimensions=config['dimensions']))
+        return CosineDistance(field, HalfVector(vector))
+    return CosineDistance(field, vector)
+
+
+def count_rows(field, using='default'):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM {TABLE} WHERE {field} IS NOT NULL')
+        return cursor.fetchone()[0]
+
+
+def default_lists(rows):
+    """pgvector 推荐值：100 万行以内 rows / 1000，以上 sqrt(rows)
+    """
+    if rows <= 1_000_000:
+        return max(10, rows // 1000)
+    return int(math.sqrt(rows))
+
+
+def default_probes(lists):
+    return max(1, int(math.sqrt(lists)))
+
+
+def parse_size(value):
+    """'256MB' -> 字节数
+    """
+    units = {'kb': 1024, 'mb': 1024 ** 2, 'gb': 1024 ** 3, 'tb': 1024 ** 4}
+    value = str(value).strip().lower()
+    for unit, factor in units.items():
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)]) * factor)
+    # pg_settings 中的 maintenance_work_mem 单位为 kB
+    return int(value) * 1024
+
+
+def format_size(size):
+    for unit in ['B', 'kB', 'MB', 'GB']:
+        if size < 1024:
+            return f'{size:.1f}{unit}'
+        size /= 1024
+    return f'{size:.1f}TB'
+
+
+def partition_rows(field, using='default'):
+    """每个分区的行数 [(partition, rows)]，取 pg_class.reltuples；从未 ANALYZE 的分区退回 count(*)
+    """
+    rows = []
+    for partition, _, reltuples, _ in list_partitions(using=using):
+        if reltuples < 0:
+            with connections[using].cursor() as cursor:
+                cursor.execute(f'SELECT count(*) FROM {partition} WHERE {field} IS NOT NULL')
+                reltuples = cursor.fetchone()[0]
+        rows.append((partition, int(reltuples)))
+    return rows
+
+
+def estimate_build(rows, config):
+    """单个索引（或单个分区上的索引）的构建内存、索引大小和 IVFFlat lists
+    """
+    vector_bytes = (2 if config['halfvec'] else 4) * config['dimensions'] + 8
+
+    if config['method'] == 'hnsw':
+        # 第 0 层 2m 个邻居，上层期望 m / (m - 1) 个；每个邻居一个 6 字节的 tid，另有约 64 字节元数据
+        neighbors = 2 * config['m'] + config['m'] / max(config['m'] - 1, 1)
+        element_bytes = vector_bytes + neighbors * 6 + 64
+        memory = int(rows * element_bytes)
+        return {'rows': rows, 'lists': None, 'memory': memory, 'index_size': memory}
+
+    lists = config['lists'] or default_lists(rows)
+    samples = min(rows, lists * 50)
+    return {
+        'rows': rows,
+        'lists': lists,
+        'memory': int(samples * vector_bytes + lists * vector_bytes * 2),
+        'index_size': int(rows * (vector_bytes + 16) + lists * vector_bytes),
+    }
+
+
+def estimate_memory(field, config, rows=None, using='default'):
+    """估算建索引所需内存和索引大小（字节）
+
+    - HNSW: 整个图放进 maintenance_work_mem 时构建最快，否则退化为逐条插入
+    - IVFFlat: k-means 在 lists * 50 行的样本上训练，内存主要是样本向量
+    - 分区表上逐个分区建索引：每个分区按自己的行数计算 lists，内存取最大的分区，索引大小为各分区之和
+    """
+    if rows is None and is_partitioned(using=using):
+        partitions = [(partition, estimate_build(count, config)) for partition, count in partition_rows(field, using)]
+        estimates = [estimate for _, estimate in partitions]
+        estimate = {
+            'rows': sum(e['rows'] for e in estimates),
+            'lists': max((e['lists'] for e in estimates if e['lists']), default=None),
+            'memory': max((e['memory'] for e in estimates), default=0),
+            'index_size': sum(e['index_size'] for e in estimates),
+        }
+    else:
+        partitions = []
+        estimate = estimate_build(count_rows(field, using) if rows is None else rows, config)
+
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT setting FROM pg_settings WHERE name = 'maintenance_work_mem'")
+        maintenance_work_mem = parse_size(cursor.fetchone()[0])
+
+    return {
+        **estimate,
+        'method': config['method'],
+        'partitions': partitions,
+        'maintenance_work_mem': maintenance_work_mem,
+        'fits': estimate['memory'] <= maintenance_work_mem,
+    }
+
+
+def list_vector_indexes(field, using='default'):
+    """返回该列上已有的向量索引 [(name, method, valid, size)]
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute('''
+            SELECT c.relname, am.amname, i.indisvalid, pg_relation_size(c.oid), pg_get_indexdef(c.oid)
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_am am ON am.oid = c.relam
+            WHERE i.indrelid = %s::regclass
+              AND am.amname = ANY(%s)
+        ''', [TABLE, METHODS])
+        # title_abstract_vec 是 title_abstract_vector 的前缀，按完整单词匹配
+        pattern = re.compile(rf'\b{field}\b')
+        return [row[:4] for row in cursor.fetchall() if pattern.search(row[4])]
+
+
+class ProgressMonitor(threading.Thread):
+    """在单独的连接上轮询 pg_stat_progress_create_index
+    """
+
+    def __init__(self, log, interval=10, using='default'):
+        super().__init__(daemon=True)
+        self.log = log
+        self.interval = interval
+        self.using = using
+        self.stopped = threading.Event()
+
+    def run(self):
+        connection = connections[self.using]
+        try:
+            while not self.stopped.wait(self.interval):
+                with connection.cursor() as cursor:
+                    # 分区表上按分区逐个建索引，进度记录在分区上
+                    cursor.execute('''
+                        SELECT relid::regclass::text, phase, blocks_done, blocks_total, tuples_done, tuples_total
+                        FROM pg_stat_progress_create_index
+                        WHERE relid = %s::regclass
+                           OR relid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = %s::regclass)
+                    ''', [TABLE, TABLE])
+                    for relname, phase, blocks_done, blocks_total, tuples_done, tuples_total in cursor.fetchall():
+                        progress = [relname, phase]
+                        if blocks_total:
+                            progress.append(f'blocks {blocks_done}/{blocks_total} ({blocks_done / blocks_total:.1%})')
+                        if tuples_total:
+                            progress.append(f'tuples {tuples_done}/{tuples_total} ({tuples_done / tuples_total:.1%})')
+                        self.log(' '.join(progress))
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def build_index(field, config, maintenance_work_mem=None, workers=None, progress_interval=10, log=print, using='default'):
+    """以临时名称并发建立索引，完成后替换该列上的旧向量索引
+    """
+    name = index_name(field, config['method'])
+    tmp_name = f'{name}_new'
+
+    def index_def(rows=None):
+        if config['method'] == 'hnsw':
+            with_params = {'m': int(config['m']), 'ef_construction': int(config['ef_construction'])}
+        else:
+            lists = config['lists'] or default_lists(count_rows(field, using) if rows is None else rows)
+            with_params = {'lists': int(lists)}
+            log(f'ivfflat lists={lists}, suggested ivfflat.probes={default_probes(lists)}')
+        return f'''
+            USING {config['method']} ({column_sql(field, config)} {operator_class(config)})
+            WITH ({', '.join(f'{k} = {v}' for k, v in with_params.items())})
+        '''
+
+    monitor = ProgressMonitor(log, progress_interval, using)
+    with connections[using].cursor() as cursor:
+        # 上次失败的并发建索引会留下 INVALID 索引
+        cursor.execute(f'DROP INDEX IF EXISTS {tmp_name}')
+        if maintenance_work_mem:
+            cursor.execute("SELECT set_config('maintenance_work_mem', %s, false)", [maintenance_work_mem])
+        if workers is not None:
+            cursor.execute("SELECT set_config('max_parallel_maintenance_workers', %s, false)", [str(workers)])
+
+        start = time.time()
+        monitor.start()
+        try:
+            if is_partitioned(using=using):
+                # 分区表不支持 CREATE INDEX CONCURRENTLY：先在父表上建空壳索引，再逐个分区并发建索引后挂载
+                # IVFFlat 的 lists 按各分区自己的行数计算，父表上的空壳索引只用于挂载
+                partitions = partition_rows(field, using)
+                sql = f'CREATE INDEX {tmp_name} ON ONLY {TABLE} {index_def(max((rows for _, rows in partitions), default=0))}'
+                log(f'>>> run sql: {sql}')
+                cursor.execute(sql)
+                for partition, rows in partitions:
+                    partition_index = f'{partition}_{field}_{config["method"]}_idx_new'
+                    cursor.execute(f'DROP INDEX IF EXISTS {partition_index}')
+                    log(f'>>> build index on partition {partition} ({rows} rows)')
+                    cursor.execute(f'CREATE INDEX CONCURRENTLY {partition_index} ON {partition} {index_def(rows)}')
+                    cursor.execute(f'ALTER INDEX {tmp_name} ATTACH PARTITION {partition_index}')
+            else:
+                sql = f'CREATE INDEX CONCURRENTLY {tmp_name} ON {TABLE} {index_def()}'
+                log(f'>>> run sql: {sql}')
+                cursor.execute(sql)
+        finally:
+            monitor.stop()
+            cursor.execute('RESET maintenance_work_mem')
+            cursor.execute('RESET max_parallel_maintenance_workers')
+        log(f'>>> index built in {time.time() - start:.1f}s')
+
+    swap_index(field, tmp_name, name, log=log, using=using)
+    return name
+
+
+def swap_index(field, tmp_name, name, lock_timeout='5s', log=print, using='default'):
+    """在一个事务内删除旧索引并将新索引改名，只在 DROP 时短暂持有排他锁
+    """
+    old = [row[0] for row in list_vector_indexes(field, using) if row[0] != tmp_name]
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute("SELECT set_config('lock_timeout', %s, true)", [lock_timeout])
+            for index in old:
+                cursor.execute(f'DROP INDEX {index}')
+                log(f'>>> drop index {index}')
+            # 分区上的索引随父表索引一起删除，新索引去掉 _new 后缀
+            cursor.execute('SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = %s::regclass', [tmp_name])
+            for (partition_index,) in cursor.fetchall():
+                if partition_index.endswith('_new'):
+                    cursor.execute(f'ALTER INDEX {partition_index} RENAME TO {partition_index[:-4]}')
+            cursor.execute(f'ALTER INDEX {tmp_name} RENAME TO {name}')
+    log(f'>>> index {name} ready')
+
+
+def drop_indexes(field, log=print, using='default'):
+    # 分区表上的索引不能 DROP CONCURRENTLY
+    concurrently = '' if is_partitioned(using=using) else 'CONCURRENTLY'
+    with connections[using].cursor() as cursor:
+        for name, *_ in list_vector_indexes(field, using):
+            cursor.execute(f'DROP INDEX {concurrently} IF EXISTS {name}')
+            log(f'>>> drop index {name}')
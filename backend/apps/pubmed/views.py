@@ -1,32 +1,100 @@
 import time
+import json
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.viewsets import ModelViewSet
+from rest_framework.decorators import action
 from django.db import transaction, connection
+from django.views import View
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from pubmed.models import PubmedArticle, PubmedArticleVector, Subscription
+from pubmed.serializers import get_fields, serialize_articles, ARTICLE_FIELDS, SubscriptionSerializer, SubscriptionMatchSerializer
+from pubmed.renderers import orjson_response, encode
+from pubmed.permissions import APIKeyPermission, has_api_key
+# from pubmed.utils.hybrid_search import hybrid_search
+from pubmed.utils.search import hybrid_search, hydrate, apply_filters, similar_search, vector_queryset, VECTOR_TOPN
+from pubmed.utils.ef_tuning import auto_ef_search, ef_search_scope
+from pubmed.utils.vector_index import cosine_distance
+from pubmed.utils.pool import SEARCH_DB, get_pool_stats
+from pubmed.utils.metrics import SearchTrace, export_metrics
+from pubmed.utils.async_search import hybrid_search_async, vector_search_async, fetch_articles_async
+from pubmed.utils import export, translation, subscriptions, article_cache, changes, facets, single_flight, embed_batcher
 
-from pgvector.django import CosineDistance, L2Distance
 
-from utils.llm import get_embeddings
-from pubmed.models import PubmedArticle
-from pubmed.serializers import PubmedArticleSerializer
-from pubmed.permissions import APIKeyPermission
-# from pubmed.utils.hybrid_search import hybrid_search
-from pubmed.utils.search import hybrid_search
+def parse_pmids(pmid_str):
+    """pmid_str: 逗号分隔的字符串，或 JSON 请求体中的列表
+    """
+    pmids = pmid_str if isinstance(pmid_str, (list, tuple)) else str(pmid_str).split(',')
+    return [int(pmid) for pmid in pmids if str(pmid).strip().isdigit()]
+
+
+def parse_bool(value):
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def get_hybrid_params(payload):
+    """解析混合搜索参数，同步和异步接口共用
+    """
+    params = {
+        'q': payload.get('q', ''),
+        'id': payload.get('id', ''),
+        'year_start': payload.get('year_start', None),
+        'year_end': payload.get('year_end', None),
+        'factor_min': payload.get('factor_min', None),
+        'factor_max': payload.get('factor_max', None),
+        'top_k': int(payload.get('top_k', 10)),
+        'start': int(payload.get('start', 0)),
+        'fields': payload.get('fields', None),
+        'abstract_len': int(payload.get('abstract_len', 0)) or None,
+        'snippet': parse_bool(payload.get('snippet', False)),
+        'debug': parse_bool(payload.get('debug', False)),
+    }
+
+    # top_k限制在100以内
+    if params['top_k'] > 100:
+        params['top_k'] = 100
+
+    return params
+
+
+VECTOR_TABLE = PubmedArticleVector._meta.db_table
+
+# id 模式一次最多回表的 pmid 数量，更多的 pmid 使用 export/ 流式导出
+HYBRID_SEARCH_MAX_IDS = getattr(settings, 'HYBRID_SEARCH_MAX_IDS', 1000)
+
+
+def too_many_ids(count):
+    return f'too many ids ({count} > {HYBRID_SEARCH_MAX_IDS}), use export/ for bulk downloads'
+
+
+def get_filters(params):
+    return {key: params[key] for key in ('year_start', 'year_end', 'factor_min', 'factor_max')}
+
+
+def search_key(route, params):
+    """相同结果的检索请求合并执行时使用的 key，debug 不影响结果
+    """
+    return single_flight.make_key(route, sorted((key, value) for key, value in params.items() if key != 'debug'))
 
 
 def vector_search(queryset, vector, top_k=10, threshold=None, start=0):
-    qs = queryset.annotate(distance=CosineDistance('title_abstract_vector', vector))
+    qs = queryset.annotate(distance=cosine_distance('title_abstract_vector', vector))
     if threshold is not None:
         qs = qs.filter(distance__lte=threshold)
-    qs = qs.order_by('distance')[start:start+top_k]
+    qs = qs.order_by('distance').values_list('pk', flat=True)[start:start+top_k]
     # print(qs.query)
-    return qs
+    return list(qs)
 
 
 class PubmedSearchView(APIView):
 
     __route__ = 'search'
-    embeddings = get_embeddings()
 
     permission_classes = [APIKeyPermission]
 
@@ -37,22 +105,33 @@ class PubmedSearchView(APIView):
         factor = payload.get('factor', None)
         top_k = int(payload.get('top_k', 10))
         start = int(payload.get('start', 0))
+        fields = get_fields(payload.get('fields', None))
 
         if not query.strip():
             return Response({'success': False, 'message': 'q is required!'})
 
-        vector = self.embeddings.embed_query(query)
+        trace = SearchTrace(self.__route__)
+
+        with trace.stage('embed'):
+            vector = embed_batcher.embed_query(query, 'text-embedding-3-large')
 
-        queryset = PubmedArticle.objects.all()
-        if year is not None:
-            queryset = queryset.filter(year__gte=int(year))
-        if factor is not None:
-            queryset = queryset.filter(factor__gte=float(factor))
+        filters = {'year_start': year, 'factor_min': factor}
+        ef_search = auto_ef_search(VECTOR_TABLE, start + top_k, filters, field='title_abstract_vector')
+        trace.set('ef_search', ef_search)
 
-        results = vector_search(queryset, vector, top_k=top_k, start=start)
-        data = PubmedArticleSerializer(results, many=True).data
+        with trace.stage('vector_recall'), ef_search_scope(SEARCH_DB, ef_search):
+            pmids = vector_search(vector_queryset(SEARCH_DB, filters), vector, top_k=top_k, start=start)
+        with trace.stage('hydration'):
+            results = hydrate(PubmedArticle.objects.using(SEARCH_DB), pmids, fields=fields)
+        with trace.stage('serialization'):
+            data = encode(serialize_articles(results))
+        trace.finish()
 
-        return Response({'success': True, 'query': query, 'data': data})
+        response = {'success': True, 'query': query, 'data': data}
+        if parse_bool(payload.get('debug', False)):
+            response['debug'] = trace.to_dict()
+
+        return Response(response)
 
     def get(self, request, *args, **kwargs):
         return self.search(request.query_params)
@@ -72,7 +151,7 @@ class PubmedHybridSearchView(APIView):
         """混合搜索接口
         
         支持以下参数：
-            - q: 查询字符串
+            - q: 查询字符串，支持 author:、journal:、keyword:、type: 字段查询和 OR、-、括号（见 query_parser）
             - id: pmid字符串，用逗号分隔
             - year_start: 开始年份
             - year_end: 结束年份
@@ -80,69 +159,277 @@ class PubmedHybridSearchView(APIView):
             - factor_max: 最大因子
             - top_k: 返回结果数量
             - start: 起始位置
+            - fields: 返回字段，用逗号分隔，默认返回全部
+            - abstract_len: 截断 abstract 到指定长度
+            - snippet: 返回与查询相关的 abstract 片段
         """
-        start_time = time.time()
-
-        query = payload.get('q', '')
-        pmid_str = payload.get('id', '')
-        year_start = payload.get('year_start', None)
-        year_end = payload.get('year_end', None)
-        factor_min = payload.get('factor_min', None)
-        factor_max = payload.get('factor_max', None)
-        top_k = int(payload.get('top_k', 10))
-        start = int(payload.get('start', 0))
-
-        ef_search = 100
-
-        # top_k限制在100以内
-        if top_k > 100:
-            top_k = 100
+        trace = SearchTrace(self.__route__)
+
+        params = get_hybrid_params(payload)
+        query = params['q']
+        pmid_str = params['id']
+        year_start = params['year_start']
+        year_end = params['year_end']
+        factor_min = params['factor_min']
+        factor_max = params['factor_max']
+        top_k = params['top_k']
+        start = params['start']
+        fields = get_fields(params['fields'])
 
         if not query.strip() and not pmid_str.strip():
             return Response({'success': False, 'message': 'q or id is required!'})
+
+        # search 连接池在建立连接时已设置 hnsw.ef_search 和 work_mem，无需每次 SET LOCAL
+        base_qs = PubmedArticle.objects.using(SEARCH_DB)
+
+        if pmid_str:
+            pmid_list = parse_pmids(pmid_str)
+            if len(pmid_list) > HYBRID_SEARCH_MAX_IDS:
+                return Response({'success': False, 'message': too_many_ids(len(pmid_list))})
+            with trace.stage('hydration'):
+                results = hydrate(base_qs, pmid_list, fields=fields)
+        else:
+            filters = get_filters(params)
+            base_qs = apply_filters(base_qs, **filters)
+            ef_search = auto_ef_search(VECTOR_TABLE, VECTOR_TOPN, filters)
+            trace.set('ef_search', ef_search)
+            # 同时到达的相同查询只执行一次召回
+            results = single_flight.do(
+                search_key(self.__route__, params),
+                lambda: hybrid_search(
+                    query,
+                    base_qs,
+                    top_k=top_k,
+                    start=start,
+                    fields=fields,
+                    snippet=params['snippet'],
+                    filters=filters,
+                    ef_search=ef_search,
+                    trace=trace,
+                ),
+                trace=trace,
+            )
+
+        with trace.stage('serialization'):
+            data = encode(serialize_articles(results, abstract_len=params['abstract_len']))
+
+        elapsed_time = trace.finish()
         
-        with transaction.atomic():
-            with connection.cursor() as cursor:
-                cursor.execute('SET LOCAL hnsw.ef_search=%s;', [ef_search])
-                cursor.execute('SET LOCAL work_mem = "256MB" ')
-
-                base_qs = PubmedArticle.objects.all()
-
-                if pmid_str:
-                    pmid_list = [int(pmid) for pmid in str(pmid_str).split(',') if str(pmid).strip().isdigit()]
-                    base_qs = base_qs.filter(pmid__in=pmid_list)
-                    results = base_qs.all()
-                else:
-                    if year_start:
-                        base_qs = base_qs.filter(year__gte=int(year_start))
-                    if year_end:
-                        base_qs = base_qs.filter(year__lte=int(year_end))
-                    if factor_min:
-                        base_qs = base_qs.filter(factor__gte=float(factor_min))
-                    if factor_max:
-                        base_qs = base_qs.filter(factor__lte=float(factor_max))
-                    results = hybrid_search(query, base_qs, top_k=top_k, start=start)
-
-        data = PubmedArticleSerializer(results, many=True).data
-
-        query_dict = {
-            'q': query,
-            'id': pmid_str,
-            'year_start': year_start,
-            'year_end': year_end,
-            'factor_min': factor_min,
-            'factor_max': factor_max,
-            'top_k': top_k,
-            'start': start,
+        response = {
+            'success': True,
+            'query': params,
+            'data': data,
+            'elapsed_time': f'{elapsed_time:.2f}s',
         }
+        if params['debug']:
+            response['debug'] = trace.to_dict()
 
-        elapsed_time = time.time() - start_time
-        
-        return Response({
+        return Response(response)
+
+    def get(self, request, *args, **kwargs):
+        return self.search(request.query_params)
+
+    def post(self, request, *args, **kwargs):
+        return self.search(request.data)
+
+
+class PubmedSimilarView(APIView):
+
+    __route__ = 'similar'
+
+    permission_classes = [APIKeyPermission]
+
+    def search(self, payload):
+        """相似文章接口 (More-like-this)
+
+        支持以下参数：
+            - id: pmid字符串，用逗号分隔，多个时取平均向量
+            - year_start/year_end/factor_min/factor_max: 同 hybrid_search
+            - top_k/start/fields/abstract_len: 同 hybrid_search
+        """
+        trace = SearchTrace(self.__route__)
+
+        params = get_hybrid_params(payload)
+        pmid_list = parse_pmids(params['id'])
+
+        if not pmid_list:
+            return Response({'success': False, 'message': 'id is required!'})
+
+        filters = get_filters(params)
+        ef_search = auto_ef_search(VECTOR_TABLE, params['start'] + params['top_k'], filters)
+        trace.set('ef_search', ef_search)
+        results = similar_search(
+            pmid_list,
+            PubmedArticle.objects.using(SEARCH_DB),
+            filters=filters,
+            start=params['start'],
+            top_k=params['top_k'],
+            fields=get_fields(params['fields']),
+            ef_search=ef_search,
+            trace=trace,
+        )
+
+        with trace.stage('serialization'):
+            data = encode(serialize_articles(results, abstract_len=params['abstract_len']))
+
+        elapsed_time = trace.finish()
+
+        response = {
             'success': True,
-            'query': query_dict,
+            'query': params,
             'data': data,
             'elapsed_time': f'{elapsed_time:.2f}s',
+        }
+        if params['debug']:
+            response['debug'] = trace.to_dict()
+
+        return Response(response)
+
+    def get(self, request, *args, **kwargs):
+        return self.search(request.query_params)
+
+    def post(self, request, *args, **kwargs):
+        return self.search(request.data)
+
+
+class PubmedTranslationView(APIView):
+
+    __route__ = 'translate'
+
+    permission_classes = [APIKeyPermission]
+
+    def search(self, payload):
+        """中文摘要接口：已翻译的直接返回，未翻译的加入翻译队列，稍后再次请求
+
+        支持以下参数：
+            - id: pmid字符串，用逗号分隔，最多 HYBRID_SEARCH_MAX_IDS 个
+        """
+        pmid_list = parse_pmids(payload.get('id', ''))
+        if not pmid_list:
+            return Response({'success': False, 'message': 'id is required!'})
+        if len(pmid_list) > HYBRID_SEARCH_MAX_IDS:
+            return Response({'success': False, 'message': too_many_ids(len(pmid_list))})
+
+        found, pending = translation.get_translations(pmid_list, using=SEARCH_DB)
+        translation.queue_translations(pending)
+
+        data = [
+            {'pmid': pmid, 'abstract_cn': found.get(pmid), 'status': 'done' if pmid in found else 'pending'}
+            for pmid in pmid_list
+        ]
+        return Response({'success': True, 'data': data})
+
+    def get(self, request, *args, **kwargs):
+        return self.search(request.query_params)
+
+    def post(self, request, *args, **kwargs):
+        return self.search(request.data)
+
+
+class SubscriptionViewSet(ModelViewSet):
+    """订阅管理，保存时计算查询向量
+
+    - matches/: 待推送的匹配文章，附带文章信息
+    - ack/: 标记已推送，参数 ids 为匹配记录 id 列表，为空时标记全部
+    """
+
+    __route__ = 'subscriptions'
+
+    queryset = Subscription.objects.all()
+    serializer_class = SubscriptionSerializer
+    permission_classes = [APIKeyPermission]
+
+    def perform_create(self, serializer):
+        serializer.save(vector=subscriptions.compute_vector(serializer.validated_data['query']))
+
+    def perform_update(self, serializer):
+        query = serializer.validated_data.get('query')
+        if query and query != serializer.instance.query:
+            serializer.save(vector=subscriptions.compute_vector(query))
+        else:
+            serializer.save()
+
+    @action(detail=True, methods=['get'])
+    def matches(self, request, pk=None):
+        subscription = self.get_object()
+        limit = min(int(request.query_params.get('limit', 100)), HYBRID_SEARCH_MAX_IDS)
+        qs = subscription.matches.all()
+        if not parse_bool(request.query_params.get('all', False)):
+            qs = qs.filter(delivered_at__isnull=True)
+        matches = SubscriptionMatchSerializer(qs[:limit], many=True).data
+        # 只返回文章表字段，可直接走文章缓存
+        fields = [field for field in get_fields(request.query_params.get('fields')) if field in ARTICLE_FIELDS]
+        articles = {row['pmid']: row for row in article_cache.get_articles([m['pmid'] for m in matches], fields)}
+        for match in matches:
+            match['article'] = articles.get(match['pmid'])
+        return Response({'success': True, 'data': matches})
+
+    @action(detail=True, methods=['post'])
+    def ack(self, request, pk=None):
+        subscription = self.get_object()
+        qs = subscription.matches.filter(delivered_at__isnull=True)
+        ids = request.data.get('ids')
+        if ids:
+            qs = qs.filter(id__in=ids)
+        return Response({'success': True, 'count': qs.update(delivered_at=timezone.now())})
+
+
+class PoolStatsView(APIView):
+    """数据库连接池指标：连接数、等待数、获取连接耗时
+    """
+
+    __route__ = 'pool_stats'
+
+    permission_classes = [APIKeyPermission]
+
+    def get(self, request, *args, **kwargs):
+        return Response({'success': True, 'data': get_pool_stats()})
+
+
+class PipelineStatsView(APIView):
+    """增量流水线积压和各阶段延迟
+    """
+
+    __route__ = 'pipeline_stats'
+
+    permission_classes = [APIKeyPermission]
+
+    def get(self, request, *args, **kwargs):
+        return Response({'success': True, 'data': changes.lag_stats()})
+
+
+class PubmedFacetsView(APIView):
+    """查询结果按 year、journal、jcr、pub_types 的分布
+
+    支持以下参数：
+        - q: 查询字符串，支持字段查询语法，为空时统计全部文章
+        - year_start/year_end/factor_min/factor_max: 同 hybrid_search
+        - facets: 分面，用逗号分隔，默认全部
+        - top: 每个分面返回的取值数量，默认 20，最多 100
+
+    匹配数不超过 FACET_EXACT_LIMIT 时精确计数，宽泛查询使用物化视图估算（approximate=true）
+    """
+
+    __route__ = 'facets'
+
+    permission_classes = [APIKeyPermission]
+
+    def search(self, payload):
+        start_time = time.time()
+        query = payload.get('q', '')
+        filters = {key: payload.get(key) for key in ('year_start', 'year_end', 'factor_min', 'factor_max')}
+        names = [name.strip() for name in str(payload.get('facets', '') or '').split(',') if name.strip()]
+        unknown = [name for name in names if name not in facets.FACETS]
+        if unknown:
+            return Response({'success': False, 'message': f'unknown facets: {",".join(unknown)}'})
+        top = min(int(payload.get('top', 20)), 100)
+
+        result = facets.get_facets(query, filters, facets=names or None, top=top, using=SEARCH_DB)
+        return Response({
+            'success': True,
+            'query': {'q': query, 'facets': names or facets.FACETS, 'top': top, **filters},
+            **result,
+            'elapsed_time': f'{time.time() - start_time:.2f}s',
         })
 
     def get(self, request, *args, **kwargs):
@@ -151,4 +438,190 @@ class PubmedHybridSearchView(APIView):
     def post(self, request, *args, **kwargs):
         return self.search(request.data)
 
-        
+
+class AsyncSearchView(View):
+    """异步接口基类，通过 backend/asgi.py 部署时不会阻塞 worker
+
+    Django 原生的 async view，DRF 的 APIView 不支持 async handler
+    """
+
+    async def get(self, request, *args, **kwargs):
+        if not has_api_key(request):
+            return orjson_response({'success': False, 'message': 'permission denied'}, status=403)
+        return await self.search(request.GET)
+
+    async def post(self, request, *args, **kwargs):
+        if not has_api_key(request):
+            return orjson_response({'success': False, 'message': 'permission denied'}, status=403)
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            payload = request.POST
+        return await self.search(payload)
+
+
+class PubmedAsyncSearchView(AsyncSearchView):
+
+    __route__ = 'async/search'
+
+    async def search(self, payload):
+        query = payload.get('q', '')
+        year = payload.get('year', None)
+        factor = payload.get('factor', None)
+        top_k = int(payload.get('top_k', 10))
+        start = int(payload.get('start', 0))
+
+        if not query.strip():
+            return orjson_response({'success': False, 'message': 'q is required!'})
+
+        trace = SearchTrace(self.__route__)
+
+        filters = {'year_start': year, 'factor_min': factor}
+        ef_search = await sync_to_async(auto_ef_search, thread_sensitive=False)(
+            VECTOR_TABLE, start + top_k, filters, field='title_abstract_vector',
+        )
+        trace.set('ef_search', ef_search)
+        results = await vector_search_async(
+            query,
+            filters,
+            start=start,
+            top_k=top_k,
+            fields=payload.get('fields', None),
+            ef_search=ef_search,
+            trace=trace,
+        )
+
+        with trace.stage('serialization'):
+            data = encode(serialize_articles(results))
+        trace.finish()
+
+        response = {'success': True, 'query': query, 'data': data}
+        if parse_bool(payload.get('debug', False)):
+            response['debug'] = trace.to_dict()
+
+        return orjson_response(response)
+
+
+class PubmedAsyncHybridSearchView(AsyncSearchView):
+
+    __route__ = 'async/hybrid_search'
+
+    async def search(self, payload):
+        """异步混合搜索接口，参数同 hybrid_search
+        """
+        trace = SearchTrace(self.__route__)
+
+        params = get_hybrid_params(payload)
+        query = params['q']
+        pmid_str = params['id']
+
+        if not query.strip() and not pmid_str.strip():
+            return orjson_response({'success': False, 'message': 'q or id is required!'})
+
+        if pmid_str:
+            pmid_list = parse_pmids(pmid_str)
+            if len(pmid_list) > HYBRID_SEARCH_MAX_IDS:
+                return orjson_response({'success': False, 'message': too_many_ids(len(pmid_list))})
+            with trace.stage('hydration'):
+                results = await fetch_articles_async(pmid_list, fields=params['fields'])
+        else:
+            filters = get_filters(params)
+            ef_search = await sync_to_async(auto_ef_search, thread_sensitive=False)(VECTOR_TABLE, VECTOR_TOPN, filters)
+            trace.set('ef_search', ef_search)
+            results = await single_flight.ado(
+                search_key(self.__route__, params),
+                lambda: hybrid_search_async(
+                    query,
+                    filters,
+                    top_k=params['top_k'],
+                    start=params['start'],
+                    fields=params['fields'],
+                    snippet=params['snippet'],
+                    ef_search=ef_search,
+                    trace=trace,
+                ),
+                trace=trace,
+            )
+
+        with trace.stage('serialization'):
+            data = encode(serialize_articles(results, abstract_len=params['abstract_len']))
+
+        elapsed_time = trace.finish()
+
+        response = {
+            'success': True,
+            'query': params,
+            'data': data,
+            'elapsed_time': f'{elapsed_time:.2f}s',
+        }
+        if params['debug']:
+            response['debug'] = trace.to_dict()
+
+        return orjson_response(response)
+
+
+class PubmedExportView(AsyncSearchView):
+
+    __route__ = 'export'
+
+    async def search(self, payload):
+        """流式批量导出，大量 pmid 建议 POST JSON: {"id": [...]}
+
+        支持以下参数：
+            - id: pmid 列表或逗号分隔的字符串
+            - q: 导出全部匹配的文章（全文检索，不排序）
+            - year_start/year_end/factor_min/factor_max/fields: 同 hybrid_search
+            - format: ndjson（默认）/ csv
+            - gzip: 是否 gzip 压缩
+            - limit: 最多导出条数，不超过 EXPORT_MAX_ROWS
+        """
+        params = get_hybrid_params(payload)
+        query = params['q'].strip()
+        pmid_list = parse_pmids(params['id']) if params['id'] else None
+        format = payload.get('format', 'ndjson')
+        compress = parse_bool(payload.get('gzip', False))
+
+        if not query and not pmid_list:
+            return orjson_response({'success': False, 'message': 'q or id is required!'})
+        if format not in export.FORMATS:
+            return orjson_response({'success': False, 'message': f'format must be one of {list(export.FORMATS)}'})
+
+        max_rows = getattr(settings, 'EXPORT_MAX_ROWS', 500000)
+        if pmid_list and len(pmid_list) > max_rows:
+            return orjson_response({'success': False, 'message': f'too many ids ({len(pmid_list)} > {max_rows})'})
+        limit = min(int(payload.get('limit', 0)) or max_rows, max_rows)
+
+        # 响应头发出后无法再返回错误，并发已满时直接拒绝
+        if export.get_semaphore().locked():
+            return orjson_response({'success': False, 'message': 'too many concurrent exports'}, status=429)
+
+        sql, sql_params, fields = export.build_export_query(
+            pmids=pmid_list,
+            query=query,
+            filters=get_filters(params),
+            fields=params['fields'],
+            limit=limit,
+        )
+        content = export.stream_export(
+            sql, sql_params, fields,
+            format=format,
+            compress=compress,
+            trace=SearchTrace(self.__route__),
+        )
+
+        filename = f'pubmed_export.{format}' + ('.gz' if compress else '')
+        response = StreamingHttpResponse(
+            content,
+            content_type='application/gzip' if compress else export.FORMATS[format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        # 关闭 nginx 等反向代理的响应缓冲，数据边读边发
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+def metrics(request):
+    """Prometheus 指标导出
+    """
+    content, content_type = export_metrics()
+    return HttpResponse(content, content_type=content_type)
@@ -158,20 +158,91 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # ****************************************************
 
 # 数据库配置
+# default: 入库、Celery、管理命令使用
+# search: 检索接口专用连接池，会话参数在建立连接时一次性设置
+SEARCH_SESSION_PARAMS = {
+    'hnsw.ef_search': int(os.environ.get('SEARCH_EF_SEARCH', 100)),
+    'work_mem': os.environ.get('SEARCH_WORK_MEM', '256MB'),
+    'ivfflat.probes': int(os.environ.get('SEARCH_IVFFLAT_PROBES', 10)),
+}
+
+# 向量索引配置，由 vector_index 命令使用
+# method: hnsw / ivfflat；lists 为空时按行数自动选择
+# halfvec: 超过 2000 维的向量以 halfvec 表达式建索引（pgvector 的 vector 类型索引最多 2000 维），检索时同样转换
+VECTOR_INDEXES = {
+    'title_abstract_vec': {
+        'method': os.environ.get('VECTOR_INDEX_METHOD', 'hnsw'),
+        'm': 16,
+        'ef_construction': 200,
+        'lists': None,
+    },
+    'title_abstract_vector': {
+        'method': 'hnsw',
+        'm': 16,
+        'ef_construction': 128,
+        'lists': None,
+        'halfvec': True,
+    },
+}
+
+# 向量召回后端：pgvector（默认）或 mmap（进程内检索 ann_index 导出的内存映射快照，快照不存在时仍使用 pgvector）
+# ANN_INDEX_DIR 需要是检索进程和 Celery 导出任务都能访问的目录
+VECTOR_BACKEND = os.environ.get('VECTOR_BACKEND', 'pgvector')
+ANN_INDEX_DIR = os.environ.get('ANN_INDEX_DIR', str(BASE_DIR / 'data' / 'ann_index'))
+# IVF 探测的聚类数（按过滤条件的选择度放大）；过滤后不超过 ANN_BRUTE_FORCE_LIMIT 行时精确计算
+ANN_NPROBE = int(os.environ.get('ANN_NPROBE', 16))
+ANN_BRUTE_FORCE_LIMIT = int(os.environ.get('ANN_BRUTE_FORCE_LIMIT', 50000))
+
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+DEFAULT_POOL_MIN_SIZE = int(os.environ.get('DEFAULT_POOL_MIN_SIZE', 1))
+DEFAULT_POOL_MAX_SIZE = int(os.environ.get('DEFAULT_POOL_MAX_SIZE', 8))
+SEARCH_POOL_MIN_SIZE = int(os.environ.get('SEARCH_POOL_MIN_SIZE', 4))
+SEARCH_POOL_MAX_SIZE = int(os.environ.get('SEARCH_POOL_MAX_SIZE', 20))
+
 if POSTGRES_DB:
+    DATABASE_BASE = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': POSTGRES_DB,
+        'USER': POSTGRES_USER,
+        'PASSWORD': POSTGRES_PASSWORD,
+        'HOST': POSTGRES_HOST,
+        'PORT': POSTGRES_PORT,
+        # 使用连接池时 CONN_MAX_AGE 必须为 0，连接由池管理
+        'CONN_MAX_AGE': 0,
+        'CONN_HEALTH_CHECKS': False,
+    }
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.postgresql',
-            'NAME': POSTGRES_DB,
-            'USER': POSTGRES_USER,
-            'PASSWORD': POSTGRES_PASSWORD,
-            'HOST': POSTGRES_HOST,
-            'PORT': POSTGRES_PORT,
-            'CONN_MAX_AGE': 0,
-            'CONN_HEALTH_CHECKS': False,
-        }
+            **DATABASE_BASE,
+            'OPTIONS': {
+                'pool': {
+                    'name': 'default',
+                    'min_size': DEFAULT_POOL_MIN_SIZE,
+                    'max_size': DEFAULT_POOL_MAX_SIZE,
+                    'timeout': DB_POOL_TIMEOUT,
+                },
+            },
+        },
+        'search': {
+            **DATABASE_BASE,
+            'OPTIONS': {
+                'options': ' '.join(f'-c {key}={value}' for key, value in SEARCH_SESSION_PARAMS.items()),
+                'pool': {
+                    'name': 'search',
+                    'min_size': SEARCH_POOL_MIN_SIZE,
+                    'max_size': SEARCH_POOL_MAX_SIZE,
+                    'timeout': DB_POOL_TIMEOUT,
+                },
+            },
+            'TEST': {
+                'MIRROR': 'default',
+            },
+        },
     }
 
+# 未配置 PostgreSQL 时，search 直接复用 default
+DATABASES.setdefault('search', {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}})
+
 # ================
 # 应用配置
 # ================
@@ -196,6 +267,8 @@ CELERY_TASK_SERIALIZER = 'pickle'
 CELERY_RESULT_SERIALIZER = 'pickle'
 
 CELERY_WORKER_CONCURRENCY = 4
+# 入库任务耗时长且 acks_late，每个 worker 进程只预取一个任务，文件均匀分布到各 worker
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
 
 DJANGO_CELERY_BEAT_TZ_AWARE = False
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
@@ -205,9 +278,90 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'pubmed.tasks.update_pubmed',
         # 'schedule': crontab(minute=0, hour=0),
         'schedule': crontab('*/20'),
-    }
+    },
+    'process_changes': {
+        'task': 'pubmed.tasks.process_changes',
+        'schedule': crontab('*/5'),
+    },
+    'maintain_partitions': {
+        'task': 'pubmed.tasks.maintain_partitions',
+        'schedule': crontab(minute=30, hour=3),
+    },
+    # VECTOR_BACKEND 不是 mmap 时直接返回
+    'export_ann_index': {
+        'task': 'pubmed.tasks.export_ann_index',
+        'schedule': crontab(minute=0, hour=4),
+    },
 }
 
+# 增量入库：按 pmid 分为 PUBMED_UPDATE_SHARDS 个任务，各自按文件名顺序处理全部匹配的文件；
+# 租约锁的有效期需长于一轮入库的耗时，进程崩溃时到期自动释放
+PUBMED_UPDATE_FILES = os.environ.get('PUBMED_UPDATE_FILES', '/work/data/pubmed/work/data/2025/updatefiles/*.xml.gz')
+PUBMED_UPDATE_LEASE = int(os.environ.get('PUBMED_UPDATE_LEASE', 6 * 60 * 60))
+PUBMED_UPDATE_SHARDS = int(os.environ.get('PUBMED_UPDATE_SHARDS', CELERY_WORKER_CONCURRENCY))
+
+# 增量流水线：每批处理的变化记录数；自上次 ANALYZE 以来修改的行数占比超过阈值时才 ANALYZE
+CHANGE_PIPELINE_BATCH_SIZE = int(os.environ.get('CHANGE_PIPELINE_BATCH_SIZE', 500))
+CHANGE_ANALYZE_THRESHOLD = float(os.environ.get('CHANGE_ANALYZE_THRESHOLD', 0.02))
+
+# 分面统计：全文匹配数不超过该值时精确计数，否则使用物化视图估算；结果缓存秒数
+FACET_EXACT_LIMIT = int(os.environ.get('FACET_EXACT_LIMIT', 20000))
+FACET_CACHE_TIMEOUT = int(os.environ.get('FACET_CACHE_TIMEOUT', 600))
+
+# 期刊指标（factor、jcr、zky）在各进程内缓存的秒数，journal_metrics 更新后其他进程在该时间内生效
+JOURNAL_METRICS_TTL = int(os.environ.get('JOURNAL_METRICS_TTL', 600))
+
+# 文章保留年限，按年份分区后超出的分区整体删除
+PUBMED_RETENTION_YEARS = int(os.environ.get('PUBMED_RETENTION_YEARS', 5))
+
+# DRF 配置
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'pubmed.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# ef_search 自动选择：根据 tune_ef_search 的测量结果选择满足目标召回率的最小 ef_search
+EF_SEARCH_AUTOTUNE = os.environ.get('EF_SEARCH_AUTOTUNE', 'True') == 'True'
+EF_SEARCH_TARGET_RECALL = float(os.environ.get('EF_SEARCH_TARGET_RECALL', 0.95))
+
+# 批量导出：hybrid_search 的 id 模式超过 HYBRID_SEARCH_MAX_IDS 时拒绝，改用 export/ 流式导出
+HYBRID_SEARCH_MAX_IDS = int(os.environ.get('HYBRID_SEARCH_MAX_IDS', 1000))
+EXPORT_MAX_ROWS = int(os.environ.get('EXPORT_MAX_ROWS', 500000))
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+EXPORT_MAX_CONCURRENCY = int(os.environ.get('EXPORT_MAX_CONCURRENCY', 4))
+
+# 文章缓存：进程内 LRU + Redis，入库更新时删除 Redis 中的缓存，LRU 依靠 TTL 过期
+ARTICLE_CACHE_ENABLED = os.environ.get('ARTICLE_CACHE_ENABLED', 'True') == 'True'
+ARTICLE_CACHE_TIMEOUT = int(os.environ.get('ARTICLE_CACHE_TIMEOUT', 7 * 24 * 3600))
+ARTICLE_CACHE_LRU_SIZE = int(os.environ.get('ARTICLE_CACHE_LRU_SIZE', 10000))
+ARTICLE_CACHE_LRU_TTL = int(os.environ.get('ARTICLE_CACHE_LRU_TTL', 60))
+
+# 相同请求合并：并发的相同查询只调用一次 embedding 和召回，其余请求等待 SINGLE_FLIGHT_WAIT 秒共享结果
+SINGLE_FLIGHT_ENABLED = os.environ.get('SINGLE_FLIGHT_ENABLED', 'True') == 'True'
+SINGLE_FLIGHT_WAIT = float(os.environ.get('SINGLE_FLIGHT_WAIT', 10))
+SINGLE_FLIGHT_LOCK_TTL = int(os.environ.get('SINGLE_FLIGHT_LOCK_TTL', 30))
+SINGLE_FLIGHT_RESULT_TTL = int(os.environ.get('SINGLE_FLIGHT_RESULT_TTL', 5))
+
+# 查询 embedding 微批处理：收到第一条后最多等待 EMBED_BATCH_MAX_DELAY_MS 毫秒，合并为一次批量请求
+EMBED_BATCH_ENABLED = os.environ.get('EMBED_BATCH_ENABLED', 'True') == 'True'
+EMBED_BATCH_MAX_SIZE = int(os.environ.get('EMBED_BATCH_MAX_SIZE', 64))
+EMBED_BATCH_MAX_DELAY_MS = float(os.environ.get('EMBED_BATCH_MAX_DELAY_MS', 5))
+EMBED_BATCH_CONCURRENCY = int(os.environ.get('EMBED_BATCH_CONCURRENCY', 4))
+# 等待批次结果的最长秒数
+EMBED_BATCH_TIMEOUT = float(os.environ.get('EMBED_BATCH_TIMEOUT', 60))
+
+# 摘要翻译：TRANSLATION_PROVIDER=fake 时使用本地假翻译，不调用大模型
+TRANSLATION_MAX_BATCH_TOKENS = int(os.environ.get('TRANSLATION_MAX_BATCH_TOKENS', 4000))
+TRANSLATION_MAX_BATCH_ITEMS = int(os.environ.get('TRANSLATION_MAX_BATCH_ITEMS', 16))
+TRANSLATION_CONCURRENCY = int(os.environ.get('TRANSLATION_CONCURRENCY', 4))
+
+# 慢查询采样
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 1000))
+SLOW_QUERY_SAMPLE_RATE = float(os.environ.get('SLOW_QUERY_SAMPLE_RATE', 0.1))
+SLOW_QUERY_MAX_ROWS = int(os.environ.get('SLOW_QUERY_MAX_ROWS', 10000))
+
 # PUBMED API KEY配置
 PUBMED_API_KEY = os.environ.get('PUBMED_API_KEY')
 
@@ -222,4 +376,12 @@ CACHES = {
     }
 }
 
+# 离线运行基准测试等场景可设置 DJANGO_CACHE=locmem，不依赖 Redis
+if os.environ.get('DJANGO_CACHE') == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
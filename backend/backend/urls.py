@@ -17,7 +17,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from pubmed.views import metrics
+
 urlpatterns = [
     path("admin/", admin.site.urls),
-    path("pubmed_api/", include("pubmed.urls"))
+    path("pubmed_api/", include("pubmed.urls")),
+    path("metrics", metrics, name="metrics"),
 ]
@@ -1,7 +1,198 @@
-from langchain_openai import AzureOpenAIEmbeddings
+import os
+import re
+import json
+import asyncio
+import hashlib
+import threading
+import weakref
+from functools import lru_cache
+
+import httpx
+import numpy as np
+from langchain_openai import AzureOpenAIEmbeddings, AzureChatOpenAI
+
+
+MODEL_DIMENSIONS = {
+    'text-embedding-3-large': 3072,
+    'text-embedding-3-small': 1536,
+}
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall((text or '').lower())
+
+
+@lru_cache(maxsize=200000)
+def token_vector(token, dimensions):
+    """每个词对应一个固定的随机向量，由词的 md5 决定
+    """
+    seed = int.from_bytes(hashlib.md5(token.encode()).digest()[:8], 'little')
+    return np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+
+
+class FakeEmbeddings(object):
+    """离线测试用的确定性 embedding，不需要调用 Azure
+
+    词向量求和后归一化：相同文本得到相同向量，词重叠越多越相似
+    设置环境变量 EMBEDDING_PROVIDER=fake 启用
+    """
+
+    def __init__(self, model='text-embedding-3-large'):
+        self.model = model
+        self.dimensions = MODEL_DIMENSIONS.get(model, 1536)
+
+    def embed_query(self, text):
+        tokens = tokenize(text) or ['']
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for token in tokens:
+            vector += token_vector(token, self.dimensions)
+        return (vector / (np.linalg.norm(vector) + 1e-8)).tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+
+# embedding 请求的 HTTP 连接池：最大连接数、空闲连接保持秒数、请求超时秒数
+EMBEDDING_HTTP_MAX_CONNECTIONS = int(os.environ.get('EMBEDDING_HTTP_MAX_CONNECTIONS', 20))
+EMBEDDING_HTTP_KEEPALIVE = float(os.environ.get('EMBEDDING_HTTP_KEEPALIVE', 60))
+EMBEDDING_HTTP_TIMEOUT = float(os.environ.get('EMBEDDING_HTTP_TIMEOUT', 30))
+
+
+def http_limits():
+    return httpx.Limits(
+        max_connections=EMBEDDING_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=EMBEDDING_HTTP_MAX_CONNECTIONS,
+        keepalive_expiry=EMBEDDING_HTTP_KEEPALIVE,
+    )
+
+
+def create_embeddings(model='text-embedding-3-large', http_client=None, http_async_client=None):
+    """新建 embedding 客户端，一般通过 get_embeddings 取进程内共享的实例
+    """
+    if os.environ.get('EMBEDDING_PROVIDER', 'azure') == 'fake':
+        return FakeEmbeddings(model=model)
+    return AzureOpenAIEmbeddings(model=model, http_client=http_client, http_async_client=http_async_client)
+
+
+class EmbeddingRegistry(object):
+    """进程内共享的 embedding 客户端，按模型首次使用时创建
+
+    - 所有模型共用一个 httpx.Client 连接池（keep-alive），请求之间不再重复 TLS 握手和客户端初始化
+    - httpx.AsyncClient 的连接绑定在创建它的事件循环上，因此在事件循环中取得的客户端按循环分别创建，
+      循环结束后随之释放（如 asyncio.run 多次调用的管理命令）
+    - fork 后（Celery prefork、gunicorn --preload）子进程丢弃继承的客户端和连接，首次使用时重新创建，
+      不关闭父进程的连接
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.http_client = None
+        self.clients = {}
+        self.loop_clients = weakref.WeakKeyDictionary()
+
+    def get(self, model):
+        if self.pid != os.getpid():
+            self.reset()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        clients = self.clients if loop is None else self.loop_clients.get(loop, {})
+        client = clients.get(model)
+        if client is not None:
+            return client
+        with self.lock:
+            if loop is None:
+                clients = self.clients
+            else:
+                clients = self.loop_clients.setdefault(loop, {})
+            if model not in clients:
+                if self.http_client is None:
+                    self.http_client = httpx.Client(limits=http_limits(), timeout=EMBEDDING_HTTP_TIMEOUT)
+                http_async_client = None
+                if loop is not None:
+                    http_async_client = httpx.AsyncClient(limits=http_limits(), timeout=EMBEDDING_HTTP_TIMEOUT)
+                clients[model] = create_embeddings(model, self.http_client, http_async_client)
+            return clients[model]
+
+    def close(self):
+        """关闭同步连接池，异步连接池随事件循环释放
+        """
+        with self.lock:
+            if self.http_client is not None:
+                self.http_client.close()
+            self.http_client = None
+            self.clients = {}
+            self.loop_clients = weakref.WeakKeyDictionary()
+
+
+_embeddings = EmbeddingRegistry()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_embeddings.reset)
 
 
 def get_embeddings(model='text-embedding-3-large'):
-    return AzureOpenAIEmbeddings(model=model)
+    """进程内共享、线程安全的 embedding 客户端
+    """
+    return _embeddings.get(model)
+
+
+TRANSLATE_PROMPT = (
+    'Translate each of the following PubMed abstracts into Simplified Chinese. '
+    'Keep gene names, drug names, abbreviations and numbers unchanged. '
+    'The input is a JSON array of strings; reply with a JSON array of the translations '
+    'in the same order and nothing else.'
+)
+
+
+class FakeTranslator(object):
+    """离线测试用的翻译，不调用大模型，设置环境变量 TRANSLATION_PROVIDER=fake 启用
+    """
+
+    model = 'fake'
+
+    def translate(self, texts):
+        return [f'[译] {text}' for text in texts]
+
+
+class LLMTranslator(object):
+    """批量翻译：一次请求翻译多篇摘要，返回数量不一致时抛出 ValueError
+    """
+
+    def __init__(self, model='gpt-4o-mini'):
+        self.model = model
+        self.llm = AzureChatOpenAI(azure_deployment=model, temperature=0)
+
+    def translate(self, texts):
+        message = self.llm.invoke([
+            ('system', TRANSLATE_PROMPT),
+            ('human', json.dumps(texts, ensure_ascii=False)),
+        ])
+        content = message.content.strip()
+        # 去掉模型可能附带的 ```json 代码块标记
+        content = re.sub(r'^```(?:json)?\s*|\s*```$', '', content)
+        result = json.loads(content)
+        if not isinstance(result, list) or len(result) != len(texts):
+            raise ValueError(f'expected {len(texts)} translations, got {len(result) if isinstance(result, list) else type(result)}')
+        return [str(text) for text in result]
 
 
+def get_translator(model=None):
+    model = model or os.environ.get('TRANSLATION_MODEL', 'gpt-4o-mini')
+    if os.environ.get('TRANSLATION_PROVIDER', 'azure') == 'fake':
+        return FakeTranslator()
+    return LLMTranslator(model=model)